@@ -0,0 +1,189 @@
+"""
+Parallel and resumable runner of ring pair efficiency maps.
+
+Every worker process builds one `RingEfficiencyMap` graph whose lors are
+fed through placeholders, so the graph and the session are reused by all
+the ring pairs of the worker. Lors of a ring pair are fed in chunks of
+`algorithm.effmap_chunk_size` lors, which bounds the memory of big
+scanners. Finished pairs are appended to a manifest, an interrupted job
+skips them when it is started again.
+"""
+import multiprocessing
+import os
+
+import numpy as np
+import tensorflow as tf
+from dxl.learn.session import Session
+from tqdm import tqdm
+
+from srf.data import ListModeDataWithoutTOF, ListModeDataSplitWithoutTOF
+from srf.function import make_scanner
+from srf.data import ScannerClass
+from srf.graph.reconstruction import RingEfficiencyMap
+from srf.model import BackProjectionOrdinary
+from srf.physics import SplitLoRsModel
+from srf.preprocess.function.on_tor_lors import map_process, Axis
+
+__all__ = ['Manifest', 'EffmapRunner']
+
+DEFAULT_MANIFEST = 'effmap_manifest.txt'
+
+
+class Manifest:
+    """
+    Append-only record of the finished output files of an effmap job.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._finished = set()
+        if os.path.exists(path):
+            with open(path, 'r') as fin:
+                self._finished = {l.strip() for l in fin if l.strip()}
+
+    def __contains__(self, filename):
+        return filename in self._finished
+
+    def add(self, filename):
+        with open(self.path, 'a') as fout:
+            fout.write(filename + '\n')
+            fout.flush()
+            os.fsync(fout.fileno())
+        self._finished.add(filename)
+
+
+class _MapWorker:
+    """
+    One warm graph and session of a worker process.
+    """
+
+    def __init__(self, task_config):
+        from .srfapp_new import get_config
+        grid, center, size, model, _, _ = get_config(task_config)
+        self.scanner = make_scanner(ScannerClass.CylinderPET, task_config['scanner']['petscanner'])
+        self.chunk_size = task_config['algorithm'].get('effmap_chunk_size')
+        self.is_split = isinstance(model, SplitLoRsModel)
+        if self.is_split:
+            self.lors = {a: tf.placeholder(tf.float32, [None, 7], name=f'lors_{a.name}') for a in Axis}
+            self.values = {a: tf.placeholder(tf.float32, [None, 1], name=f'lors_value_{a.name}')
+                           for a in Axis}
+            projection_data = ListModeDataSplitWithoutTOF(
+                *[ListModeDataWithoutTOF(self.lors[a], self.values[a]) for a in Axis])
+        else:
+            self.lors = tf.placeholder(tf.float32, [None, 6], name='lors')
+            self.values = tf.placeholder(tf.float32, [None, 1], name='values')
+            projection_data = ListModeDataWithoutTOF(self.lors, self.values)
+        self.graph = RingEfficiencyMap('effmap', BackProjectionOrdinary(model), projection_data,
+                                       grid=grid, center=center, size=size)
+        self.graph.make()
+        self.session = Session()
+
+    def feeds(self, lors):
+        if self.is_split:
+            lors = map_process(lors)
+            feeds = {self.lors[a]: lors[a] for a in Axis}
+            feeds.update({self.values[a]: np.ones([lors[a].shape[0], 1], np.float32) for a in Axis})
+            return feeds
+        return {self.lors: lors, self.values: np.ones([lors.shape[0], 1], np.float32)}
+
+    def compute(self, ir1, ir2):
+        # the map is linear in lors, chunks of a big ring pair are summed up.
+        result = None
+        for lors in self.scanner.lor_chunks([(ir1, ir2)], chunk_size=self.chunk_size):
+            value = self.graph.run(self.session, self.feeds(lors.astype(np.float32)))
+            result = value if result is None else result + value
+        return result
+
+    def run(self, ir1, ir2, filename):
+        result = self.compute(ir1, ir2)
+        # write then rename, a file recorded in the manifest is always complete.
+        np.save(filename + '.tmp.npy', result)
+        os.replace(filename + '.tmp.npy', filename)
+        return filename
+
+    def close(self):
+        self.session.reset()
+
+
+_WORKER = None
+
+
+def _init_worker(task_config):
+    global _WORKER
+    _WORKER = _MapWorker(task_config)
+
+
+def _run_pair(job):
+    return _WORKER.run(*job)
+
+
+def _compute_pair(pair):
+    return pair, _WORKER.compute(*pair)
+
+
+class EffmapRunner:
+    """
+    Compute the effmaps of ring pairs on a pool of `nb_workers` processes.
+
+    Args:
+        task_config: the map task configuration.
+        nb_workers: number of worker processes, the maps are computed in
+            this process when it is 1.
+        path: root directory of the output files and the manifest.
+        manifest: filename of the manifest under `path`.
+    """
+
+    def __init__(self, task_config, nb_workers=None, path='./', manifest=None):
+        if nb_workers is None:
+            nb_workers = 1
+        if manifest is None:
+            manifest = DEFAULT_MANIFEST
+        self.task_config = task_config
+        self.nb_workers = nb_workers
+        self.path = path
+        self.manifest = Manifest(os.path.join(path, manifest))
+
+    def run(self, ring_pairs, file_format='effmap/effmap_{}_{}.npy'):
+        """ Compute the effmap of every (ir1, ir2) in ring_pairs and save it to
+        `file_format.format(ir1, ir2)`, pairs in the manifest are skipped.
+        """
+        jobs = []
+        for ir1, ir2 in ring_pairs:
+            filename = os.path.normpath(file_format.format(ir1, ir2))
+            if filename not in self.manifest:
+                jobs.append((ir1, ir2, os.path.join(self.path, filename)))
+        for _, _, filename in jobs:
+            os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        if not jobs:
+            return
+        if self.nb_workers == 1:
+            worker = _MapWorker(self.task_config)
+            self._record((worker.run(*job) for job in jobs), len(jobs))
+            worker.close()
+        else:
+            # spawn, since forked processes can not reuse the TensorFlow runtime of the parent
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(self.nb_workers, initializer=_init_worker,
+                              initargs=(self.task_config,)) as pool:
+                self._record(pool.imap_unordered(_run_pair, jobs), len(jobs))
+
+    def compute(self, ring_pairs):
+        """ Yield ((ir1, ir2), effmap) of ring_pairs without writing files, e.g.
+        to be merged directly by `srf.preprocess.merge_map`.
+        Results of a pool are yielded in the order of completion.
+        """
+        ring_pairs = list(ring_pairs)
+        if self.nb_workers == 1:
+            worker = _MapWorker(self.task_config)
+            for pair in ring_pairs:
+                yield tuple(pair), worker.compute(*pair)
+            worker.close()
+        else:
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(self.nb_workers, initializer=_init_worker,
+                              initargs=(self.task_config,)) as pool:
+                yield from pool.imap_unordered(_compute_pair, [tuple(p) for p in ring_pairs])
+
+    def _record(self, finished, nb_jobs):
+        for filename in tqdm(finished, total=nb_jobs):
+            self.manifest.add(os.path.relpath(filename, self.path))
@@ -1,20 +1,25 @@
+import os
+
 import numpy as np
 from dxl.learn.session import Session
-from tqdm import tqdm
 
 from srf.data import (ScannerClass, MasterLoader, CompleteWorkerLoader, SplitWorkerLoader,
                       ListModeDataWithoutTOF, ListModeDataSplitWithoutTOF)
 from srf.data import siddonSinogramLoader
-from srf.function import make_scanner, create_listmode_data
+from srf.function import make_scanner
 from srf.graph.reconstruction import MasterGraph, WorkerGraph
-from srf.graph.reconstruction import RingEfficiencyMap, LocalReconstructionGraph
+from srf.graph.reconstruction import LocalReconstructionGraph
 from srf.model import BackProjectionOrdinary, ProjectionOrdinary, mlem_update, mlem_update_normal, ReconStep, PSFReconStep
-from srf.physics import CompleteLoRsModel, SplitLoRsModel, CompleteSinoModel
+from srf.model.psf import make_psf_operator
+from srf.io.psf import load_psf
+from srf.physics import (CompleteLoRsModel, SplitLoRsModel, CompleteSinoModel, SparseMatrixModel,
+                         build_system_matrix, system_matrix_identity, system_matrix_key)
+from srf.physics.sparse_matrix import META_FILE
 # from dxl.learn.core.config import dlcc
 # from dxl.learn.distribute import make_distribution_session
-from srf.preprocess.function.on_tor_lors import map_process
 from srf.preprocess.function.generate_psf_kernel import PSFMaker
-from srf.preprocess.merge_map import merge_effmap, merge_effmap_full
+from srf.preprocess.merge_map import merge_effmap, merge_effmap_full, merge_effmap_ring_difference
+from .map_runner import EffmapRunner
 from srf.scanner.pet.spec import make_correction
 
 
@@ -84,7 +89,10 @@ class SRFApp():
 
         if ('siddon' in al_config):
             model = CompleteLoRsModel(
-                'model', tof_bin=tof_bin, tof_sigma2=tof_sigma2)
+                'model', tof_bin=tof_bin, tof_sigma2=tof_sigma2,
+                backend=al_config['siddon'].get('backend'),
+                nb_workers=al_config['siddon'].get('nb_workers'),
+                pool=al_config['siddon'].get('pool'))
             worker_loader = CompleteWorkerLoader(task_config['input']['listmode']['path_file'],
                                                  task_config['output']['image']['map_file']['path_file'],
                                                  self._scanner,
@@ -99,20 +107,31 @@ class SRFApp():
         else:
             model = SplitLoRsModel(
                 al_config['tor']['kernel_width'], al_config['tor']['geometry_sigma2_correction'],
-                tof_bin=tof_bin, tof_sigma2=tof_sigma2)
+                tof_bin=tof_bin, tof_sigma2=tof_sigma2, backend=al_config['tor'].get('backend'),
+                nb_workers=al_config['tor'].get('nb_workers'), pool=al_config['tor'].get('pool'))
             worker_loader = SplitWorkerLoader(task_config['input']['listmode']['path_file'],
                                               task_config['output']['image']['map_file']['path_file'],
                                               self._scanner,
                                               im_config,
-                                              correction)
+                                              correction,
+                                              cache_dir=task_config['input']['listmode'].get('cache_dir'))
+        if al_config.get('system_matrix') is not None:
+            model = _make_sparse_matrix_model(model, worker_loader, al_config['system_matrix'], im_config)
         master_loader = MasterLoader(self._scanner, im_config)
 
         # decide if use PSF correction
         if correction.psf is not None:
+            psf = None
+            if correction.psf.operator != 'sparse':
+                psf = make_psf_operator(correction.psf.operator,
+                                        *load_psf(correction.psf.xy, correction.psf.z),
+                                        im_config['grid'], im_config['center'], im_config['size'],
+                                        nb_zones=correction.psf.nb_zones)
             recon_step = PSFReconStep('worker/recon',
                                       ProjectionOrdinary(model),
                                       BackProjectionOrdinary(model),
-                                      mlem_update)
+                                      mlem_update,
+                                      psf=psf)
         else:
             recon_step = ReconStep('worker/recon',
                                    ProjectionOrdinary(model),
@@ -139,49 +158,22 @@ class SRFApp():
     def _make_map_task(self, task_index, task_config):
         grid, center, size, model, map_file, listmodedata = get_config(
             task_config)
+        runner = EffmapRunner(task_config, task_config['algorithm'].get('effmap_nb_workers'))
+        nb_rings = self._scanner.nb_rings
         # if task_config['output']['image']['grid'][2] == self._scanner.nb_rings:
         if task_config['algorithm']['effmap_translation']:
             print("merge map with translation")
-            r1 = self._scanner.rings[0]
-            grid, center, size, model, map_file, listmodedata = get_config(
-                task_config)
-            self._make_map_single_ring(
-                r1, grid, center, size, model, listmodedata)
+            runner.run([(0, ir) for ir in range(nb_rings)], 'effmap_{1}.npy')
             merge_effmap(self._scanner, grid, center,
                          size, 1, 0.95, './', map_file)
+        elif task_config['algorithm'].get('effmap_ring_difference', False):
+            print("merge map with ring difference")
+            runner.run([(0, ir) for ir in range(nb_rings)])
+            merge_effmap_ring_difference(self._scanner, grid, center, size, 0.95, './')
         else:
-            for ir1 in tqdm(range(self._scanner.nb_rings)):
-                r1 = self._scanner.rings[ir1]
-                for ir2 in range(self._scanner.nb_rings):
-                    r2 = self._scanner.rings[ir2]
-                    lors = self._scanner.make_ring_pairs_lors(r1, r2)
-                    projection_data = create_listmode_data[ListModeDataWithoutTOF](
-                        lors)
-                    result = _compute(projection_data, grid,
-                                      center, size, model)
-                    # coo = psfT(grid)
-                    # result = (coo * result.ravel()).reshape(grid)
-                    np.save(f'./effmap/effmap_{ir1}_{ir2}.npy', result)
-
+            runner.run([(ir1, ir2) for ir1 in range(nb_rings) for ir2 in range(nb_rings)])
             merge_effmap_full(self._scanner, grid, center, size, 1, 0.95, './')
 
-    def _make_map_single_ring(self, r1, grid, center, size, model, listmodedata):
-        for ir in tqdm(range(0, self._scanner.nb_rings)):
-            r2 = self._scanner.rings[ir]
-            lors = self._scanner.make_ring_pairs_lors(r1, r2)
-            if isinstance(model, SplitLoRsModel):
-                lors = map_process(lors)
-                projection_data = create_listmode_data[ListModeDataSplitWithoutTOF](
-                    lors)
-            # lors = self._scanner.make_ring_pairs_lors(r1, r2)
-            else:
-                projection_data = create_listmode_data[ListModeDataWithoutTOF](
-                    lors)
-
-            result = _compute(projection_data, grid, center, size, model)
-
-            np.save('effmap_{}.npy'.format(ir), result)
-
     def _make_psf_task(self, task_index, task_config):
         psf_maker = PSFMaker()
         kernel_config = task_config['kernel']
@@ -200,7 +192,8 @@ class SRFApp():
         epsilon = map_config['epsilon']
         psf_maker.run(kernel_xy_para_dir, kernel_z_para_dir,
             grid, voxel_size, refined_factor,
-            output_xy_dir, output_z_dir, map_file, psf_map_file, epsilon)
+            output_xy_dir, output_z_dir, map_file, psf_map_file, epsilon,
+            kernel_config.get('angle_step'), kernel_config.get('nb_workers', 1))
 
     def _make_scanner(self, task_config):
         """Create a specific scanner object.
@@ -262,9 +255,31 @@ def get_config(task_config):
     return grid, center, size, model, map_file, listmodedata
 
 
+def _make_sparse_matrix_model(model, worker_loader, path, im_config):
+    """ `SparseMatrixModel` of the system matrix cached under directory `path`.
+    The cache entry is keyed by the identity of the listmode file, the image
+    geometry and the model, it is built from the lors of `worker_loader` by
+    `model` when missing.
+    """
+    source = worker_loader.config[worker_loader.KEYS.LORS_PATH]
+    grid, center, size = im_config['grid'], im_config['center'], im_config['size']
+    identity = system_matrix_identity(model, grid, center, size, with_tof=True, source=source)
+    entry = os.path.join(path, system_matrix_key(identity))
+    if not os.path.exists(os.path.join(entry, META_FILE)):
+        projection_data = worker_loader.load(None)[0]['projection_data']
+        if isinstance(model, SplitLoRsModel):
+            lors = {a: np.asarray(projection_data[a].lors) for a in SplitLoRsModel.AXIS}
+        else:
+            lors = np.asarray(projection_data.lors)
+        build_system_matrix(model, lors, grid, center, size, entry, with_tof=True, source=source)
+    return SparseMatrixModel(entry)
+
+
 def _get_model(config):
     if ('siddon' in config):
-        model = CompleteLoRsModel('map_model')
+        model = CompleteLoRsModel('map_model', backend=config['siddon'].get('backend'),
+                                  nb_workers=config['siddon'].get('nb_workers'),
+                                  pool=config['siddon'].get('pool'))
         listmodedata = ListModeDataWithoutTOF
         # kernel_width = None
     elif ('siddon_sino' in config):
@@ -274,18 +289,10 @@ def _get_model(config):
     else:
         kernel_width = config['tor']['kernel_width']
         geo_sigma2_flag = config['tor']['geometry_sigma2_correction']
-        model = SplitLoRsModel(kernel_width,geo_sigma2_flag,  'map_model')
+        model = SplitLoRsModel(kernel_width, geo_sigma2_flag, name='map_model',
+                               backend=config['tor'].get('backend'),
+                               nb_workers=config['tor'].get('nb_workers'),
+                               pool=config['tor'].get('pool'))
         listmodedata = ListModeDataSplitWithoutTOF
 
     return model, listmodedata
-
-
-def _compute(lors, grid, center, size, model):
-    map_model = BackProjectionOrdinary(model)
-    t = RingEfficiencyMap('effmap', map_model, lors,
-                          grid=grid, center=center, size=size)
-    t.make()
-    with Session() as sess:
-        result = t.run()
-    sess.reset()
-    return result
@@ -37,6 +37,20 @@ def recon(job, task_index, config, task_name, distribute_config):
     SRFApp(job, task_index, task_config, task_name, distribution=distribute_config)
 
 
+@srf.command()
+@click.argument('source', type=click.Path(exists=True))
+@click.argument('target', type=click.Path())
+@click.option('--tof-res', '-r', type=float, default=1.0e4)
+@click.option('--chunk-size', '-s', type=int, default=None)
+def tor_lors(source, target, tof_res, chunk_size):
+    """
+    Preprocess listmode data to `{x, y, z}` lors for ToR reconstruction chunk by chunk.
+    """
+    from srf.preprocess.tor_lors import preprocess_tor_h5
+    counts = preprocess_tor_h5(source, target, tof_res, chunk_size)
+    click.echo('ToR lors: {}.'.format(counts))
+
+
 
 
 
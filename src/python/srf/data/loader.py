@@ -3,12 +3,15 @@ import abc
 import numpy as np
 
 from srf.io.listmode import load_h5
+from srf.io.psf import load_psf
 from srf.preprocess.function.on_tor_lors import str2axis, recon_process
 from srf.preprocess.merge_map import crop_image
+from srf.preprocess.tor_lors import is_tor_h5, load_tor_h5, ToRLoRsCache
 from srf.utils.config import config_with_name
 from .image import Image
 from .listmode import ListModeData, ListModeDataSplit
 from .sinogram_new import SinogramData
+from .sinogram_binning import listmode_to_sinogram
 
 
 class MasterLoader:
@@ -63,7 +66,8 @@ class WorkerLoader(abc.ABC):
         self.config.update(KS.SIZE, image_config['size'])
         self.config.update(KS.TOF_BIN, scanner.tof_bin)
         self.config.update(KS.TOF_RES, scanner.tof_res)
-        if correction.psf is not None:
+        # other psf operators are evaluated outside of the graph, see `srf.model.psf`.
+        if correction.psf is not None and correction.psf.operator == 'sparse':
             self.psf_flag = True
             self.config.update(KS.PSF_XY_PATH, correction.psf.xy)
             self.config.update(KS.PSF_Z_PATH, correction.psf.z)
@@ -75,15 +79,10 @@ class WorkerLoader(abc.ABC):
     def _load_psf(self):
         # TODO: move to doufo
         from dxl.learn.core.tensor import SparseTensor, Constant
-        from scipy import sparse
-        import scipy.io as scio
         KS = self.KEYS
         KC = self.config
-        psf_xy_mat = scio.loadmat(KC[KS.PSF_XY_PATH])
-        psf_xy_data = psf_xy_mat['matrix']
-        psf_xy = sparse.coo_matrix(psf_xy_data)
-        psf_z = np.load(KC[KS.PSF_Z_PATH])
-        return SparseTensor(psf_xy, 'psf_xy'), Constant(psf_z, 'psf_z')
+        psf_xy, psf_z = load_psf(KC[KS.PSF_XY_PATH], KC[KS.PSF_Z_PATH])
+        return SparseTensor(psf_xy.tocoo(), 'psf_xy'), Constant(psf_z, 'psf_z')
 
 
 
@@ -94,19 +93,44 @@ class WorkerLoader(abc.ABC):
 
 
 class SplitWorkerLoader(WorkerLoader):
-    def load(self, target_graph):
-        if self.config[self.KEYS.LORS_PATH].endswith(".npy"):
-            lors = np.load(self.config[self.KEYS.LORS_PATH])
-        elif self.config[self.KEYS.LORS_PATH].endswith(".h5"):
-            data = load_h5(self.config[self.KEYS.LORS_PATH])
+    """
+    Args:
+        cache_dir: directory of the `ToRLoRsCache` of preprocessed lors,
+            lors are preprocessed at every load without cache if it is None.
+    """
+
+    def __init__(self, lors_path, emap_path, scanner, image_config, correction, cache_dir=None,
+                 name='worker_loader'):
+        super().__init__(lors_path, emap_path, scanner, image_config, correction, name)
+        self.cache_dir = cache_dir
+
+    def _load_lors(self):
+        path = self.config[self.KEYS.LORS_PATH]
+        tof_res = self.config[self.KEYS.TOF_RES]
+        if path.endswith(".h5") and is_tor_h5(path):
+            # already preprocessed by `srf.preprocess.tor_lors.preprocess_tor_h5`
+            return load_tor_h5(path, tof_res)
+        if self.cache_dir is None:
+            return self._preprocess(path, tof_res)
+        columns = ['npy'] if path.endswith(".npy") else ['fst', 'snd', 'tof']
+        return ToRLoRsCache(self.cache_dir).get(path, tof_res, columns,
+                                                lambda: self._preprocess(path, tof_res))
+
+    def _preprocess(self, path, tof_res):
+        if path.endswith(".npy"):
+            lors = np.load(path)
+        elif path.endswith(".h5"):
+            data = load_h5(path)
             lors_point = np.hstack((data['fst'], data['snd']))
             lors = np.hstack(
                 (lors_point, data['tof'].reshape(data['tof'].size, 1)))
-        
 
         # tof_sigma2 = (limit**2)/9
-        lors = recon_process(lors, self.config[self.KEYS.TOF_RES])
-        lors = {k: lors[str2axis(k)] for k in ('x', 'y', 'z')}
+        lors = recon_process(lors, tof_res)
+        return {k: lors[str2axis(k)] for k in ('x', 'y', 'z')}
+
+    def load(self, target_graph):
+        lors = self._load_lors()
         projection_data = ListModeDataSplit(
             **{k: ListModeData(lors[k], np.ones([lors[k].shape[0]], np.float32)) for k in lors})
         emap = Image(np.load(self.config[self.KEYS.EMAP_PATH]).astype(np.float32),
@@ -210,36 +234,9 @@ class siddonSinogramLoader(abc.ABC):
 
 
 def _listMode2Sino(listmode: ListModeData, pj_config) -> SinogramData:
-    ang = np.pi * 2 / 16  # config['ring']['nb_blocks_per_ring']
-    x_data1 = listmode.lors[:, 0]
-    y_data1 = listmode.lors[:, 1]
-    z_data1 = listmode.lors[:, 2]
-    angles1 = np.arctan2(y_data1, x_data1) + np.pi
-    iblock1 = np.round(angles1 / ang) % 16
-    angle = iblock1 * ang
-    y_data1o = -x_data1 * np.sin(angle) + y_data1 * np.cos(angle)
-    y_ind1 = np.round((y_data1o + 33.4 / 2 - 3.34 / 2) / 3.34)
-    z_ind1 = np.round((z_data1 + 33.4 / 2 - 3.34 / 2) / 3.34)
-
-    x_data2 = listmode.lors[:, 3]
-    y_data2 = listmode.lors[:, 4]
-    z_data2 = listmode.lors[:, 5]
-    angles2 = np.arctan2(y_data2, x_data2) + np.pi
-    iblock2 = np.round(angles2 / ang) % 16
-    angle = iblock2 * ang
-    y_data2o = -x_data2 * np.sin(angle) + y_data2 * np.cos(angle)
-    y_ind2 = np.round((y_data2o + 33.4 / 2 - 3.34 / 2) / 3.34)
-    z_ind2 = np.round((z_data2 + 33.4 / 2 - 3.34 / 2) / 3.34)
-
-    sino = np.zeros((10 * 10 * 16, 10 * 10 * 16), dtype = int)
-    print(listmode.lors[0, :])
-    ind1 = (y_ind1 + 10 * z_ind1 + 100 * iblock1).astype(int)
-    ind2 = (y_ind2 + 10 * z_ind2 + 100 * iblock2).astype(int)
-
-    for i in range(len(x_data1)):
-        if i * 100 % len(x_data1) == 0:
-            print(i * 100 / len(x_data1))
-        sino[ind1[i], ind2[i]] = sino[ind1[i], ind2[i]] + 1
-        sino[ind2[i], ind1[i]] = sino[ind2[i], ind1[i]] + 1
-
-    return SinogramData(sino)
+    from srf.scanner.pet import Block, CylindricalPET, RingGeometry
+    # not `make_scanner`, which splits the axial crystals to rings, but the
+    # block layout of the siddon_sino op.
+    scanner = CylindricalPET('sinogram', RingGeometry(pj_config['ring']),
+                             Block(pj_config['block']['size'], pj_config['block']['grid']), None)
+    return SinogramData(listmode_to_sinogram(scanner, np.asarray(listmode.lors)))
@@ -0,0 +1,69 @@
+"""
+Vectorized binning of listmode events to the crystal pair sinogram of a
+`CylindricalPET`.
+
+Crystals are numbered in the order of the siddon_sino op:
+
+    id = igy + bgy * (igz + bgz * (iblock + nb_blocks_per_ring * iring))
+
+where block iblock is rotated by iblock*2*pi/nb_blocks_per_ring around the
+z axis, (igy, igz) is the crystal in the (tangential, axial) grid of a block.
+"""
+import numpy as np
+import scipy.sparse as sp
+
+__all__ = ['nb_crystals', 'crystal_index', 'listmode_to_sinogram']
+
+
+def nb_crystals(scanner):
+    grid = scanner.block_proto.grid
+    return int(grid[1] * grid[2] * scanner.nb_blocks_per_ring * scanner.nb_rings)
+
+
+def crystal_index(scanner, points):
+    """ [N] crystal id of [N, 3] points on the crystals of a `CylindricalPET`.
+    """
+    points = np.asarray(points)
+    nb_blocks = scanner.nb_blocks_per_ring
+    block_size = np.asarray(scanner.block_proto.block_size, dtype=np.float64)
+    grid = np.asarray(scanner.block_proto.grid)
+    interval = block_size / grid
+
+    angle = 2 * np.pi / nb_blocks
+    iblock = np.round(np.arctan2(points[:, 1], points[:, 0]) / angle).astype(np.int64) % nb_blocks
+    theta = iblock * angle
+    # tangential position in the frame of the block
+    y = points[:, 1] * np.cos(theta) - points[:, 0] * np.sin(theta)
+    igy = np.clip(np.floor((y + block_size[1] / 2) / interval[1]).astype(np.int64), 0, grid[1] - 1)
+
+    pitch = block_size[2] + scanner.gap
+    z = points[:, 2] + (pitch * (scanner.nb_rings - 1) + block_size[2]) / 2
+    iring = np.clip(np.floor(z / pitch).astype(np.int64), 0, scanner.nb_rings - 1)
+    z -= iring * pitch
+    igz = np.clip(np.floor(z / interval[2]).astype(np.int64), 0, grid[2] - 1)
+    return igy + grid[1] * (igz + grid[2] * (iblock + nb_blocks * iring))
+
+
+def listmode_to_sinogram(scanner, lors, weights=None, sparse=False):
+    """ Bin the lors (p0, p1, ...) to the symmetric [nb_crystals, nb_crystals]
+    sinogram, every event is counted at (id1, id2) and (id2, id1).
+
+    Args:
+        scanner: `CylindricalPET`.
+        lors: [N, 6+] array.
+        weights: optional [N] weights of the events.
+        sparse: return a `scipy.sparse.csr_matrix` instead of a dense array,
+            for scanners whose dense sinogram does not fit in the memory.
+    """
+    n = nb_crystals(scanner)
+    id1 = crystal_index(scanner, lors[:, 0:3])
+    id2 = crystal_index(scanner, lors[:, 3:6])
+    if weights is not None:
+        weights = np.concatenate([weights, weights])
+    if sparse:
+        data = np.ones([2 * id1.size], dtype=np.int64) if weights is None else weights
+        rows, columns = np.concatenate([id1, id2]), np.concatenate([id2, id1])
+        # duplicated entries are summed up by the conversion
+        return sp.coo_matrix((data, (rows, columns)), shape=(n, n)).tocsr()
+    flat = np.concatenate([id1 * n + id2, id2 * n + id1])
+    return np.bincount(flat, weights, minlength=n * n).reshape(n, n)
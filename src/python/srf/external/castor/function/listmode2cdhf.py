@@ -1,35 +1,120 @@
 '''
 This file provides the methods to translate SRF format list-mode data to CASTOR format data.
 CASTOR format data consists of an ascii .cdh header file and a binary data file.
+
+The binary .Cdf file is written chunk by chunk from the SRF HDF5 list-mode
+file, every event is a record of `cdf_dtype`:
+
+    time (uint32, ms), [attenuation factor], [scatter rate], [random rate],
+    [normalization factor], [TOF difference (float32)], crystal id 1, crystal id 2 (uint32)
+
+where the bracketed fields are present when the correction flags of the
+header are set. SRF list-mode data has no per-event time and correction
+values, start time and neutral factors are written.
 '''
-from doufo import List, Pair, x
-from dxl.shape.data import Point
-from srf.data import DetectorIdEvent, LoR, PETCylindricalScanner, PositionEvent, DetectorIdEvent
-# from .on_event import position2detectorid
 import numpy as np
-from functools import partial
-from srf.external.castor.data import DataHeader, DataListModeEvent, DataHeaderScript
-# from .geom_calculation import compute_crystal_id, compute_ring_id
+from srf.external.castor.data import DataHeader, DataHeaderScript
+from srf.data import Block, PETCylindricalScanner
+from srf.external.stir.function.on_event import positions2detectorids, AngularLUT
+from srf.io.listmode import iter_h5
+from .geom_calculation import CastorGeometry, compute_crystal_id, compute_ring_id
 
 from srf.external.castor.io import save_script, render
 
-__all__ = ['listmode2cdhf']
-def listmode2cdhf(config:dict):
-
-    nb_events, path, cdf_data = generate_cdf(config)
+__all__ = ['listmode2cdhf', 'get_scanner', 'castor_geometry', 'castor_crystal_ids',
+           'cdf_dtype', 'generate_cdf']
 
 
+def listmode2cdhf(config: dict):
+    nb_events, _ = generate_cdf(config)
+    config = dict(config, nb_events=nb_events)
     header = DataHeader(config)
     path, header_str = generate_cdh(header)
     save_script(path, header_str, '.Cdh')
 
 
-def generate_cdh(header:DataHeader):
-    header_script = DataHeaderScript(spec = header)
+def generate_cdh(header: DataHeader):
+    header_script = DataHeaderScript(spec=header)
     file_name = header.data_file_name
     data_str = render(header_script)
     return file_name, data_str
 
-def generate_cdf(config:dict):
-    raw_data = config['input_data_file']
 
+def get_scanner(config: dict) -> PETCylindricalScanner:
+    r = config['ring']
+    return PETCylindricalScanner(r['inner_radius'], r['outer_radius'], r['axial_length'],
+                                 r['nb_rings'], r['nb_blocks_per_ring'], r['gap'],
+                                 [Block(config['block']['size'], config['block']['grid'])])
+
+
+def castor_geometry(scanner) -> CastorGeometry:
+    """ CASTOR geometry of an ecat like `PETCylindricalScanner`: a block is a
+    rsector of one module and one submodule, rings of blocks are axial rsectors.
+    """
+    grid = scanner.blocks[0].grid
+    return CastorGeometry(nb_rsectors=scanner.nb_blocks_per_ring,
+                          nb_axial_rsectors=scanner.nb_rings,
+                          nb_axial_modules=1,
+                          nb_transaxial_modules=1,
+                          nb_axial_submodules=1,
+                          nb_transaxial_submodules=1,
+                          nb_axial_crystals=grid[2],
+                          nb_transaxial_crystals=grid[1])
+
+
+def castor_crystal_ids(scanner, positions, geometry: CastorGeometry = None, lut: AngularLUT = None):
+    """ [N] CASTOR crystal ids of [N, 3] positions. """
+    if geometry is None:
+        geometry = castor_geometry(scanner)
+    rings, blocks, crystals = positions2detectorids(scanner, positions, lut)
+    # crystal ids of a block start from half a block before its center
+    transaxial_crystals = (crystals + int(scanner.nb_detectors_per_block / 2)
+                           - blocks * scanner.nb_detectors_per_block)
+    id_ring = compute_ring_id(geometry, rings % geometry.nb_axial_crystals, 0, 0,
+                              rings // geometry.nb_axial_crystals)
+    return compute_crystal_id(geometry, id_ring, transaxial_crystals, 0, 0, blocks)
+
+
+def cdf_dtype(header: DataHeader) -> np.dtype:
+    fields = [('time', '<u4')]
+    if header.attenuation_correction_flag:
+        fields.append(('attenuation_factor', '<f4'))
+    if header.scatter_coorection_flag:
+        fields.append(('scatter_rate', '<f4'))
+    if header.random_correction_flag:
+        fields.append(('random_rate', '<f4'))
+    if header.normalization_correction_flag:
+        fields.append(('normalization_factor', '<f4'))
+    if header.tof_info_flag:
+        fields.append(('tof_diff_time', '<f4'))
+    fields += [('id1', '<u4'), ('id2', '<u4')]
+    return np.dtype(fields)
+
+
+def generate_cdf(config: dict, chunk_size=None):
+    """ Write the .Cdf file of `config['input_data_file']` chunk by chunk.
+
+    Returns:
+        (number of events, path of the .Cdf file).
+    """
+    header = DataHeader(dict(config, nb_events=0))
+    scanner = get_scanner(config['scanner'])
+    geometry, lut = castor_geometry(scanner), AngularLUT(scanner)
+    dtype = cdf_dtype(header)
+    columns = ['fst', 'snd'] + (['tof'] if header.tof_info_flag else [])
+    path = header.data_file_name + '.Cdf'
+    nb_events = 0
+    with open(path, 'wb') as fout:
+        for events in iter_h5(config['input_data_file'], columns, chunk_size):
+            records = np.zeros([events['fst'].shape[0]], dtype=dtype)
+            records['time'] = int(header.start_time * 1000)
+            for name in ('attenuation_factor', 'normalization_factor'):
+                if name in dtype.names:
+                    records[name] = 1.0
+            if 'tof_diff_time' in dtype.names:
+                records['tof_diff_time'] = np.ravel(events['tof'])
+            records['id1'] = castor_crystal_ids(scanner, events['fst'], geometry, lut)
+            records['id2'] = castor_crystal_ids(scanner, events['snd'], geometry, lut)
+            records.tofile(fout)
+            nb_events += records.shape[0]
+    return nb_events, path
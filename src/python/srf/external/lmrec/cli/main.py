@@ -1,21 +1,18 @@
 import click
 from jfs.api import Path
-from srf.io.listmode import load_h5
 from srf.external.lmrec.function import gen_script
-from srf.external.lmrec.io import save_result
+from srf.external.lmrec.io import save_result, save_bin
 import json
 import os
-import numpy as np
 
 def lm2bin(config, target):
-    path_file = config['input']['listmode']['path_file']
-    data = load_h5(path_file)
-    coo_data = np.hstack((data['fst'],data['snd']))
-    bin_data = np.hstack((coo_data,data['weight'].reshape(data['weight'].size,1)))
-    out = bin_data.astype(np.float32)
-    out.tofile((Path(target)+'input.txt').abs)
-    f = open((Path(target)+'input.txt.hdr').abs,'w')
-    f.write(str(out.shape[0]))
+    """
+    `path_file` is a file or a list of files, which are converted by
+    `nb_workers` processes.
+    """
+    c = config['input']['listmode']
+    save_bin(c['path_file'], (Path(target)+'input.txt').abs,
+             chunk_size=c.get('chunk_size'), nb_workers=c.get('nb_workers', 1))
 
 
 
@@ -1,3 +1,3 @@
-#from .bin import save_bin,load_bin
+from .bin import save_bin,load_bin
 from .script import render,save_script
 from .image import save_result
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""
+LMRec binary list-mode input.
+
+`{target}` holds float32 records (fst x, y, z, snd x, y, z, weight) and
+`{target}.hdr` the number of records. The records of one or more SRF HDF5
+list-mode files are copied chunk by chunk into a preallocated file, every
+input file is written to its own slice of the output, hence inputs can be
+converted by parallel processes.
+"""
+import multiprocessing
+import os
+
+import h5py
+import numpy as np
+
+from srf.io.listmode import DEFAULT_GROUP_NAME, DEFAULT_CHUNK_SIZE
+
+__all__ = ['save_bin', 'load_bin']
+
+NB_COLUMNS = 7
+RECORD_SIZE = NB_COLUMNS * np.dtype(np.float32).itemsize
+
+
+def _nb_events(path, group_name=DEFAULT_GROUP_NAME):
+    with h5py.File(path, 'r') as fin:
+        return fin[group_name]['fst'].shape[0]
+
+
+def _copy_events(job):
+    source, target, offset, chunk_size, group_name = job
+    with h5py.File(source, 'r') as fin, open(target, 'r+b') as fout:
+        dataset = fin[group_name]
+        nb_events = dataset['fst'].shape[0]
+        buffer = np.empty([min(chunk_size, nb_events), NB_COLUMNS], dtype=np.float32)
+        fout.seek(offset * RECORD_SIZE)
+        for start in range(0, nb_events, chunk_size):
+            stop = min(start + chunk_size, nb_events)
+            out = buffer[:stop - start]
+            # h5py casts to float32 while reading into the columns
+            out[:, 0:3] = dataset['fst'][start:stop]
+            out[:, 3:6] = dataset['snd'][start:stop]
+            out[:, 6] = np.reshape(dataset['weight'][start:stop], [-1])
+            out.tofile(fout)
+    return nb_events
+
+
+def save_bin(sources, target, chunk_size=None, nb_workers=1, group_name=DEFAULT_GROUP_NAME):
+    """ Convert SRF list-mode files to the LMRec binary file `target`.
+
+    Args:
+        sources: path or list of paths, records are written in this order.
+        chunk_size: max number of events in memory of a process.
+        nb_workers: number of processes converting the sources.
+
+    Returns:
+        Number of records.
+    """
+    if isinstance(sources, (str, os.PathLike)):
+        sources = [sources]
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    counts = [_nb_events(s, group_name) for s in sources]
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    with open(target, 'wb') as fout:
+        fout.truncate(int(offsets[-1]) * RECORD_SIZE)
+    jobs = [(s, target, int(o), chunk_size, group_name) for s, o in zip(sources, offsets)]
+    if nb_workers > 1 and len(jobs) > 1:
+        # spawn, forking a process which has loaded TensorFlow may deadlock
+        with multiprocessing.get_context('spawn').Pool(min(nb_workers, len(jobs))) as pool:
+            pool.map(_copy_events, jobs)
+    else:
+        for job in jobs:
+            _copy_events(job)
+    # the header is written last, a file with header is complete.
+    with open(str(target) + '.hdr', 'w') as fout:
+        fout.write(str(int(offsets[-1])))
+    return int(offsets[-1])
+
+
+def load_bin(path, mmap_mode='r'):
+    """ [N, 7] float32 records of a file made by `save_bin`. """
+    with open(str(path) + '.hdr', 'r') as fin:
+        nb_events = int(fin.read())
+    if nb_events == 0:
+        return np.zeros([0, NB_COLUMNS], dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode=mmap_mode, shape=(nb_events, NB_COLUMNS))
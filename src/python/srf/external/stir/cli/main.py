@@ -32,8 +32,8 @@ def generate_data_and_header(config,target):
     gen_sino_script(c['scanner']['petscanner'],(path_data.abs+'sinogram'))
     path_file = c['input']['listmode']['path_file']
     data = load_h5(path_file)
-    lor = List(LoR(PositionEvent(data['fst'][i,]),PositionEvent(data['snd'][i,]) ,weight=data['weight'][i]) for i in range(0,data['weight'].size))
-    lm2sino(scanner,lor,(path_data.abs+'/sinogram.s'))
+    lors = np.hstack([data['fst'], data['snd']])
+    lm2sino(scanner,lors,(path_data.abs+'/sinogram.s'))
 
 
 @stir.command()
@@ -1,17 +1,37 @@
 from doufo import List, Pair, x
 from dxl.shape.data import Point
 from srf.data import DetectorIdEvent, LoR,PETSinogram3D, PETCylindricalScanner, PositionEvent, DetectorIdEvent
-from .on_event import position2detectorid
+from .on_event import position2detectorid, positions2detectorids
 import numpy as np
 from functools import partial
 
 __all__ = ['listmode2sinogram']
 
 
-def listmode2sinogram(scanner: PETCylindricalScanner, listmode_data: List[LoR]) -> PETSinogram3D:    
+def listmode2sinogram(scanner: PETCylindricalScanner, listmode_data, lut=None) -> PETSinogram3D:
+    """ Accumulate listmode data to the STIR sinogram.
+
+    Args:
+        listmode_data: [N, 6+] array of (fst, snd) positions, or List[LoR] of
+            position or detector id events.
+        lut: optional `AngularLUT` of scanner for position arrays.
+    """
+    rings, crystals = detector_ids(scanner, listmode_data, lut)
+    return accumulating2sinogram_columns(scanner, *rework_indices_columns(scanner, rings, crystals))
+
+
+def detector_ids(scanner, listmode_data, lut=None):
+    """ [2, N] ring ids and [2, N] crystal ids of (fst, snd) events. """
+    if isinstance(listmode_data, np.ndarray):
+        # fst and snd are looked up in one call
+        positions = np.concatenate([listmode_data[:, 0:3], listmode_data[:, 3:6]])
+        rings, _, crystals = positions2detectorids(scanner, positions, lut)
+        return rings.reshape(2, -1), crystals.reshape(2, -1)
     listmode_data = ensure_detectorid_event(scanner, listmode_data)
-    data_with_fixed_ids = listmode_data.fmap(partial(rework_indices, scanner))
-    return accumulating2sinogram(scanner, data_with_fixed_ids)
+    return (np.array([[l.fst.id_ring for l in listmode_data], [l.snd.id_ring for l in listmode_data]],
+                     dtype=np.int64).reshape(2, -1),
+            np.array([[l.fst.id_crystal for l in listmode_data], [l.snd.id_crystal for l in listmode_data]],
+                     dtype=np.int64).reshape(2, -1))
 
 
 def ensure_detectorid_event(scanner, listmode_data: List[LoR]) -> List[LoR]:
@@ -72,17 +92,37 @@ def is_need_swap_crystal_id(ps: Pair) -> bool:
     return False
 
 
-def accumulating2sinogram(scanner, lors: List[LoR]) -> PETSinogram3D:
+def crystal_centers(nb_detectors: int) -> np.ndarray:
+    """ [nb_detectors, 2] `center_of_crystal` of all crystals, computed by the same
+    scalar functions, hence the comparisons of the swap rules are unchanged.
+    """
+    return np.array([[np.sin((0.5 + i) * (2 * np.pi) / nb_detectors),
+                      np.cos((0.5 + i) * (2 * np.pi) / nb_detectors)] for i in range(nb_detectors)])
+
+
+def rework_indices_columns(scanner, rings, crystals):
+    """ `rework_indices` of [2, N] ring ids and crystal ids. """
+    nb_detectors = scanner.nb_detectors_per_ring
+    crystals = (crystals + nb_detectors // 4) % nb_detectors
+    centers = crystal_centers(nb_detectors)
+    x1, y1 = centers[crystals[0], 0], centers[crystals[0], 1]
+    x2, y2 = centers[crystals[1], 0], centers[crystals[1], 1]
+    swap_ring = (x1 > x2) | ((x1 == x2) & (y1 < y2))
+    swap_crystal = (x1 < x2) | ((x1 == x2) & (y1 > y2))
+    rings = np.where(swap_ring, rings[::-1], rings)
+    crystals = np.where(swap_crystal, crystals[::-1], crystals)
+    return rings, crystals
+
+
+def accumulating2sinogram_columns(scanner, rings, crystals) -> PETSinogram3D:
+    """ Accumulate the reworked [2, N] ring ids and crystal ids in one bincount. """
     nb_views_, nb_sinograms_ = nb_views(scanner), nb_sinograms(scanner)
-    result = np.zeros([nb_sinograms_, nb_views_, nb_views_])
-    for lor in lors:
-        ring_ids, crystal_ids = lor.fmap2(x.id_ring), lor.fmap2(x.id_crystal)
-        id_bin_ = id_bin(scanner, crystal_ids)
-        if id_bin_ >= 0 and id_bin_ < nb_views_:
-            result[id_sinogram(scanner, ring_ids),
-                   id_view(scanner, crystal_ids),
-                   id_bin_] += 1
-    return PETSinogram3D(result)
+    views = id_view(scanner, Pair(crystals[0], crystals[1]))
+    bins = id_bin_columns(scanner, crystals, views)
+    valid = (bins >= 0) & (bins < nb_views_)
+    index = ((id_sinogram_columns(scanner, rings) * nb_views_ + views) * nb_views_ + bins)[valid]
+    result = np.bincount(index, minlength=nb_sinograms_ * nb_views_ * nb_views_)
+    return PETSinogram3D(result.reshape([nb_sinograms_, nb_views_, nb_views_]).astype(np.float64))
 
 
 def nb_views(scanner) -> int:
@@ -105,6 +145,19 @@ def id_sinogram(scanner, ring_ids: Pair) -> int:
     return int(result)
 
 
+def id_sinogram_columns(scanner, rings) -> np.ndarray:
+    """ `id_sinogram` of [2, N] ring ids, the loop over ring differences is
+    replaced by its closed form.
+    """
+    nb_rings = scanner.nb_rings * scanner.blocks[0].grid[2]
+    delta_z = rings[1] - rings[0]
+    k = np.abs(delta_z)
+    result = np.minimum(rings[0], rings[1])
+    result += np.where(k > 0, nb_rings + 2 * np.maximum(k - 1, 0) * nb_rings - k * np.maximum(k - 1, 0), 0)
+    result += np.where(delta_z < 0, nb_rings - k, 0)
+    return result
+
+
 def id_view(scanner, crystal_ids: Pair) -> int:
     half_dct = scanner.nb_detectors_per_ring // 2
     return (crystal_ids.fst + crystal_ids.snd + half_dct + 1) // 2 % half_dct
@@ -117,6 +170,15 @@ def id_bin(scanner, crystal_ids: Pair) -> int:
     return result
 
 
+def id_bin_columns(scanner, crystals, views) -> np.ndarray:
+    """ `id_bin` of [2, N] crystal ids with their views. """
+    nb_detectors = scanner.nb_detectors_per_ring
+    diffs = np.minimum(np.abs(crystals - views), np.abs(crystals - (views + nb_detectors)))
+    crystals = np.where(diffs[0] < diffs[1], crystals[::-1], crystals)
+    result = (crystals[1] - crystals[0]) % nb_detectors
+    return result + nb_views(scanner) // 2 - nb_detectors // 2
+
+
 def maybe_fliped_cystal_ids(scanner, crystal_ids):
     diffs = crystal_ids.fmap2(partial(crystal_id_view_id_difference,
                                       id_view(scanner, crystal_ids),
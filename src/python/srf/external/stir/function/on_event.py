@@ -3,7 +3,8 @@ import numpy as np
 import math
 from doufo.tensor import norm,Vector
 
-__all__ = ['position2detectorid']
+__all__ = ['position2detectorid', 'positions2detectorids', 'AngularLUT',
+           'ring_ids', 'block_ids', 'crystal_ids']
 
 
 def position2detectorid(scanner: PETCylindricalScanner, event: PositionEvent) -> DetectorIdEvent:
@@ -35,6 +36,79 @@ def ring_id(scanner, position):
     return int((Vector(position).z / scanner.axial_length + 0.5) * scanner.nb_rings*scanner.blocks[0].grid[2])
 
 
+def ring_ids(scanner, positions):
+    """ `ring_id` of [N, 3] positions. """
+    return np.trunc((positions[:, 2] / scanner.axial_length + 0.5)
+                    * scanner.nb_rings * scanner.blocks[0].grid[2]).astype(np.int64)
+
+
+def thetas(positions):
+    """ `theta` of [N, 3] positions, in [0, 2pi). """
+    return np.arctan2(positions[:, 1], positions[:, 0]) % (2 * np.pi)
+
+
+def block_ids(scanner, positions, thetas_=None):
+    """ `block_id` of [N, 3] positions. """
+    if thetas_ is None:
+        thetas_ = thetas(positions)
+    return np.floor(thetas_ / block_angle(scanner) + 0.5).astype(np.int64) % scanner.nb_blocks_per_ring
+
+
+def crystal_ids(scanner, positions, thetas_=None):
+    """ `crystal_id` of [N, 3] positions. """
+    if thetas_ is None:
+        thetas_ = thetas(positions)
+    fixed_fi = (np.degrees(thetas_) + 180 / scanner.nb_blocks_per_ring) % 360
+    return (np.floor(fixed_fi / 360 * scanner.nb_detectors_per_ring).astype(np.int64)
+            - int(scanner.nb_detectors_per_block / 2))
+
+
+class AngularLUT:
+    """
+    Precomputed block and crystal ids of `nb_bins` equal angular bins, for
+    repeated lookups of the same scanner.
+
+    The bin width is pi / nb_detectors_per_ring / nb_subdivisions, the block
+    and crystal boundaries lie on bin boundaries, hence the ids of a bin are
+    the ids of any position in it.
+    """
+
+    def __init__(self, scanner: PETCylindricalScanner, nb_subdivisions=1):
+        if nb_subdivisions < 1:
+            raise ValueError(f"nb_subdivisions must be positive, got {nb_subdivisions}.")
+        self.nb_bins = 2 * scanner.nb_detectors_per_ring * nb_subdivisions
+        centers = (np.arange(self.nb_bins) + 0.5) * (2 * np.pi / self.nb_bins)
+        self.block_ids = block_ids(scanner, None, centers)
+        self.crystal_ids = crystal_ids(scanner, None, centers)
+
+    def bins(self, positions):
+        return np.floor(thetas(positions) * (self.nb_bins / (2 * np.pi))).astype(np.int64) % self.nb_bins
+
+    def __call__(self, positions):
+        """ ([N] block ids, [N] crystal ids) of [N, 3] positions. """
+        bins = self.bins(positions)
+        return self.block_ids[bins], self.crystal_ids[bins]
+
+
+def positions2detectorids(scanner: PETCylindricalScanner, positions, lut: AngularLUT = None):
+    """ Vectorized `position2detectorid`.
+
+    Args:
+        positions: [N, 3] array.
+        lut: optional `AngularLUT` of scanner.
+
+    Returns:
+        ([N] ring ids, [N] block ids, [N] crystal ids).
+    """
+    positions = np.asarray(positions)
+    if lut is not None:
+        return (ring_ids(scanner, positions),) + lut(positions)
+    thetas_ = thetas(positions)
+    return (ring_ids(scanner, positions),
+            block_ids(scanner, positions, thetas_),
+            crystal_ids(scanner, positions, thetas_))
+
+
 # def crystal_id(scanner, position):
 #     bid = block_id(scanner, position)
 #     shift = ((p_xy(position) - center(scanner, bid))) @ normal(scanner, bid)
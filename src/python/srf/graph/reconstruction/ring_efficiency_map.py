@@ -38,7 +38,7 @@ class RingEfficiencyMap(Graph):
     def kernel(self):
         self._construct_x_results(*self._construct_inputs())
 
-    def run(self, session=None):
+    def run(self, session=None, feeds=None):
         if session is None:
             session = ThisSession
-        return session.run(self.tensors[self.KEYS.TENSOR.RESULT].data)
+        return session.run(self.tensors[self.KEYS.TENSOR.RESULT].data, feeds)
@@ -12,7 +12,10 @@ DEFAULT_COLUMNS = ['fst', 'snd', 'weight', 'tof',
 
 # TODO move implementation to doufo.io
 
-__all__ = ['load_h5', 'save_h5']
+__all__ = ['load_h5', 'save_h5', 'iter_h5']
+
+# default number of events of a chunk read by `iter_h5`.
+DEFAULT_CHUNK_SIZE = 1 << 20
 
 
 def load_h5(path, group_name=DEFAULT_GROUP_NAME)-> Dict[str, np.ndarray]:
@@ -30,3 +33,20 @@ def save_h5(path, dct, group_name=DEFAULT_GROUP_NAME):
         group = fout.create_group(group_name)
         for k, v in dct.items():
             group.create_dataset(k, data=v, compression="gzip")
+
+
+def iter_h5(path, columns=None, chunk_size=None, group_name=DEFAULT_GROUP_NAME):
+    """ Read the columns of a listmode file chunk by chunk.
+
+    Yields:
+        dict of column name -> array of at most chunk_size events.
+    """
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    with h5py.File(path, 'r') as fin:
+        dataset = fin[group_name]
+        if columns is None:
+            columns = [k for k in DEFAULT_COLUMNS if k in dataset]
+        nb_events = dataset[columns[0]].shape[0]
+        for start in range(0, nb_events, chunk_size):
+            yield {k: dataset[k][start:start + chunk_size] for k in columns}
@@ -0,0 +1,101 @@
+"""
+PSF matrix artifacts.
+
+The xy kernel made by `PSFMaker` is saved as an uncompressed `.npz` of a
+CSR (or CSC) matrix:
+
+    data        float32 values.
+    indices     int32 column (row for CSC) indices, int64 if they do not fit.
+    indptr      row (column for CSC) pointers.
+    format      'csr' or 'csc'.
+    shape       [nx*ny, nx*ny].
+    grid        [nx, ny] of the image.
+    voxel_size  [vx, vy] of the image.
+
+The members are stored uncompressed, hence they are memory-mapped in place
+when loaded, and the transpose of the loaded matrix (`.T`) is a view of
+the other format. Legacy MATLAB `.mat` files of `{'matrix': ...}` are still
+loaded by `load_psf`.
+"""
+import zipfile
+
+import numpy as np
+import scipy.sparse as sp
+
+__all__ = ['save_psf_xy', 'load_psf_xy', 'load_psf_header', 'load_psf']
+
+FORMATS = ('csr', 'csc')
+
+
+def save_psf_xy(path, matrix, grid, voxel_size, format='csr'):
+    if format not in FORMATS:
+        raise ValueError(f"Unknown psf matrix format {format}, must be one of {FORMATS}.")
+    matrix = matrix.asformat(format)
+    matrix.sum_duplicates()
+    index_dtype = np.int32 if max(matrix.nnz, max(matrix.shape)) < np.iinfo(np.int32).max else np.int64
+    # written to an opened file, np.savez would append .npz to other suffixes
+    with open(path, 'wb') as fout:
+        np.savez(fout,
+                 data=matrix.data.astype(np.float32),
+                 indices=matrix.indices.astype(index_dtype),
+                 indptr=matrix.indptr.astype(index_dtype),
+                 format=np.array(format),
+                 shape=np.array(matrix.shape, dtype=np.int64),
+                 grid=np.array(grid[:2], dtype=np.int64),
+                 voxel_size=np.array(voxel_size[:2], dtype=np.float64))
+
+
+def _load_member(path, archive, name, mmap_mode):
+    info = archive.getinfo(name + '.npy')
+    if mmap_mode is None or info.compress_type != zipfile.ZIP_STORED:
+        with archive.open(info) as fin:
+            return np.lib.format.read_array(fin)
+    with open(path, 'rb') as fin:
+        # the local file header has its own lengths of name and extra field
+        fin.seek(info.header_offset + 26)
+        name_length, extra_length = np.frombuffer(fin.read(4), dtype='<u2')
+        fin.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+        version = np.lib.format.read_magic(fin)
+        read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                       else np.lib.format.read_array_header_2_0)
+        shape, fortran_order, dtype = read_header(fin)
+        offset = fin.tell()
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def load_psf_header(path):
+    with np.load(path) as fin:
+        return {'format': str(fin['format']),
+                'shape': tuple(int(s) for s in fin['shape']),
+                'grid': [int(s) for s in fin['grid']],
+                'voxel_size': [float(s) for s in fin['voxel_size']]}
+
+
+def load_psf_xy(path, mmap_mode='r'):
+    """ The xy kernel of a `save_psf_xy` artifact, its arrays are memory-mapped
+    unless mmap_mode is None.
+    """
+    header = load_psf_header(path)
+    with zipfile.ZipFile(path) as archive:
+        data, indices, indptr = (_load_member(path, archive, n, mmap_mode)
+                                 for n in ('data', 'indices', 'indptr'))
+    matrix_type = sp.csr_matrix if header['format'] == 'csr' else sp.csc_matrix
+    return matrix_type((data, indices, indptr), shape=header['shape'], copy=False)
+
+
+def load_psf(xy_path, z_path):
+    """ Load the psf matrices made by `PSFMaker`.
+
+    Returns:
+        (scipy.sparse [nx*ny, nx*ny] xy kernel, [nz, nz] z kernel).
+    """
+    if str(xy_path).endswith('.mat'):
+        import scipy.io as scio
+        psf_xy = sp.csr_matrix(scio.loadmat(xy_path)['matrix'], dtype=np.float32)
+    else:
+        psf_xy = load_psf_xy(xy_path)
+    psf_z = np.load(z_path).astype(np.float32)
+    return psf_xy, psf_z
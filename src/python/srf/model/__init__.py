@@ -1,4 +1,5 @@
 from ._projection import *
 from ._backprojection import *
 from .recon_step import *
+from .psf import *
 from .backprojection_step import *
\ No newline at end of file
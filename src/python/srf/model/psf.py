@@ -0,0 +1,229 @@
+"""
+PSF operators of `PSFReconStep`.
+
+An operator blurs an image tensor of shape [nx, ny, nz] and applies its
+transpose to the backprojection:
+
+    SparsePSF       xy sparse matrix and z dense matrix, the exact shift-variant model.
+    FFTPSF          one shift-invariant kernel, correlation by FFT.
+    RadialZonePSF   shift-invariant kernels of radial zones in xy, every zone is
+                    an FFT correlation masked to the pixels of the zone.
+
+The kernels of FFTPSF and RadialZonePSF are taken from the rows of the
+sparse model, hence all of them are built from the same `PSFMaker` output
+and chosen by `operator` of the psf config.
+"""
+import abc
+
+import numpy as np
+
+__all__ = ['PSFOperator', 'SparsePSF', 'FFTPSF', 'RadialZonePSF',
+           'local_kernel', 'make_psf_operator']
+
+OPERATORS = ('sparse', 'fft', 'radial_fft')
+
+
+class PSFOperator(abc.ABC):
+    @abc.abstractmethod
+    def blur(self, image):
+        """ A @ image of a [nx, ny, nz] tensor. """
+
+    @abc.abstractmethod
+    def blur_transpose(self, image):
+        """ A^T @ image of a [nx, ny, nz] tensor. """
+
+
+class SparsePSF(PSFOperator):
+    """
+    Args:
+        psf_xy: [nx*ny, nx*ny] `tf.SparseTensor`, row j + i*ny is the kernel of pixel (i, j).
+        psf_z: [nz, nz] tensor.
+    """
+
+    def __init__(self, psf_xy, psf_z):
+        self.psf_xy = psf_xy
+        self.psf_z = psf_z
+
+    def blur(self, image):
+        import tensorflow as tf
+        grid = image.get_shape()
+        image_vectorized = tf.reshape(image, [grid[0] * grid[1], grid[2]])
+        result = tf.sparse_tensor_dense_matmul(self.psf_xy, image_vectorized @ tf.transpose(self.psf_z))
+        return tf.reshape(result, shape=tf.shape(image))
+
+    def blur_transpose(self, image):
+        import tensorflow as tf
+        grid = image.get_shape()
+        image_vectorized = tf.reshape(image, [grid[0] * grid[1], grid[2]])
+        result = tf.sparse_tensor_dense_matmul(tf.sparse_transpose(self.psf_xy), image_vectorized @ self.psf_z)
+        return tf.reshape(result, shape=tf.shape(image))
+
+
+class _NumpyPSF(PSFOperator):
+    """
+    Operators evaluated by numpy, wrapped by `tf.py_func` the same as
+    `SparseMatrixModel`.
+    """
+
+    @abc.abstractmethod
+    def apply(self, image):
+        """ A @ image of a [nx, ny, nz] array. """
+
+    @abc.abstractmethod
+    def apply_transpose(self, image):
+        """ A^T @ image of a [nx, ny, nz] array. """
+
+    def _py_func(self, func, image):
+        import tensorflow as tf
+        result = tf.py_func(lambda x: func(x).astype(np.float32), [image], tf.float32, stateful=False)
+        result.set_shape(image.get_shape())
+        return result
+
+    def blur(self, image):
+        return self._py_func(self.apply, image)
+
+    def blur_transpose(self, image):
+        return self._py_func(self.apply_transpose, image)
+
+
+class _FFTCorrelation:
+    """
+    `out[p] = sum_d kernel[d + h] * image[p + d]` with zero boundary, the
+    spectra of the kernel are cached per image shape.
+    """
+
+    def __init__(self, kernel):
+        self.kernel = np.asarray(kernel, dtype=np.float32)
+        if any(s % 2 == 0 for s in self.kernel.shape):
+            raise ValueError(f"Kernel shape must be odd, got {self.kernel.shape}.")
+        self._spectra = {}
+
+    def _spectrum(self, shape, transpose):
+        from scipy import fft
+        key = (shape, transpose)
+        if key not in self._spectra:
+            fshape = tuple(fft.next_fast_len(s + k - 1, real=True) for s, k in zip(shape, self.kernel.shape))
+            # correlation is convolution with the flipped kernel
+            kernel = self.kernel if transpose else self.kernel[::-1, ::-1, ::-1]
+            self._spectra[key] = fshape, fft.rfftn(kernel, fshape)
+        return self._spectra[key]
+
+    def __call__(self, image, transpose=False):
+        from scipy import fft
+        image = np.asarray(image, dtype=np.float32)
+        fshape, spectrum = self._spectrum(image.shape, transpose)
+        result = fft.irfftn(fft.rfftn(image, fshape) * spectrum, fshape)
+        h = [k // 2 for k in self.kernel.shape]
+        return result[h[0]:h[0] + image.shape[0], h[1]:h[1] + image.shape[1], h[2]:h[2] + image.shape[2]]
+
+
+class FFTPSF(_NumpyPSF):
+    """
+    Shift-invariant PSF, `kernel` is a [kx, ky, kz] array of odd shape
+    centered at the pixel, i.e. the `local_kernel` of a row of the sparse model.
+    """
+
+    def __init__(self, kernel):
+        self._correlation = _FFTCorrelation(kernel)
+
+    @property
+    def kernel(self):
+        return self._correlation.kernel
+
+    def apply(self, image):
+        return self._correlation(image)
+
+    def apply_transpose(self, image):
+        return self._correlation(image, transpose=True)
+
+
+class RadialZonePSF(_NumpyPSF):
+    """
+    Piecewise shift-variant PSF, pixel (i, j) is blurred by the kernel of the
+    zone of its radius.
+
+    Args:
+        kernels: list of [kx, ky, kz] kernels of zones.
+        radii: upper bounds of the radius of zones, pixels beyond the last
+            one belong to the last zone.
+        grid, center, size: xy geometry of the image.
+    """
+
+    def __init__(self, kernels, radii, grid, center, size):
+        if len(kernels) != len(radii):
+            raise ValueError(f"Got {len(kernels)} kernels of {len(radii)} zones.")
+        self._correlations = [_FFTCorrelation(k) for k in kernels]
+        rmesh = pixel_radii(grid, center, size)
+        zones = np.minimum(np.searchsorted(np.asarray(radii), rmesh), len(radii) - 1)
+        self.masks = [(zones == k).astype(np.float32)[:, :, None] for k in range(len(radii))]
+
+    def apply(self, image):
+        return sum(m * c(image) for m, c in zip(self.masks, self._correlations))
+
+    def apply_transpose(self, image):
+        return sum(c(m * image, transpose=True) for m, c in zip(self.masks, self._correlations))
+
+
+def pixel_radii(grid, center, size):
+    """ [nx, ny] radius of pixel centers. """
+    voxel = np.asarray(size[:2], dtype=np.float64) / np.asarray(grid[:2])
+    x, y = ((np.arange(grid[k]) + 0.5) * voxel[k] - size[k] / 2 + center[k] for k in range(2))
+    xmesh, ymesh = np.meshgrid(x, y, indexing='ij')
+    return np.sqrt(xmesh ** 2 + ymesh ** 2)
+
+
+def local_kernel(psf_xy, psf_z, grid, pixel, iz=None):
+    """ The [kx, ky, kz] kernel of the sparse model at `pixel` (i, j) and
+    slice iz (center slice if None), cropped to the smallest odd window
+    holding all of its entries.
+
+    Args:
+        psf_xy: scipy sparse [nx*ny, nx*ny] xy kernel.
+        psf_z: [nz, nz] z kernel.
+    """
+    nx, ny, nz = grid
+    i, j = pixel
+    iz = nz // 2 if iz is None else iz
+    row = np.asarray(psf_xy.tocsr()[j + i * ny].toarray()).reshape([nx, ny])
+    row_z = np.asarray(psf_z)[iz]
+    a, c = np.nonzero(row)
+    (b,) = np.nonzero(row_z)
+    hx = np.max(np.abs(a - i), initial=0)
+    hy = np.max(np.abs(c - j), initial=0)
+    hz = np.max(np.abs(b - iz), initial=0)
+    kernel_xy = np.pad(row, [(hx, hx), (hy, hy)])[i:i + 2 * hx + 1, j:j + 2 * hy + 1]
+    kernel_z = np.pad(row_z, [(hz, hz)])[iz:iz + 2 * hz + 1]
+    return kernel_xy[:, :, None] * kernel_z[None, None, :]
+
+
+def make_psf_operator(operator, psf_xy, psf_z, grid, center, size, nb_zones=None):
+    """ Build the numpy evaluated operators from the sparse model, None for
+    'sparse' which is built from the psf tensors of the loader.
+
+    Args:
+        operator: 'sparse', 'fft' or 'radial_fft'.
+        psf_xy, psf_z: scipy sparse xy kernel and dense z kernel.
+        nb_zones: number of radial zones of 'radial_fft', default 4.
+    """
+    if operator not in OPERATORS:
+        raise ValueError(f"Unknown psf operator {operator}, must be one of {OPERATORS}.")
+    if operator == 'sparse':
+        return None
+    rmesh = pixel_radii(grid, center, size)
+    if operator == 'fft':
+        return FFTPSF(local_kernel(psf_xy, psf_z, grid, np.unravel_index(np.argmin(rmesh), rmesh.shape)))
+    if nb_zones is None:
+        nb_zones = 4
+    radii = np.linspace(0.0, np.max(rmesh), nb_zones + 1)[1:]
+    kernels = []
+    ix, iy = np.meshgrid(np.arange(grid[0]), np.arange(grid[1]), indexing='ij')
+    border = np.minimum(np.minimum(ix, grid[0] - 1 - ix), np.minimum(iy, grid[1] - 1 - iy))
+    voxel = np.min(np.asarray(size[:2]) / np.asarray(grid[:2]))
+    for k in range(nb_zones):
+        # the kernel of a pixel nearest to the middle radius of the zone, the
+        # one farthest from the border of those, whose kernel is not clipped.
+        distance = np.abs(rmesh - (radii[k] - radii[0] / 2))
+        candidates = distance <= np.min(distance) + voxel / 2
+        pixel = np.unravel_index(np.argmax(np.where(candidates, border, -1)), rmesh.shape)
+        kernels.append(local_kernel(psf_xy, psf_z, grid, pixel))
+    return RadialZonePSF(kernels, radii, grid, center, size)
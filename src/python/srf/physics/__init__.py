@@ -3,4 +3,7 @@
 # from .siddon import SiddonModel
 from .complete_lors import CompleteLoRsModel
 from .split_lors import SplitLoRsModel
-from .complete_sino import CompleteSinoModel
\ No newline at end of file
+from .complete_sino import CompleteSinoModel
+from .sparse_matrix import (SparseMatrixModel, SystemMatrix, build_system_matrix, system_matrix_identity,
+                            system_matrix_key)
+from .rotational_matrix import RotationalSystemMatrix, build_rotational_system_matrix, polar_to_cartesian
@@ -4,6 +4,7 @@ from dxl.learn.tensor import transpose
 from srf.model import projection, backprojection, map_lors
 from srf.data import Image, ListModeData, ListModeDataWithoutTOF
 from srf.utils.config import config_with_name
+from srf.physics.cpu import SiddonOp
 
 # load op
 TF_ROOT = os.environ.get('TENSORFLOW_ROOT')
@@ -34,25 +35,46 @@ class CompleteLoRsModel:
     """
     This model provides support to the models (typically for siddon model)
     using complete lors.This model processes the lors dataset without splitting.
+
+    The backend decides which implementation computes the ray tracing:
+    'gpu' loads the `siddon.so` custom op, while 'cpu' runs the NumPy
+    implementation in `srf.physics.cpu`, which shards the lors over
+    `nb_workers` workers of a 'thread' or 'process' pool when given.
     """
 
+    BACKENDS = ('gpu', 'cpu')
+
     class KEYS:
         class CONFIG:
             TOF_SIGMA2 = 'tof_sigma2'
             TOF_BIN = 'tof_bin'
+            BACKEND = 'backend'
+            NB_WORKERS = 'nb_workers'
+            POOL = 'pool'
 
-    def __init__(self, name, tof_sigma2=None, tof_bin=None):
+    def __init__(self, name, tof_sigma2=None, tof_bin=None, backend=None, nb_workers=None,
+                 pool=None):
         self.name = name
         self.config = config_with_name(name)
         if tof_sigma2 is None:
             tof_sigma2 = 1.0e4
         if tof_bin is None:
             tof_bin = 1.0e4
+        if backend is None:
+            backend = 'gpu'
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of {self.BACKENDS}.")
         self.config.update(self.KEYS.CONFIG.TOF_SIGMA2, tof_sigma2)
         self.config.update(self.KEYS.CONFIG.TOF_BIN, tof_bin)
+        self.config.update(self.KEYS.CONFIG.BACKEND, backend)
+        self.config.update(self.KEYS.CONFIG.NB_WORKERS, nb_workers)
+        self.config.update(self.KEYS.CONFIG.POOL, pool)
 
     @property
     def op(self):
+        if self.config[self.KEYS.CONFIG.BACKEND] == 'cpu':
+            return SiddonOp(self.config[self.KEYS.CONFIG.NB_WORKERS],
+                            self.config[self.KEYS.CONFIG.POOL])
         return Op.get_module()
 
 
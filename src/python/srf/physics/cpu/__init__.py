@@ -0,0 +1,2 @@
+from .siddon import SiddonOp
+from .tor import ToROp
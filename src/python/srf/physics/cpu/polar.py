@@ -0,0 +1,146 @@
+"""
+Siddon ray tracing on a polar (cylindrical) voxel grid.
+
+A polar voxel (ir, iphi, iz) covers radius [ir, ir + 1) * dr, angle
+[iphi - 0.5, iphi + 0.5) * dphi and axial position [iz, iz + 1) * dz from
+the bottom of the grid. Angular bins are centered on multiples of dphi, so
+lors through the z axis along the block directions do not run on a bin
+boundary. Rotating a lor by a multiple of dphi around the z axis
+only shifts the iphi index of its voxels, which makes the grid suitable for
+sharing one system matrix between the identical block sectors of a
+cylindrical scanner.
+"""
+import numpy as np
+
+from .siddon import _as_lors, _chunks
+
+__all__ = ['PolarGrid', 'polar_trace', 'polar_matrix']
+
+# max number of (lor, boundary crossing) entries processed at once.
+MAX_CROSSINGS_PER_CHUNK = 1 << 22
+
+
+class PolarGrid:
+    """
+    Attributes:
+        shape: (nb_r, nb_phi, nb_z).
+        radius: outer radius of the grid.
+        center_z: axial center.
+        length: axial length.
+    """
+
+    def __init__(self, shape, radius, length, center_z=0.0):
+        self.shape = tuple(int(s) for s in shape)
+        self.radius = float(radius)
+        self.length = float(length)
+        self.center_z = float(center_z)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def interval(self):
+        return (self.radius / self.shape[0], 2 * np.pi / self.shape[1], self.length / self.shape[2])
+
+    @property
+    def lower_z(self):
+        return self.center_z - self.length / 2
+
+    def index(self, points):
+        """ Flat voxel index of [N, 3] cartesian points, -1 for the outside ones.
+        """
+        dr, dphi, dz = self.interval
+        r = np.sqrt(points[:, 0] ** 2 + points[:, 1] ** 2)
+        phi = np.mod(np.arctan2(points[:, 1], points[:, 0]) + dphi / 2, 2 * np.pi)
+        ir = np.floor(r / dr).astype(np.int64)
+        iphi = np.minimum(np.floor(phi / dphi).astype(np.int64), self.shape[1] - 1)
+        iz = np.floor((points[:, 2] - self.lower_z) / dz).astype(np.int64)
+        inside = (ir < self.shape[0]) & (iz >= 0) & (iz < self.shape[2])
+        index = (ir * self.shape[1] + iphi) * self.shape[2] + iz
+        return np.where(inside, index, -1)
+
+
+def polar_trace(lors, polar_grid):
+    """ Compute the ray-voxel intersections of a batch of lors on a polar grid.
+
+    Returns:
+        index: [N, M] flat voxel index in the (nb_r, nb_phi, nb_z) image.
+        length: [N, M] intersection length, zero for padding segments.
+        lor_length: [N] length of lors.
+    """
+    g = polar_grid
+    p0 = lors[:, 0:3]
+    d = lors[:, 3:6] - p0
+    lor_length = np.sqrt(np.sum(np.square(d), 1))
+    dr, dphi, dz = g.interval
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # circles |p0 + alpha * d|_xy = r
+        a = d[:, 0] ** 2 + d[:, 1] ** 2
+        b = 2 * (p0[:, 0] * d[:, 0] + p0[:, 1] * d[:, 1])
+        c = p0[:, 0] ** 2 + p0[:, 1] ** 2
+        radii = dr * np.arange(1, g.shape[0] + 1)
+        delta = b[:, None] ** 2 - 4 * a[:, None] * (c[:, None] - radii[None, :] ** 2)
+        sqrt_delta = np.sqrt(np.where(delta > 0, delta, np.nan))
+        circles = np.hstack([(-b[:, None] - sqrt_delta) / (2 * a[:, None]),
+                             (-b[:, None] + sqrt_delta) / (2 * a[:, None])])
+        # full lines through the z axis, cross(p0 + alpha * d, u) = 0
+        phi = dphi * (np.arange(g.shape[1]) + 0.5)
+        u = np.stack([np.cos(phi), np.sin(phi)])
+        lines = (-(p0[:, 0:1] * u[1] - p0[:, 1:2] * u[0])
+                 / (d[:, 0:1] * u[1] - d[:, 1:2] * u[0]))
+        # z planes
+        planes = g.lower_z + dz * np.arange(g.shape[2] + 1)
+        slices = (planes[None, :] - p0[:, 2:3]) / d[:, 2:3]
+
+        # clip to the cylinder
+        outer = circles[:, [g.shape[0] - 1, 2 * g.shape[0] - 1]]
+        hit = np.all(np.isfinite(outer), 1)
+        parallel_r = a == 0.0
+        inside_r = c < g.radius ** 2
+        alpha_min = np.where(parallel_r, np.where(inside_r, 0.0, np.inf),
+                             np.maximum(0.0, np.where(hit, outer[:, 0], np.inf)))
+        alpha_max = np.where(parallel_r, 1.0,
+                             np.minimum(1.0, np.where(hit, outer[:, 1], -np.inf)))
+        parallel_z = d[:, 2] == 0.0
+        inside_z = (p0[:, 2] >= planes[0]) & (p0[:, 2] <= planes[-1])
+        alpha_min = np.where(parallel_z, np.where(inside_z, alpha_min, np.inf),
+                             np.fmax(alpha_min, np.minimum(slices[:, 0], slices[:, -1])))
+        alpha_max = np.where(parallel_z, alpha_max,
+                             np.fmin(alpha_max, np.maximum(slices[:, 0], slices[:, -1])))
+    # lors missing the grid are collapsed to empty intervals.
+    miss = ~(alpha_min < alpha_max)
+    alpha_min[miss] = 0.0
+    alpha_max[miss] = 0.0
+    alpha = np.hstack([circles, lines, slices, alpha_min[:, None], alpha_max[:, None]])
+    alpha[~np.isfinite(alpha)] = 0.0
+    np.clip(alpha, alpha_min[:, None], alpha_max[:, None], out=alpha)
+    alpha.sort(axis=1)
+
+    length = np.diff(alpha, axis=1) * lor_length[:, None]
+    middle = (alpha[:, 1:] + alpha[:, :-1]) / 2
+    points = p0[:, None, :] + middle[:, :, None] * d[:, None, :]
+    index = g.index(points.reshape(-1, 3)).reshape(middle.shape)
+    length[index < 0] = 0.0
+    return np.maximum(index, 0), length, lor_length
+
+
+def polar_matrix(lors, polar_grid, chunk_size=None):
+    """ The non-zero system matrix elements (same weight to `siddon_maplors`)
+    of lors on a polar grid, chunk by chunk.
+
+    Yields:
+        ilor: [K] lor index of every element.
+        index: [K] flat voxel index in the (nb_r, nb_phi, nb_z) image.
+        value: [K] system matrix value.
+    """
+    lors = _as_lors(lors)
+    if chunk_size is None:
+        nb_crossings = 2 * polar_grid.shape[0] + polar_grid.shape[1] + polar_grid.shape[2] + 3
+        chunk_size = max(MAX_CROSSINGS_PER_CHUNK // nb_crossings, 1)
+    for s in _chunks(lors.shape[0], chunk_size):
+        index, length, lor_length = polar_trace(lors[s], polar_grid)
+        value = length / (lor_length ** 2)[:, None]
+        ilor, segment = np.nonzero(value)
+        yield ilor + s.start, index[ilor, segment], value[ilor, segment]
@@ -0,0 +1,123 @@
+"""
+Sharded execution of the NumPy projectors.
+
+The lors are split into shards which are projected (or backprojected) on a
+thread or process pool. Projection results are written to their slice of a
+preallocated output, while the partial backprojection images are reduced
+in place into one preallocated image buffer.
+
+Executors are cached by (pool, nb_workers), so that a reconstruction does
+not pay the pool start-up for every iteration, and are shut down at exit.
+Process pools spawn their workers, since forking the multithreaded
+TensorFlow process which calls the projectors may deadlock. The image of a
+process pool call is copied once into shared memory, instead of being
+pickled with every shard.
+"""
+import atexit
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+__all__ = ['POOLS', 'shard_slices', 'get_executor', 'shutdown_executors',
+           'sharded_projection', 'sharded_backprojection']
+
+POOLS = ('thread', 'process')
+
+_EXECUTORS = {}
+
+
+def get_executor(pool, nb_workers):
+    if pool is None:
+        pool = 'thread'
+    if pool not in POOLS:
+        raise ValueError(f"Unknown pool {pool}, expected one of {POOLS}.")
+    key = (pool, nb_workers)
+    if key not in _EXECUTORS:
+        if pool == 'process':
+            _EXECUTORS[key] = ProcessPoolExecutor(max_workers=nb_workers,
+                                                  mp_context=multiprocessing.get_context('spawn'))
+        else:
+            _EXECUTORS[key] = ThreadPoolExecutor(max_workers=nb_workers)
+    return _EXECUTORS[key]
+
+
+def shutdown_executors():
+    while _EXECUTORS:
+        _, executor = _EXECUTORS.popitem()
+        executor.shutdown(wait=True)
+
+
+atexit.register(shutdown_executors)
+
+
+@contextmanager
+def _shared(image, pool):
+    """ `image` itself for thread pools, otherwise a (name, shape, dtype)
+    reference of its copy in shared memory, released on exit.
+    """
+    if pool != 'process':
+        yield image
+        return
+    image = np.ascontiguousarray(image)
+    memory = shared_memory.SharedMemory(create=True, size=max(image.nbytes, 1))
+    try:
+        np.ndarray(image.shape, image.dtype, buffer=memory.buf)[...] = image
+        yield memory.name, image.shape, image.dtype.str
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def _run_shard(kernel, image, *args):
+    if not isinstance(image, tuple):
+        return kernel(*args, image=image)
+    name, shape, dtype = image
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        array = np.ndarray(shape, dtype, buffer=memory.buf)
+        result = np.array(kernel(*args, image=array))
+        del array
+        return result
+    finally:
+        memory.close()
+
+
+def shard_slices(nb_lors, nb_shards):
+    """ Split `nb_lors` lors into at most `nb_shards` contiguous slices.
+    """
+    nb_shards = max(min(int(nb_shards), nb_lors), 1)
+    bounds = np.linspace(0, nb_lors, nb_shards + 1).astype(np.int64)
+    return [slice(b, e) for b, e in zip(bounds[:-1], bounds[1:]) if e > b]
+
+
+def sharded_projection(kernel, lors, image, nb_workers, pool=None):
+    """ Run `kernel(lors_shard, image=image) -> values` on a pool.
+    """
+    lors = np.asarray(lors)
+    result = np.zeros([lors.shape[0]], dtype=np.float32)
+    executor = get_executor(pool, nb_workers)
+    with _shared(image, pool) as shared_image:
+        futures = {executor.submit(_run_shard, kernel, shared_image, lors[s]): s
+                   for s in shard_slices(lors.shape[0], nb_workers)}
+        for f in as_completed(futures):
+            result[futures[f]] = f.result()
+    return result
+
+
+def sharded_backprojection(kernel, lors, lors_value, image, nb_workers, pool=None):
+    """ Run `kernel(lors_shard, lors_value_shard, image=image) -> image` on a
+    pool, and sum the partial images into one buffer.
+    """
+    lors = np.asarray(lors)
+    lors_value = np.asarray(lors_value).reshape([-1])
+    result = np.zeros(np.shape(image), dtype=np.float32)
+    executor = get_executor(pool, nb_workers)
+    with _shared(image, pool) as shared_image:
+        futures = [executor.submit(_run_shard, kernel, shared_image, lors[s], lors_value[s])
+                   for s in shard_slices(lors.shape[0], nb_workers)]
+        for f in as_completed(futures):
+            np.add(result, f.result(), out=result)
+    return result
@@ -0,0 +1,250 @@
+"""
+Pure NumPy implementation of the siddon ray tracer.
+
+The functions in this module mirror the `siddon.so` custom op
+(src/cpp/tf_custom_ops/siddon.cu.cc) so that both backends are
+interchangeable:
+
+    lors:   [N, 7] array of (x1, y1, z1, x2, y2, z2, tof).
+    image:  array of shape (gz, gy, gx), i.e. the transposed image the
+            op receives.
+    grid, center, size: (x, y, z) ordered image geometry.
+
+LoRs are traced in chunks so that the intermediate crossing tables stay
+within a bounded amount of memory. With `nb_workers` the lors are further
+sharded over a thread or process pool, see `srf.physics.cpu.sharding`.
+"""
+from functools import partial
+
+import numpy as np
+import tensorflow as tf
+
+from .sharding import sharded_projection, sharded_backprojection
+
+__all__ = ['trace', 'siddon_projection', 'siddon_backprojection', 'siddon_maplors', 'siddon_matrix',
+           'SiddonOp']
+
+# the same threshold of the custom op, tof_sigma2 above it disables TOF.
+TOF_THRESHOLD = 405758.0
+
+# max number of (lor, plane crossing) entries processed at once.
+MAX_CROSSINGS_PER_CHUNK = 1 << 22
+
+
+def _chunk_size(grid, chunk_size=None):
+    if chunk_size is not None:
+        return max(int(chunk_size), 1)
+    nb_crossings = int(np.sum(grid)) + 5
+    return max(MAX_CROSSINGS_PER_CHUNK // nb_crossings, 1)
+
+
+def _chunks(nb_lors, size):
+    for start in range(0, nb_lors, size):
+        yield slice(start, min(start + size, nb_lors))
+
+
+def _as_lors(lors):
+    lors = np.asarray(lors, dtype=np.float64)
+    return lors.reshape((-1, lors.shape[-1]))
+
+
+def trace(lors, grid, center, size):
+    """ Compute the ray-voxel intersections of a batch of lors.
+
+    Args:
+        lors: [N, >=6] array, the first 6 columns are the end points.
+        grid, center, size: image geometry in (x, y, z) order.
+
+    Returns:
+        index: [N, M] flat voxel index in the (gz, gy, gx) image.
+        length: [N, M] intersection length (mm) of every segment,
+                zero for padding segments.
+        distance: [N, M] distance from the first end point to the
+                  middle of every segment.
+        lor_length: [N] length of lors.
+    """
+    grid = np.asarray(grid, dtype=np.int64)
+    center = np.asarray(center, dtype=np.float64)
+    size = np.asarray(size, dtype=np.float64)
+    lower = center - size / 2
+    voxel = size / grid
+
+    p0 = lors[:, 0:3]
+    d = lors[:, 3:6] - p0
+    lor_length = np.sqrt(np.sum(np.square(d), 1))
+
+    alpha_min = np.zeros(lors.shape[0])
+    alpha_max = np.ones(lors.shape[0])
+    crossings = []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for a in range(3):
+            planes = lower[a] + voxel[a] * np.arange(grid[a] + 1)
+            alpha = (planes[None, :] - p0[:, a:a + 1]) / d[:, a:a + 1]
+            parallel = d[:, a] == 0.0
+            inside = (p0[:, a] >= lower[a]) & (p0[:, a] <= lower[a] + size[a])
+            first = np.where(parallel, np.where(inside, -np.inf, np.inf),
+                             np.minimum(alpha[:, 0], alpha[:, -1]))
+            last = np.where(parallel, np.where(inside, np.inf, -np.inf),
+                            np.maximum(alpha[:, 0], alpha[:, -1]))
+            alpha_min = np.maximum(alpha_min, first)
+            alpha_max = np.minimum(alpha_max, last)
+            alpha[parallel] = np.inf
+            crossings.append(alpha)
+    # lors missing the image are collapsed to empty intervals.
+    miss = ~(alpha_min < alpha_max)
+    alpha_min[miss] = 0.0
+    alpha_max[miss] = 0.0
+    crossings.append(alpha_min[:, None])
+    crossings.append(alpha_max[:, None])
+    alpha = np.hstack(crossings)
+    np.clip(alpha, alpha_min[:, None], alpha_max[:, None], out=alpha)
+    alpha.sort(axis=1)
+
+    length = np.diff(alpha, axis=1) * lor_length[:, None]
+    middle = (alpha[:, 1:] + alpha[:, :-1]) / 2
+    index = np.zeros(middle.shape, dtype=np.int64)
+    for a in reversed(range(3)):
+        position = p0[:, a:a + 1] + middle * d[:, a:a + 1]
+        ia = np.floor((position - lower[a]) / voxel[a]).astype(np.int64)
+        np.clip(ia, 0, grid[a] - 1, out=ia)
+        index = index * grid[a] + ia
+    return index, length, middle * lor_length[:, None], lor_length
+
+
+def tof_factor(lors, length, distance, lor_length, tof_bin, tof_sigma2):
+    """ The TOF kernel value of every segment, same to the custom op.
+    """
+    if tof_sigma2 >= TOF_THRESHOLD:
+        return np.ones(length.shape)
+    t = (lor_length / 2 - lors[:, 6])[:, None] - distance
+    sigma2 = tof_sigma2 + (length ** 2 + tof_bin ** 2) / 12.0
+    t2_by_sigma2 = t ** 2 / sigma2
+    value = tof_bin * np.exp(-0.5 * t2_by_sigma2) / np.sqrt(2.0 * np.pi * sigma2)
+    value[t2_by_sigma2 >= 9.0] = 0.0
+    return value
+
+
+def siddon_projection(lors, image, grid, center, size, tof_bin, tof_sigma2, chunk_size=None,
+                      nb_workers=None, pool=None):
+    lors = _as_lors(lors)
+    if nb_workers is not None and nb_workers > 1:
+        kernel = partial(siddon_projection, grid=grid, center=center, size=size,
+                         tof_bin=tof_bin, tof_sigma2=tof_sigma2, chunk_size=chunk_size)
+        return sharded_projection(kernel, lors, image, nb_workers, pool)
+    image_flat = np.asarray(image, dtype=np.float32).ravel()
+    result = np.zeros([lors.shape[0]], dtype=np.float32)
+    for s in _chunks(lors.shape[0], _chunk_size(grid, chunk_size)):
+        index, length, distance, lor_length = trace(lors[s], grid, center, size)
+        value = length * tof_factor(lors[s], length, distance, lor_length,
+                                    tof_bin, tof_sigma2)
+        result[s] = np.sum(image_flat[index] * value, 1) / lor_length ** 2
+    return result
+
+
+def _backproject(lors, lors_value, image, grid, center, size, kernel, chunk_size):
+    lors = _as_lors(lors)
+    lors_value = np.asarray(lors_value, dtype=np.float64).ravel()
+    result = np.zeros([np.asarray(image).size], dtype=np.float64)
+    for s in _chunks(lors.shape[0], _chunk_size(grid, chunk_size)):
+        valid = lors_value[s] > 0
+        if not np.any(valid):
+            continue
+        sub_lors = lors[s][valid]
+        index, length, distance, lor_length = trace(sub_lors, grid, center, size)
+        value = kernel(sub_lors, length, distance, lor_length)
+        value *= (1.0 / lor_length ** 2 / lors_value[s][valid])[:, None]
+        result += np.bincount(index.ravel(), value.ravel(), minlength=result.size)
+    return result.astype(np.float32).reshape(np.shape(image))
+
+
+def siddon_backprojection(lors, lors_value, image, grid, center, size, tof_bin, tof_sigma2,
+                          chunk_size=None, nb_workers=None, pool=None):
+    if nb_workers is not None and nb_workers > 1:
+        kernel = partial(siddon_backprojection, grid=grid, center=center, size=size,
+                         tof_bin=tof_bin, tof_sigma2=tof_sigma2, chunk_size=chunk_size)
+        return sharded_backprojection(kernel, _as_lors(lors), lors_value, image,
+                                      nb_workers, pool)
+
+    def kernel(lors, length, distance, lor_length):
+        return length * tof_factor(lors, length, distance, lor_length, tof_bin, tof_sigma2)
+    return _backproject(lors, lors_value, image, grid, center, size, kernel, chunk_size)
+
+
+def siddon_maplors(lors, lors_value, image, grid, center, size, chunk_size=None,
+                   nb_workers=None, pool=None):
+    if nb_workers is not None and nb_workers > 1:
+        kernel = partial(siddon_maplors, grid=grid, center=center, size=size,
+                         chunk_size=chunk_size)
+        return sharded_backprojection(kernel, _as_lors(lors), lors_value, image,
+                                      nb_workers, pool)
+
+    def kernel(lors, length, distance, lor_length):
+        return length
+    return _backproject(lors, lors_value, image, grid, center, size, kernel, chunk_size)
+
+
+def siddon_matrix(lors, grid, center, size, tof_bin=None, tof_sigma2=None, chunk_size=None):
+    """ The non-zero system matrix elements of lors, chunk by chunk.
+
+    TOF is applied only when `tof_sigma2` is given, i.e. the elements of
+    `siddon_maplors` are yielded by default.
+
+    Yields:
+        ilor: [K] lor index of every element.
+        index: [K] flat voxel index in the (gz, gy, gx) image.
+        value: [K] system matrix value.
+    """
+    lors = _as_lors(lors)
+    for s in _chunks(lors.shape[0], _chunk_size(grid, chunk_size)):
+        index, length, distance, lor_length = trace(lors[s], grid, center, size)
+        value = length
+        if tof_sigma2 is not None:
+            value = value * tof_factor(lors[s], length, distance, lor_length, tof_bin, tof_sigma2)
+        value = value / (lor_length ** 2)[:, None]
+        ilor, segment = np.nonzero(value)
+        yield ilor + s.start, index[ilor, segment], value[ilor, segment]
+
+
+class SiddonOp:
+    """
+    A drop-in replacement of the `siddon.so` op module, which runs the NumPy
+    ray tracer through `tf.py_func`.
+    The arguments are the same to the custom op, i.e. lors are transposed
+    to the shape of [nb_columns, N].
+    `nb_workers` and `pool` configure the sharded execution of lors.
+    """
+
+    def __init__(self, nb_workers=None, pool=None):
+        self.nb_workers = nb_workers
+        self.pool = pool
+
+    def projection(self, lors, image, grid, center, size, tof_bin, tof_sigma2):
+        lors, image = tf.convert_to_tensor(lors), tf.convert_to_tensor(image)
+
+        def kernel(lors, image):
+            return siddon_projection(lors.T, image, grid, center, size, tof_bin, tof_sigma2,
+                                     nb_workers=self.nb_workers, pool=self.pool)
+        result = tf.py_func(kernel, [lors, image], tf.float32, stateful=False)
+        result.set_shape(lors.shape[1:])
+        return result
+
+    def backprojection(self, image, grid, center, size, lors, lors_value, tof_bin, tof_sigma2):
+        image = tf.convert_to_tensor(image)
+
+        def kernel(image, lors, lors_value):
+            return siddon_backprojection(lors.T, lors_value, image, grid, center, size,
+                                         tof_bin, tof_sigma2,
+                                         nb_workers=self.nb_workers, pool=self.pool)
+        result = tf.py_func(kernel, [image, lors, lors_value], tf.float32, stateful=False)
+        result.set_shape(image.shape)
+        return result
+
+    def maplors(self, image, grid, center, size, lors, lors_value):
+        image = tf.convert_to_tensor(image)
+
+        def kernel(image, lors, lors_value):
+            return siddon_maplors(lors.T, lors_value, image, grid, center, size,
+                                  nb_workers=self.nb_workers, pool=self.pool)
+        result = tf.py_func(kernel, [image, lors, lors_value], tf.float32, stateful=False)
+        result.set_shape(image.shape)
+        return result
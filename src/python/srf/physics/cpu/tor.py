@@ -0,0 +1,245 @@
+"""
+Pure NumPy implementation of the tube-of-response (ToR) model.
+
+The functions in this module mirror the `tor.so` custom op
+(src/cpp/tf_custom_ops/tor.cu.cc) and consume the same partitioned lors
+produced by `srf.preprocess.function.on_tor_lors`:
+
+    recon lors: [N, 10] array of (x1, y1, z1, x2, y2, z2, xc, yc, zc, sigma2_factor).
+    map lors:   [N, 7] array of (x1, y1, z1, x2, y2, z2, sigma2_factor).
+    image:  array of shape (gz, gy, gx), the image transposed to the
+            dominant axis of the lors, which is always the last one.
+    grid, center, size: (x, y, z) ordered geometry of that image.
+
+Every (lor, slice) crossing is expanded to a patch of voxels around the
+crossing point, the lors are processed in chunks to bound the memory of
+these patch tables. With `nb_workers` the lors are further sharded over a
+thread or process pool, see `srf.physics.cpu.sharding`.
+"""
+from functools import partial
+
+import numpy as np
+import tensorflow as tf
+
+from .sharding import sharded_projection, sharded_backprojection
+from .siddon import TOF_THRESHOLD, _chunks
+
+__all__ = ['tor_projection', 'tor_backprojection', 'tor_maplors', 'tor_matrix', 'ToROp']
+
+# max number of (lor, slice, patch voxel) entries processed at once.
+MAX_ENTRIES_PER_CHUNK = 1 << 22
+
+
+class _Geometry:
+    def __init__(self, grid, center, size, kernel_width):
+        self.grid = np.asarray(grid, dtype=np.int64)
+        self.center = np.asarray(center, dtype=np.float64)
+        self.size = np.asarray(size, dtype=np.float64)
+        self.interval = self.size / self.grid
+        self.lower = self.center - self.size / 2
+        # 3 * sigma = kernel_width
+        self.tor_sigma2 = kernel_width ** 2 / 36
+        self.patch_size = int(np.ceil((np.sqrt(2) * kernel_width + self.interval[2])
+                                      / self.interval[0]))
+        self.slices_z = (self.center[2] - (self.size[2] - self.interval[2]) / 2
+                         + np.arange(self.grid[2]) * self.interval[2])
+
+    def chunk_size(self, chunk_size=None):
+        if chunk_size is not None:
+            return max(int(chunk_size), 1)
+        return max(MAX_ENTRIES_PER_CHUNK // int(self.grid[2] * self.patch_size ** 2), 1)
+
+
+def _crossings(lors, geometry):
+    """ Find all the (lor, slice) crossings of a batch of lors.
+    """
+    p0 = lors[:, 0:3]
+    d = lors[:, 3:6] - p0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = (geometry.slices_z[None, :] - p0[:, 2:3]) / d[:, 2:3]
+    ilor, islice = np.nonzero((ratio > 0.0) & (ratio < 1.0))
+    ratio = ratio[ilor, islice]
+    cross = p0[ilor, 0:2] + d[ilor, 0:2] * ratio[:, None]
+    dis = np.sqrt(np.sum(np.square(d), 1))
+    dcos = d[ilor, 0:2] / dis[ilor, None]
+    return ilor, islice, cross, dcos
+
+
+def _patches(lors, geometry, sigma2_factor, geo_sigma2_flag,
+             tof_bin=None, tof_sigma2=None):
+    """ The non-zero system matrix elements of a batch of lors.
+
+    Returns:
+        ilor: [K] lor index of every element.
+        index: [K] flat voxel index in the (gz, gy, gx) image.
+        value: [K] system matrix value.
+    """
+    g = geometry
+    ilor, islice, cross, dcos = _crossings(lors, g)
+    half = g.patch_size // 2
+    # (int) conversion of the custom op truncates toward zero.
+    start = (np.trunc((cross - g.lower[0:2]) / g.interval[0:2]).astype(np.int64) - half)
+    offset = np.arange(g.patch_size)
+    ix = (start[:, 0:1] + offset[None, :])[:, None, :]
+    iy = (start[:, 1:2] + offset[None, :])[:, :, None]
+    inside = (ix >= 0) & (ix < g.grid[0]) & (iy >= 0) & (iy < g.grid[1])
+    ix, iy = np.broadcast_to(ix, inside.shape), np.broadcast_to(iy, inside.shape)
+    entry, row, col = np.nonzero(inside)
+    ix, iy = ix[entry, row, col], iy[entry, row, col]
+
+    delta_x = cross[entry, 0] - (g.interval[0] * (ix + 0.5) + g.lower[0])
+    delta_y = cross[entry, 1] - (g.interval[1] * (iy + 0.5) + g.lower[1])
+    r_cos = delta_x * dcos[entry, 0] + delta_y * dcos[entry, 1]
+    d2 = delta_x ** 2 + delta_y ** 2 - r_cos ** 2
+    sigma2 = np.full(d2.shape, g.tor_sigma2)
+    if geo_sigma2_flag:
+        sigma2 *= sigma2_factor[ilor[entry]]
+    value = np.where(d2 < 9.0 * sigma2, np.exp(-0.5 * d2 / sigma2), 0.0)
+
+    if tof_sigma2 is not None and tof_sigma2 < TOF_THRESHOLD:
+        lor_center = lors[ilor[entry], 6:9]
+        d2_tof = (np.square(lor_center[:, 0] - cross[entry, 0])
+                  + np.square(lor_center[:, 1] - cross[entry, 1])
+                  + np.square(lor_center[:, 2] - g.slices_z[islice[entry]]) - d2)
+        tof_sigma2_expand = tof_sigma2 + tof_bin ** 2 / 12
+        value *= (tof_bin * np.exp(-0.5 * d2_tof / tof_sigma2_expand)
+                  / np.sqrt(2.0 * np.pi * tof_sigma2))
+
+    index = (islice[entry] * g.grid[1] + iy) * g.grid[0] + ix
+    return ilor[entry], index, value
+
+
+def _as_lors(lors):
+    lors = np.asarray(lors, dtype=np.float64)
+    return lors.reshape((-1, lors.shape[-1]))
+
+
+def tor_projection(lors, image, grid, center, size, kernel_width, geo_sigma2_flag,
+                   tof_bin, tof_sigma2, chunk_size=None, nb_workers=None, pool=None):
+    lors = _as_lors(lors)
+    if nb_workers is not None and nb_workers > 1:
+        kernel = partial(tor_projection, grid=grid, center=center, size=size,
+                         kernel_width=kernel_width, geo_sigma2_flag=geo_sigma2_flag,
+                         tof_bin=tof_bin, tof_sigma2=tof_sigma2, chunk_size=chunk_size)
+        return sharded_projection(kernel, lors, image, nb_workers, pool)
+    g = _Geometry(grid, center, size, kernel_width)
+    image_flat = np.asarray(image, dtype=np.float32).ravel()
+    result = np.zeros([lors.shape[0]], dtype=np.float32)
+    for s in _chunks(lors.shape[0], g.chunk_size(chunk_size)):
+        sub_lors = lors[s]
+        ilor, index, value = _patches(sub_lors, g, sub_lors[:, 9], geo_sigma2_flag,
+                                      tof_bin, tof_sigma2)
+        result[s] = np.bincount(ilor, value * image_flat[index], minlength=sub_lors.shape[0])
+    return result
+
+
+def tor_backprojection(lors, lors_value, image, grid, center, size, kernel_width,
+                       geo_sigma2_flag, tof_bin, tof_sigma2, chunk_size=None,
+                       nb_workers=None, pool=None):
+    lors = _as_lors(lors)
+    if nb_workers is not None and nb_workers > 1:
+        kernel = partial(tor_backprojection, grid=grid, center=center, size=size,
+                         kernel_width=kernel_width, geo_sigma2_flag=geo_sigma2_flag,
+                         tof_bin=tof_bin, tof_sigma2=tof_sigma2, chunk_size=chunk_size)
+        return sharded_backprojection(kernel, lors, lors_value, image, nb_workers, pool)
+    lors_value = np.asarray(lors_value, dtype=np.float64).ravel()
+    g = _Geometry(grid, center, size, kernel_width)
+    result = np.zeros([np.asarray(image).size], dtype=np.float64)
+    for s in _chunks(lors.shape[0], g.chunk_size(chunk_size)):
+        valid = lors_value[s] > 1e-7
+        if not np.any(valid):
+            continue
+        sub_lors = lors[s][valid]
+        ilor, index, value = _patches(sub_lors, g, sub_lors[:, 9], geo_sigma2_flag,
+                                      tof_bin, tof_sigma2)
+        result += np.bincount(index, value / lors_value[s][valid][ilor], minlength=result.size)
+    return result.astype(np.float32).reshape(np.shape(image))
+
+
+def tor_maplors(lors, lors_value, image, grid, center, size, kernel_width, geo_sigma2_flag,
+                chunk_size=None, nb_workers=None, pool=None):
+    lors = _as_lors(lors)
+    if nb_workers is not None and nb_workers > 1:
+        kernel = partial(tor_maplors, grid=grid, center=center, size=size,
+                         kernel_width=kernel_width, geo_sigma2_flag=geo_sigma2_flag,
+                         chunk_size=chunk_size)
+        return sharded_backprojection(kernel, lors, lors_value, image, nb_workers, pool)
+    lors_value = np.asarray(lors_value, dtype=np.float64).ravel()
+    g = _Geometry(grid, center, size, kernel_width)
+    result = np.zeros([np.asarray(image).size], dtype=np.float64)
+    for s in _chunks(lors.shape[0], g.chunk_size(chunk_size)):
+        sub_lors = lors[s]
+        ilor, index, value = _patches(sub_lors, g, sub_lors[:, 6], geo_sigma2_flag)
+        result += np.bincount(index, value / lors_value[s][ilor], minlength=result.size)
+    return result.astype(np.float32).reshape(np.shape(image))
+
+
+def tor_matrix(lors, grid, center, size, kernel_width, geo_sigma2_flag,
+               tof_bin=None, tof_sigma2=None, chunk_size=None):
+    """ The non-zero system matrix elements of lors, chunk by chunk.
+
+    The sigma2 factor is the last column of both recon and map lors, TOF
+    is applied only when `tof_sigma2` is given (recon lors).
+
+    Yields:
+        ilor: [K] lor index of every element.
+        index: [K] flat voxel index in the (gz, gy, gx) image.
+        value: [K] system matrix value.
+    """
+    lors = _as_lors(lors)
+    g = _Geometry(grid, center, size, kernel_width)
+    for s in _chunks(lors.shape[0], g.chunk_size(chunk_size)):
+        sub_lors = lors[s]
+        ilor, index, value = _patches(sub_lors, g, sub_lors[:, -1], geo_sigma2_flag,
+                                      tof_bin, tof_sigma2)
+        nonzero = value != 0.0
+        yield ilor[nonzero] + s.start, index[nonzero], value[nonzero]
+
+
+class ToROp:
+    """
+    A drop-in replacement of the `tor.so` op module, which runs the NumPy
+    ToR model through `tf.py_func`.
+    The arguments are the same to the custom op, i.e. lors are transposed
+    to the shape of [nb_columns, N].
+    `nb_workers` and `pool` configure the sharded execution of lors.
+    """
+
+    def __init__(self, nb_workers=None, pool=None):
+        self.nb_workers = nb_workers
+        self.pool = pool
+
+    def projection(self, lors, image, grid, center, size, kernel_width, geo_sigma2_flag,
+                   tof_bin, tof_sigma2):
+        lors, image = tf.convert_to_tensor(lors), tf.convert_to_tensor(image)
+
+        def kernel(lors, image):
+            return tor_projection(lors.T, image, grid, center, size, kernel_width,
+                                  geo_sigma2_flag, tof_bin, tof_sigma2,
+                                  nb_workers=self.nb_workers, pool=self.pool)
+        result = tf.py_func(kernel, [lors, image], tf.float32, stateful=False)
+        result.set_shape(lors.shape[1:])
+        return result
+
+    def backprojection(self, image, grid, center, size, lors, lors_value, kernel_width,
+                       geo_sigma2_flag, tof_bin, tof_sigma2):
+        image = tf.convert_to_tensor(image)
+
+        def kernel(image, lors, lors_value):
+            return tor_backprojection(lors.T, lors_value, image, grid, center, size,
+                                      kernel_width, geo_sigma2_flag, tof_bin, tof_sigma2,
+                                      nb_workers=self.nb_workers, pool=self.pool)
+        result = tf.py_func(kernel, [image, lors, lors_value], tf.float32, stateful=False)
+        result.set_shape(image.shape)
+        return result
+
+    def maplors(self, image, grid, center, size, lors, lors_value, kernel_width, geo_sigma2_flag):
+        image = tf.convert_to_tensor(image)
+
+        def kernel(image, lors, lors_value):
+            return tor_maplors(lors.T, lors_value, image, grid, center, size,
+                               kernel_width, geo_sigma2_flag,
+                               nb_workers=self.nb_workers, pool=self.pool)
+        result = tf.py_func(kernel, [image, lors, lors_value], tf.float32, stateful=False)
+        result.set_shape(image.shape)
+        return result
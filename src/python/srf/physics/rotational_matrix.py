@@ -0,0 +1,154 @@
+"""
+Rotational-symmetry compressed system matrix of `CylindricalPET`.
+
+The blocks of a ring are identical and rotated by ib*2*pi/nb_blocks, hence
+the lors starting from block ib are the lors starting from block 0 rotated
+by the same angle. On a `PolarGrid` whose nb_phi is a multiple of
+nb_blocks, this rotation is a cyclic shift of the phi index, thus only the
+matrix of the first block sector is stored (as the CSR shards of
+`srf.physics.sparse_matrix`) and the other sectors are expanded on the fly
+by rolling the image, which cuts the memory by the factor nb_blocks.
+
+The rows of sector k are the sector lors rotated by k*2*pi/nb_blocks, i.e.
+projection data is of shape [nb_blocks, nb_sector_lors].
+"""
+import json
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+from .cpu.polar import PolarGrid, polar_matrix
+from .sparse_matrix import META_FILE, SystemMatrix, _save_matrix
+
+__all__ = ['RotationalSystemMatrix', 'build_rotational_system_matrix', 'polar_to_cartesian']
+
+
+class RotationalSystemMatrix:
+    """
+    Args:
+        sector: `SystemMatrix` of the sector lors on the polar grid.
+        polar_grid: `PolarGrid` of the columns.
+        nb_sectors: number of blocks per ring.
+        weights: [nb_sector_lors] multiplicity of the sector lors in the
+            efficiency map, 0.5 for lors within one ring which are counted
+            twice by the rotation.
+    """
+
+    def __init__(self, sector, polar_grid, nb_sectors, weights=None):
+        if polar_grid.shape[1] % nb_sectors != 0:
+            raise ValueError(f"nb_phi {polar_grid.shape[1]} of the polar grid is not a multiple of"
+                             f" {nb_sectors} sectors.")
+        self.sector = sector
+        self.polar_grid = polar_grid
+        self.nb_sectors = nb_sectors
+        if weights is None:
+            weights = np.ones([sector.shape[0]], dtype=np.float32)
+        self.weights = weights
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        with open(os.path.join(path, META_FILE), 'r') as fin:
+            meta = json.load(fin)
+        polar_grid = PolarGrid(**meta['polar_grid'])
+        weights = np.load(os.path.join(path, 'weights.npy'), mmap_mode=mmap_mode)
+        return cls(SystemMatrix.load(path, mmap_mode), polar_grid, meta['nb_sectors'], weights)
+
+    @property
+    def shape(self):
+        return (self.nb_sectors * self.sector.shape[0], self.sector.shape[1])
+
+    @property
+    def step(self):
+        """ Shift of phi index between two neighbouring sectors. """
+        return self.polar_grid.shape[1] // self.nb_sectors
+
+    def project(self, image):
+        """ Projection of a (nb_r, nb_phi, nb_z) polar image, returns
+        [nb_sectors, nb_sector_lors].
+        """
+        image = np.asarray(image, dtype=np.float32).reshape(self.polar_grid.shape)
+        result = np.zeros([self.nb_sectors, self.sector.shape[0]], dtype=np.float32)
+        for k in range(self.nb_sectors):
+            result[k] = self.sector.project(np.roll(image, -k * self.step, axis=1))
+        return result
+
+    def backproject(self, values):
+        """ Backprojection of `1 / values`, values is of shape
+        [nb_sectors, nb_sector_lors].
+        """
+        values = np.asarray(values).reshape([self.nb_sectors, self.sector.shape[0]])
+        result = np.zeros(self.polar_grid.shape, dtype=np.float32)
+        for k in range(self.nb_sectors):
+            back = self.sector.backproject(values[k]).reshape(self.polar_grid.shape)
+            result += np.roll(back, k * self.step, axis=1)
+        return result
+
+    def efficiency_map(self):
+        """ Backprojection of all lors of the scanner with unit values.
+        """
+        back = np.zeros([self.sector.shape[1]], dtype=np.float32)
+        for s, m in self.sector.shards:
+            back += m.T @ np.asarray(self.weights[s], dtype=np.float32)
+        back = back.reshape(self.polar_grid.shape)
+        return sum(np.roll(back, k * self.step, axis=1) for k in range(self.nb_sectors))
+
+
+def build_rotational_system_matrix(scanner, polar_grid, path, ring_pairs=None, shard_size=None):
+    """ Compute the sector system matrix of a `CylindricalPET` and save it to `path`.
+
+    Args:
+        scanner: `CylindricalPET`.
+        polar_grid: `PolarGrid`, nb_phi must be a multiple of nb_blocks_per_ring.
+        path: cache directory.
+        ring_pairs: list of (ir1, ir2), all ring pairs by default. Rows of
+            every ring pair are recorded as segment f'{ir1}_{ir2}'.
+        shard_size: max number of lors of a shard.
+
+    Returns:
+        The `RotationalSystemMatrix` loaded from `path`.
+    """
+    nb_sectors = scanner.nb_blocks_per_ring
+    if polar_grid.shape[1] % nb_sectors != 0:
+        raise ValueError(f"nb_phi {polar_grid.shape[1]} of the polar grid is not a multiple of"
+                         f" {nb_sectors} blocks per ring.")
+    if ring_pairs is None:
+        ring_pairs = [(ir1, ir2) for ir1 in range(scanner.nb_rings) for ir2 in range(scanner.nb_rings)]
+
+    def elements(lors):
+        return polar_matrix(lors, polar_grid)
+
+    sector_pairs = [(0, ib) for ib in range(1, nb_sectors)]
+    parts, weights = [], []
+    for ir1, ir2 in ring_pairs:
+        lors = scanner.lor_chunks([(ir1, ir2)], sector_pairs)
+        parts.append((f'{ir1}_{ir2}', lors, elements))
+        weights.append(np.full([lors.nb_lors], 0.5 if ir1 == ir2 else 1.0, dtype=np.float32))
+    _save_matrix(path, parts, polar_grid.size, 0.0, shard_size,
+                 nb_sectors=nb_sectors,
+                 polar_grid={'shape': polar_grid.shape,
+                             'radius': polar_grid.radius,
+                             'length': polar_grid.length,
+                             'center_z': polar_grid.center_z})
+    np.save(os.path.join(path, 'weights.npy'), np.concatenate(weights))
+    return RotationalSystemMatrix.load(path)
+
+
+def polar_to_cartesian(polar_grid, grid, center, size, nb_samples=4):
+    """ The [prod(grid), polar_grid.size] resampling matrix from a polar image
+    to the cartesian `Image.data`, by averaging nb_samples^3 points per voxel.
+    """
+    grid, center, size = (np.asarray(v) for v in (grid, center, size))
+    voxel = size / grid
+    offset = (np.arange(nb_samples) + 0.5) / nb_samples
+    points = [center[a] - size[a] / 2 + voxel[a] * (np.arange(grid[a])[:, None] + offset[None, :])
+              for a in range(3)]
+    px, py, pz = np.meshgrid(*[p.ravel() for p in points], indexing='ij')
+    index = polar_grid.index(np.stack([px.ravel(), py.ravel(), pz.ravel()], 1))
+    row = [(np.arange(grid[a] * nb_samples) // nb_samples) for a in range(3)]
+    rx, ry, rz = np.meshgrid(*row, indexing='ij')
+    row = ((rx * grid[1] + ry) * grid[2] + rz).ravel()
+    inside = index >= 0
+    return sp.coo_matrix((np.full([np.count_nonzero(inside)], 1.0 / nb_samples ** 3, dtype=np.float32),
+                          (row[inside], index[inside])),
+                         shape=(int(np.prod(grid)), polar_grid.size)).tocsr()
@@ -0,0 +1,322 @@
+"""
+System matrix of static lor sets, cached on disk as CSR shards.
+
+`build_system_matrix` runs the kernels of a `CompleteLoRsModel` or a
+`SplitLoRsModel` once and writes the ray-voxel intersections to a cache
+directory, `SparseMatrixModel` then replaces the ray tracing of every
+projection/backprojection by sparse matrix-vector products. The layout of
+a cache directory is:
+
+    meta.json           shape, row range of shards and split axes, threshold,
+                        and the identity (source, geometry, model) of the matrix.
+    {k}.data.npy        float32 values of shard k.
+    {k}.indices.npy     column indices of shard k.
+    {k}.indptr.npy      row pointers of shard k.
+
+Rows are lors in the given order (x, y, z lors are concatenated for split
+lors), columns are flat indices of `Image.data`. The `.npy` files are
+memory-mapped when loaded, so a matrix larger than the memory is paged in
+by the OS. `system_matrix_key` hashes the identity, caches of different
+inputs are kept in different directories by it.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import scipy.sparse as sp
+import tensorflow as tf
+
+from srf.data import (Image, ListModeData, ListModeDataWithoutTOF, ListModeDataSplit,
+                      ListModeDataSplitWithoutTOF)
+from srf.model import projection, backprojection
+from srf.utils.config import config_with_name
+from .complete_lors import CompleteLoRsModel
+from .split_lors import SplitLoRsModel
+from .cpu.siddon import siddon_matrix
+from .cpu.tor import tor_matrix
+
+__all__ = ['SystemMatrix', 'build_system_matrix', 'system_matrix_identity', 'system_matrix_key',
+           'SparseMatrixModel']
+
+META_FILE = 'meta.json'
+
+# max number of lors stored in one shard.
+DEFAULT_SHARD_SIZE = 1 << 20
+
+
+class SystemMatrix:
+    """
+    A row-sharded CSR system matrix.
+
+    Args:
+        shards: list of (row_slice, scipy.sparse.csr_matrix).
+        shape: (nb_lors, nb_voxels).
+        segments: optional dict of axis -> (start, stop) rows of split lors.
+        threshold: lors with value not larger than it are skipped in
+            backprojection, same to the op of the model built from.
+        identity: `system_matrix_identity` of the inputs it is built from.
+    """
+
+    def __init__(self, shards, shape, segments=None, threshold=0.0, identity=None):
+        self.shards = shards
+        self.shape = tuple(shape)
+        self.segments = segments
+        self.threshold = threshold
+        self.identity = identity
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        with open(os.path.join(path, META_FILE), 'r') as fin:
+            meta = json.load(fin)
+        shards = []
+        for k, (start, stop) in enumerate(meta['shards']):
+            data, indices, indptr = (np.load(os.path.join(path, f'{k}.{n}.npy'), mmap_mode=mmap_mode)
+                                     for n in ('data', 'indices', 'indptr'))
+            shards.append((slice(start, stop),
+                           sp.csr_matrix((data, indices, indptr),
+                                         shape=(stop - start, meta['shape'][1]), copy=False)))
+        return cls(shards, meta['shape'], meta['segments'], meta['threshold'], meta.get('identity'))
+
+    def check_rows(self, nb_lors, segment=None):
+        """ Raise ValueError if the number of lors (of a split axis) is not the
+        number of rows, lors of unknown number are not checked.
+        """
+        start, stop = (0, self.shape[0]) if segment is None else self.segments[segment]
+        if nb_lors is not None and nb_lors != stop - start:
+            name = 'lors' if segment is None else f'{segment} lors'
+            raise ValueError(f"System matrix has {stop - start} rows of {name}, got {nb_lors} lors.")
+
+    def project(self, image):
+        """ `A @ image`, image is flattened in the order of `Image.data`.
+        """
+        image = np.asarray(image, dtype=np.float32).ravel()
+        result = np.zeros([self.shape[0]], dtype=np.float32)
+        for s, m in self.shards:
+            result[s] = m @ image
+        return result
+
+    def backproject(self, values):
+        """ `A.T @ (1 / values)`, the backprojection of the projection ops.
+        """
+        values = np.asarray(values, dtype=np.float32).ravel()
+        with np.errstate(divide='ignore'):
+            ratio = np.where(values > self.threshold, 1.0 / values, 0.0).astype(np.float32)
+        result = np.zeros([self.shape[1]], dtype=np.float32)
+        for s, m in self.shards:
+            result += m.T @ ratio[s]
+        return result
+
+
+def _complete_lors_elements(model, grid, center, size, with_tof):
+    c, K = model.config, model.KEYS.CONFIG
+    tof = {'tof_bin': c[K.TOF_BIN], 'tof_sigma2': c[K.TOF_SIGMA2]} if with_tof else {}
+    # the op works on the transposed image
+    table = np.arange(np.prod(grid)).reshape(grid).T.ravel()
+
+    def elements(lors):
+        for ilor, index, value in siddon_matrix(lors, grid, center, size, **tof):
+            yield ilor, table[index], value
+    return elements
+
+
+def _split_lors_elements(model, axis, grid, center, size, with_tof):
+    c, K = model.config, model.KEYS
+    tof = {'tof_bin': c[K.TOF_BIN], 'tof_sigma2': c[K.TOF_SIGMA2]} if with_tof else {}
+    perm = model.perm(axis)
+    table = np.transpose(np.arange(np.prod(grid)).reshape(grid), perm).ravel()
+    grid, center, size = (list(np.asarray(v)[perm][::-1]) for v in (grid, center, size))
+
+    def elements(lors):
+        for ilor, index, value in tor_matrix(lors, grid, center, size, c[K.KERNEL_WIDTH],
+                                             c[K.GEO_SIGMA2_FLAG], **tof):
+            yield ilor, table[index], value
+    return elements
+
+
+def _save_shard(path, k, matrix):
+    index_dtype = np.int32 if matrix.nnz < np.iinfo(np.int32).max else np.int64
+    np.save(os.path.join(path, f'{k}.data.npy'), matrix.data.astype(np.float32))
+    np.save(os.path.join(path, f'{k}.indices.npy'), matrix.indices.astype(index_dtype))
+    np.save(os.path.join(path, f'{k}.indptr.npy'), matrix.indptr.astype(index_dtype))
+
+
+def _save_matrix(path, parts, nb_columns, threshold, shard_size=None, **meta):
+    """ Save row parts of (key, lors, elements) as CSR shards, the rows of
+    keyed parts are recorded as segments. lors is an array or `LoRChunks`.
+    """
+    if shard_size is None:
+        shard_size = DEFAULT_SHARD_SIZE
+    os.makedirs(path, exist_ok=True)
+    shards, segments, offset = [], {}, 0
+    for key, part_lors, elements in parts:
+        if hasattr(part_lors, 'nb_lors'):
+            # lazy `LoRChunks`, only the lors of one shard are gathered at once.
+            nb_lors = part_lors.nb_lors
+            lors_range = part_lors.lors
+        else:
+            part_lors = np.asarray(part_lors)
+            nb_lors = part_lors.shape[0]
+            lors_range = lambda start, stop, lors=part_lors: lors[start:stop]
+        for start in range(0, nb_lors, shard_size):
+            sub_lors = lors_range(start, min(start + shard_size, nb_lors))
+            ilor, index, value = (np.concatenate(v) for v in zip(*elements(sub_lors)))
+            matrix = sp.coo_matrix((value, (ilor.astype(np.int64), index.astype(np.int64))),
+                                   shape=(sub_lors.shape[0], nb_columns)).tocsr()
+            matrix.sum_duplicates()
+            _save_shard(path, len(shards), matrix)
+            shards.append([offset + start, offset + start + sub_lors.shape[0]])
+        if key is not None:
+            segments[key] = [offset, offset + nb_lors]
+        offset += nb_lors
+    meta.update({'shape': [offset, nb_columns],
+                 'shards': shards,
+                 'segments': segments or None,
+                 'threshold': threshold})
+    with open(os.path.join(path, META_FILE), 'w') as fout:
+        json.dump(meta, fout)
+
+
+def system_matrix_identity(physical_model, grid, center, size, with_tof=False, source=None):
+    """ The inputs a system matrix is built from, json serializable.
+
+    Args:
+        source: path of the listmode file of the lors, its path, size and
+            modification time are recorded.
+    """
+    if isinstance(physical_model, SplitLoRsModel):
+        c, K = physical_model.config, physical_model.KEYS
+        parameters = {'kernel_width': float(c[K.KERNEL_WIDTH]),
+                      'geo_sigma2_flag': bool(c[K.GEO_SIGMA2_FLAG])}
+    elif isinstance(physical_model, CompleteLoRsModel):
+        c, K = physical_model.config, physical_model.KEYS.CONFIG
+        parameters = {}
+    else:
+        raise TypeError(f"Can not build system matrix of {type(physical_model)}.")
+    if with_tof:
+        parameters.update({'tof_bin': float(c[K.TOF_BIN]), 'tof_sigma2': float(c[K.TOF_SIGMA2])})
+    identity = {'model': type(physical_model).__name__,
+                'parameters': parameters,
+                'with_tof': bool(with_tof),
+                'grid': [int(g) for g in grid],
+                'center': [float(v) for v in center],
+                'size': [float(v) for v in size],
+                'source': None}
+    if source is not None:
+        stat = os.stat(source)
+        identity['source'] = {'path': os.path.abspath(source),
+                              'size': stat.st_size,
+                              'mtime_ns': stat.st_mtime_ns}
+    return identity
+
+
+def system_matrix_key(identity):
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+
+def build_system_matrix(physical_model, lors, grid, center, size, path, with_tof=False,
+                        shard_size=None, source=None):
+    """ Compute the system matrix of a static lor set and save it to `path`.
+
+    Args:
+        physical_model: `CompleteLoRsModel` or `SplitLoRsModel`, the kernel
+            parameters (tof, kernel width, ...) are read from its config.
+        lors: [N, ncols] array or `LoRChunks` for complete lors, or dict of axis -> array
+            (e.g. the result of `map_process`/`recon_process`) for split lors.
+        grid, center, size: geometry of the image.
+        path: cache directory.
+        with_tof: apply the TOF kernel, i.e. matrix of reconstruction instead
+            of efficiency map.
+        shard_size: max number of lors of a shard.
+        source: listmode file of the lors, recorded in the identity.
+
+    Returns:
+        The `SystemMatrix` loaded from `path`.
+    """
+    identity = system_matrix_identity(physical_model, grid, center, size, with_tof, source)
+    if isinstance(physical_model, SplitLoRsModel):
+        lors = {getattr(k, 'name', k): v for k, v in lors.items()}
+        parts = [(a, lors[a], _split_lors_elements(physical_model, a, grid, center, size, with_tof))
+                 for a in physical_model.AXIS]
+        threshold = 1e-7
+    else:
+        parts = [(None, lors, _complete_lors_elements(physical_model, grid, center, size, with_tof))]
+        threshold = 0.0
+    _save_matrix(path, parts, int(np.prod(grid)), threshold, shard_size, identity=identity)
+    return SystemMatrix.load(path)
+
+
+class SparseMatrixModel:
+    """
+    This model uses a cached system matrix built by `build_system_matrix`,
+    the projection and backprojection are sparse matrix-vector products on
+    the memory-mapped shards instead of ray tracing.
+    The projection data must hold the same lors (in the same order) the
+    matrix was built from.
+    """
+
+    class KEYS:
+        PATH = 'path'
+        MMAP_MODE = 'mmap_mode'
+
+    def __init__(self, path, name='sparse_matrix_model', mmap_mode='r'):
+        self.config = config_with_name(name)
+        self.config.update(self.KEYS.PATH, path)
+        self.config.update(self.KEYS.MMAP_MODE, mmap_mode)
+        self._matrix = None
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            self._matrix = SystemMatrix.load(self.config[self.KEYS.PATH],
+                                             self.config[self.KEYS.MMAP_MODE])
+        return self._matrix
+
+    def project(self, image):
+        result = tf.py_func(self.matrix.project, [image], tf.float32, stateful=False)
+        result.set_shape([self.matrix.shape[0]])
+        return result
+
+    def backproject(self, values, image):
+        result = tf.py_func(self.matrix.backproject, [values], tf.float32, stateful=False)
+        return tf.reshape(result, tf.shape(image))
+
+
+def _nb_lors(lors):
+    n = lors.shape[0]
+    n = getattr(n, 'value', n)
+    return None if n is None else int(n)
+
+
+@projection.register(SparseMatrixModel, Image, ListModeData)
+def _(model, image, projection_data):
+    model.matrix.check_rows(_nb_lors(projection_data.lors))
+    return ListModeData(projection_data.lors, model.project(image.data))
+
+
+@projection.register(SparseMatrixModel, Image, ListModeDataSplit)
+def _(model, image, projection_data):
+    for a in SplitLoRsModel.AXIS:
+        model.matrix.check_rows(_nb_lors(projection_data[a].lors), a)
+    result = model.project(image.data)
+    segments = model.matrix.segments
+    return ListModeDataSplit(*[ListModeData(projection_data[a].lors,
+                                            result[segments[a][0]:segments[a][1]])
+                               for a in SplitLoRsModel.AXIS])
+
+
+def _backprojection(model, projection_data, image):
+    result = model.backproject(tf.reshape(projection_data.values, [-1]), image.data)
+    return Image(result, image.center, image.size)
+
+
+def _backprojection_split(model, projection_data, image):
+    values = tf.concat([tf.reshape(projection_data[a].values, [-1]) for a in SplitLoRsModel.AXIS], 0)
+    result = model.backproject(values, image.data)
+    return Image(result, image.center, image.size)
+
+
+backprojection.register(SparseMatrixModel, ListModeData, Image)(_backprojection)
+backprojection.register(SparseMatrixModel, ListModeDataWithoutTOF, Image)(_backprojection)
+backprojection.register(SparseMatrixModel, ListModeDataSplit, Image)(_backprojection_split)
+backprojection.register(SparseMatrixModel, ListModeDataSplitWithoutTOF, Image)(_backprojection_split)
@@ -4,6 +4,7 @@ from srf.model import projection, backprojection
 from srf.utils.config import config_with_name
 from srf.data import ListModeDataSplit, ListModeDataSplitWithoutTOF, Image, ListModeData
 from dxl.learn.tensor import transpose
+from srf.physics.cpu import ToROp
 import os
 
 # load op
@@ -29,27 +30,50 @@ class SplitLoRsModel:
     """
     This model provides support to the models (typically for tor model) using split lors.
     In these model, lors are split into group and processed respectively.
+
+    The backend decides which implementation computes the tor kernel:
+    'gpu' loads the `tor.so` custom op, while 'cpu' runs the NumPy
+    implementation in `srf.physics.cpu`, which shards the lors over
+    `nb_workers` workers of a 'thread' or 'process' pool when given.
     """
 
     AXIS = ('x', 'y', 'z')
+    BACKENDS = ('gpu', 'cpu')
 
     class KEYS:
         KERNEL_WIDTH = 'kernel_width'
         TOF_BIN = 'tof_bin'
         TOF_SIGMA2 = 'tof_sigma2'
         GEO_SIGMA2_FLAG = 'geo_sigma2_flag'
+        BACKEND = 'backend'
+        NB_WORKERS = 'nb_workers'
+        POOL = 'pool'
 
-    def __init__(self, kernel_width, geo_sigma2_flag=False, tof_sigma2=None, tof_bin=None, name='split_lor_model'):
+    def __init__(self, kernel_width, geo_sigma2_flag=False, tof_sigma2=None, tof_bin=None, name='split_lor_model',
+                 backend=None, nb_workers=None, pool=None):
         if tof_bin is None:
             tof_bin = 1.0e4
         if tof_sigma2 is None:
             tof_sigma2 = 1.0e4
+        if backend is None:
+            backend = 'gpu'
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of {self.BACKENDS}.")
         self.config = config_with_name(name)
         self.config.update(self.KEYS.KERNEL_WIDTH, kernel_width)
         # print("debug, ", geo_sigma2_flag)
         self.config.update(self.KEYS.GEO_SIGMA2_FLAG, geo_sigma2_flag)
         self.config.update(self.KEYS.TOF_SIGMA2, tof_sigma2)
         self.config.update(self.KEYS.TOF_BIN, tof_bin)
+        self.config.update(self.KEYS.BACKEND, backend)
+        self.config.update(self.KEYS.NB_WORKERS, nb_workers)
+        self.config.update(self.KEYS.POOL, pool)
+
+    @property
+    def op(self):
+        if self.config[self.KEYS.BACKEND] == 'cpu':
+            return ToROp(self.config[self.KEYS.NB_WORKERS], self.config[self.KEYS.POOL])
+        return Op.get_module()
 
     @classmethod
     def perm(cls, axis):
@@ -77,7 +101,7 @@ def _(model, image, projection_data):
     for a in model.AXIS:
     # for a in ('x','y'):
         image_axis = transpose(image, model.perm(a))
-        result[a] = Op.get_module().projection(
+        result[a] = model.op.projection(
             lors=transpose(projection_data[a].lors),
             image=image_axis.data,
             grid=list(image_axis.grid[::-1]),
@@ -98,7 +122,7 @@ def _(model, projection_data, image):
         image_axis = transpose(image, model.perm(a))
         # print(transpose(projection_data[a].lors))
         # print(projection_data[a].lors)
-        backproj = Op.get_module().backprojection(
+        backproj = model.op.backprojection(
             image=image_axis.data,
             grid=list(image_axis.grid[::-1]),
             center=list(image_axis.center[::-1]),
@@ -120,7 +144,7 @@ def _(model, projection_data, image):
     for a in model.AXIS:
     # for  a in ['x', 'z']:
         image_axis = transpose(image, model.perm(a))
-        backproj = Op.get_module().maplors(
+        backproj = model.op.maplors(
             image=image_axis.data,
             grid=list(image_axis.grid[::-1]),
             center=list(image_axis.center[::-1]),
@@ -7,7 +7,7 @@ class PSFMaker():
     '''
     A collection of the psf matrix creating process,
     Input the fitted xy and z kernel parameter(.h5 file with dict)
-    Output a xy sparse .mat and a z dense .npy.
+    Output a xy sparse .npz (see `srf.io.psf`, or .mat by its suffix) and a z dense .npy.
     '''
 
     def __init__(self):
@@ -94,34 +94,100 @@ class PSFMaker():
         return img_r
 
     @classmethod
-    def make_xy_kernel(cls, xmesh, ymesh, grid, x_range, kernel_samples, epsilon=1e-4):
+    def make_xy_kernel(cls, xmesh, ymesh, grid, x_range, kernel_samples, epsilon=1e-4,
+                       angle_step=None, nb_workers=1):
+        '''
+        Make the COO triplets of the xy kernel matrix, row (j + i*ny) is the
+        kernel of pixel (i, j), i.e. the kernel sample of its radius rotated by
+        its polar angle.
+
+        The kernel of a pixel only depends on its (radius index, angle), every
+        distinct one is rotated once. An angle is reduced to [0, 90) by the
+        exact 90 degree rotations of the uncropped rotated image, and to
+        [0, 45] by the transpose if the sample is symmetric in y.
+
+        Args:
+            angle_step: quantize the reduced angles to multiples of angle_step
+                (degree), None for the exact angles.
+            nb_workers: number of processes rotating the kernels.
+
+        Returns:
+            [3, nnz] array of row, col, data.
+        '''
         rmesh, pmesh = cls().make_polargrid(xmesh, ymesh)
-        # import time
         nx, ny = grid[0], grid[1]
-        row, col, data = [], [], []
-        # start = time.time()
         kernel_max = cls().find_xy_kernel_max_sum(kernel_samples)
-        from tqdm import tqdm
-        for i in tqdm(range(nx)):
-            for j in range(ny):
-                irow = j + i*ny
-                ir, ip = rmesh[i, j], pmesh[i, j]
-                original_kernel = cls().locate_kernel(kernel_samples, x_range, ir)
-                kernel = cls().rotate_kernel(original_kernel, ip)
-                kernel = kernel/kernel_max
-                kernel[kernel < epsilon] = 0.0
-                kernel_flat = kernel.reshape((-1))
-                from scipy import sparse
-                spa_kernel = sparse.coo_matrix(kernel_flat)
-                nb_ele = spa_kernel.data.size
-                if nb_ele > 0:
-                    row = np.append(row, [irow]*nb_ele)
-                    col = np.append(col, spa_kernel.col)
-                    data = np.append(data, spa_kernel.data)
-        return np.array([row, col, data])
+        nb_samples = kernel_samples.shape[2]
+        indices = np.round(rmesh / (x_range / (nb_samples - 1))).astype(np.int64).ravel()
+        angles = (pmesh % 360).ravel()
+        if nx == ny:
+            turns = np.minimum(angles // 90, 3).astype(np.int64)
+            angles = angles - 90 * turns
+        else:
+            turns = np.zeros_like(indices)
+        symmetric = np.array([np.allclose(kernel_samples[:, :, k], kernel_samples[:, ::-1, k])
+                              for k in range(nb_samples)])
+        transposed = np.zeros_like(indices, dtype=bool)
+        if nx == ny:
+            in_range = indices < nb_samples
+            transposed[in_range] = symmetric[indices[in_range]] & (angles[in_range] > 45)
+            angles = np.where(transposed, 90 - angles, angles)
+        if angle_step is not None:
+            angles = np.round(angles / angle_step) * angle_step
+        else:
+            # symmetric pixels differ in the last bits of their angles
+            angles = np.round(angles, 9)
+
+        # distinct kernels, pixels out of the sample domain have no kernel
+        valid = np.flatnonzero(indices < nb_samples)
+        if valid.size == 0:
+            return np.empty([3, 0])
+        keys, key_ids = np.unique(np.stack([indices[valid], angles[valid]], axis=1),
+                                  axis=0, return_inverse=True)
+        key_ids = key_ids.ravel()
+        jobs = [(kernel_samples[:, :, int(k)], a, kernel_max, epsilon) for k, a in keys]
+        if nb_workers > 1:
+            import multiprocessing
+            # spawn, forking a process which has loaded TensorFlow may deadlock
+            with multiprocessing.get_context('spawn').Pool(nb_workers) as pool:
+                rotated = pool.map(_rotated_kernel_entries, jobs, chunksize=max(1, len(jobs) // (4 * nb_workers)))
+        else:
+            rotated = [_rotated_kernel_entries(j) for j in jobs]
+
+        # entries of every (kernel, turns, transposed) in the cropped frame
+        variants, variant_ids = np.unique(np.stack([key_ids, turns[valid], transposed[valid]], axis=1),
+                                          axis=0, return_inverse=True)
+        variant_ids = variant_ids.ravel()
+        cols, values = [], []
+        for key_id, turn, transpose in variants:
+            shape, a, c, v = rotated[key_id]
+            if transpose:
+                a, c, shape = c, a, shape[::-1]
+            for _ in range(turn):
+                # np.rot90: A[a, c] -> B[S1 - 1 - c, a]
+                a, c, shape = shape[1] - 1 - c, a, shape[::-1]
+            a = a - int(np.round((shape[0] - nx) / 2))
+            c = c - int(np.round((shape[1] - ny) / 2))
+            inside = (a >= 0) & (a < nx) & (c >= 0) & (c < ny)
+            cols.append(a[inside] * ny + c[inside])
+            values.append(v[inside])
+        counts = np.array([c.size for c in cols], dtype=np.int64)
+        starts = np.concatenate([[0], np.cumsum(counts)])[:-1]
+        cols, values = np.concatenate(cols), np.concatenate(values)
+
+        # gather the entries of every pixel into preallocated triplets
+        pixel_counts = counts[variant_ids]
+        nnz = int(pixel_counts.sum())
+        offsets = np.repeat(np.cumsum(pixel_counts) - pixel_counts, pixel_counts)
+        gather = np.repeat(starts[variant_ids], pixel_counts) + np.arange(nnz) - offsets
+        result = np.empty([3, nnz])
+        result[0] = np.repeat(valid, pixel_counts)
+        result[1] = cols[gather]
+        result[2] = values[gather]
+        return result
 
     @classmethod
-    def compute_sample_kernels(cls, kernel_array, xmesh, ymesh):
+    def compute_sample_kernels(cls, kernel_array, xmesh, ymesh, chunk_size=None):
         '''
         Compute the all the kernel images of sample points. 
 
@@ -129,24 +195,25 @@ class PSFMaker():
             kernel_para: kernel parameters to decide the distribution.
             xmesh: the meshgrid in x axis
             ymesh: the meshgrid in y axis
+            chunk_size: max number of samples evaluated at once, which bounds
+                the temporaries, None for all the samples.
 
         Returns:
-
+            [nx, ny, nb_samples] float32 kernel images.
         '''
+        kernel_array = np.asarray(kernel_array, dtype=np.float32)
         nb_samples = len(kernel_array)
         grid = xmesh.shape
-        kernel_images = np.zeros((grid[0], grid[1], nb_samples))
-        from tqdm import tqdm
-        for k in tqdm(range(nb_samples)):
-            a = kernel_array[k, 0]
-            ux = kernel_array[k, 1]
-            sigx = kernel_array[k, 2]
-            uy = kernel_array[k, 3]
-            sigy = kernel_array[k, 4]
-            for i in range(grid[0]):
-                for j in range(grid[1]):
-                    kernel_images[i, j, k] = a*np.exp(-(xmesh[i, j]-ux)**2/(
-                        2*sigx**2)-(ymesh[i, j]-uy)**2/(2*sigy**2))
+        if chunk_size is None:
+            chunk_size = max(nb_samples, 1)
+        xmesh = np.asarray(xmesh, dtype=np.float32)[:, :, None]
+        ymesh = np.asarray(ymesh, dtype=np.float32)[:, :, None]
+        kernel_images = np.empty((grid[0], grid[1], nb_samples), dtype=np.float32)
+        for start in range(0, nb_samples, chunk_size):
+            a, ux, sigx, uy, sigy = kernel_array[start:start + chunk_size].T
+            out = kernel_images[:, :, start:start + chunk_size]
+            np.exp(-(xmesh - ux) ** 2 / (2 * sigx ** 2) - (ymesh - uy) ** 2 / (2 * sigy ** 2), out=out)
+            out *= a
         return kernel_images
 
     @classmethod
@@ -212,7 +279,8 @@ class PSFMaker():
         # raise DeprecationWarning("this function is going to be deprecated")
 
     @classmethod
-    def xy_main(cls, kernel_para_dict: dict,  grid: list, voxsize: list, refined_factor: int, output_mat_dir):
+    def xy_main(cls, kernel_para_dict: dict,  grid: list, voxsize: list, refined_factor: int, output_mat_dir,
+                angle_step=None, nb_workers=1):
         # step1: generate kernel array
         # print(type(kernel_para_dict))
         kernel_array = cls().preprocess_xy_para(kernel_para_dict, grid, voxsize)
@@ -227,7 +295,8 @@ class PSFMaker():
         # kernel_samples = np.load(output_kernel_dir)
 
         kernel = cls().make_xy_kernel(xmesh, ymesh, grid,
-                                      x_range, kernel_samples, epsilon=1e-4)
+                                      x_range, kernel_samples, epsilon=1e-4,
+                                      angle_step=angle_step, nb_workers=nb_workers)
         row, col, data = kernel[0], kernel[1], kernel[2]
         row = row.astype(int)
         col = col.astype(int)
@@ -236,21 +305,23 @@ class PSFMaker():
             grid[0]*grid[1], grid[0]*grid[1]), dtype=np.float32)
         # print(kernel_xy.size)
 
-        import scipy.io as sio
-        sio.savemat(output_mat_dir, {'matrix': kernel_xy})
+        if str(output_mat_dir).endswith('.mat'):
+            import scipy.io as sio
+            sio.savemat(output_mat_dir, {'matrix': kernel_xy})
+        else:
+            from srf.io.psf import save_psf_xy
+            save_psf_xy(output_mat_dir, kernel_xy, grid, voxsize)
         print(f'siddon kernel_xy size = {kernel_xy.size}')
 
     @classmethod
     def compute_z_sample_kernels(cls, kernel_samples, grid_z, zmesh):
+        kernel_samples = np.asarray(kernel_samples, dtype=np.float32)
         nb_samples = len(kernel_samples)
         kernel_z = np.zeros((grid_z, grid_z), dtype=np.float32)
-        for k in range(nb_samples):
-            az = kernel_samples[k, 0]
-            uz = kernel_samples[k, 1]
-            sigz = kernel_samples[k, 2]
-            for i in range(grid_z):
-                kernel_z[i, k] = az*np.exp(-(zmesh[i]-uz)**2/(2*sigz**2))
-        
+        az, uz, sigz = kernel_samples.T
+        zmesh = np.asarray(zmesh, dtype=np.float32)[:, None]
+        kernel_z[:, :nb_samples] = az * np.exp(-(zmesh - uz) ** 2 / (2 * sigz ** 2))
+
         kernel_max =cls().find_z_kernel_max_sum(kernel_z)
         return kernel_z/kernel_max
 
@@ -307,7 +378,8 @@ class PSFMaker():
     def run(cls, kernel_xy_para_dir, kernel_z_para_dir,
             grid: list, voxsize: list, refined_factor,
             output_mat_dir: str, output_kernel_dir: str,
-            map_file:str, psf_map_file:str, epsilon:float):
+            map_file:str, psf_map_file:str, epsilon:float,
+            angle_step=None, nb_workers=1):
         from srf.io.listmode import load_h5
         grid = np.array(grid)
         voxsize = np.array(voxsize) 
@@ -315,7 +387,8 @@ class PSFMaker():
         kernel_z_dict = load_h5(kernel_z_para_dir)
         print("step 1/3: making xy kernel...")
         cls().xy_main(kernel_xy_dict,
-                      grid[0:2], voxsize[0:2], refined_factor, output_mat_dir)
+                      grid[0:2], voxsize[0:2], refined_factor, output_mat_dir,
+                      angle_step, nb_workers)
         
         print("step 2/3: making z kernel...")
         cls().z_main(kernel_z_dict, grid[2], voxsize[2], output_kernel_dir)
@@ -325,11 +398,8 @@ class PSFMaker():
 
     @classmethod
     def map_process(cls, xy_mat_dir, z_dense_dir, map_file, psf_map_file, epsilon):
-        import scipy.io as sio
-        from scipy import sparse
-        kernel_xy = sparse.coo_matrix(sio.loadmat(xy_mat_dir)['matrix'])
-        # print(kernel_xy)
-        kernel_z = np.load(z_dense_dir)
+        from srf.io.psf import load_psf
+        kernel_xy, kernel_z = load_psf(xy_mat_dir, z_dense_dir)
         # plt.figure(figsize = (16,16))
         # plt.imshow(kernel_z)
         # plt.colorbar()
@@ -347,9 +417,8 @@ class PSFMaker():
         effmap_reshaped = effmap.reshape((-1, grid[2]))
 
         z_effmap = np.matmul(effmap_reshaped, kernel_z)
-        # kernel_xy transpose
-        kernel_xy = sparse.coo_matrix((kernel_xy.data,(kernel_xy.col, kernel_xy.row)), 
-                                    shape = (grid[0]*grid[1], grid[0]*grid[1]), dtype = np.float32)
+        # kernel_xy transpose, a view of the loaded matrix
+        kernel_xy = kernel_xy.T
 
         # print(kernel_xy)
         psf_effmap = kernel_xy.dot(z_effmap)
@@ -378,3 +447,18 @@ class PSFMaker():
 
         # np.save('exp_short_siddon_map_psfz.npy', z_effmap)
         np.save(psf_map_file, psf_effmap)
+
+
+def _rotated_kernel_entries(job):
+    '''
+    Entries of a kernel rotated by angle before cropping, normalized and
+    thresholded the same as `PSFMaker.make_xy_kernel`.
+
+    Returns:
+        (shape, rows, cols, values) of the uncropped rotated kernel.
+    '''
+    from scipy import ndimage
+    kernel_image, angle, kernel_max, epsilon = job
+    rotated = ndimage.rotate(kernel_image, angle) / kernel_max
+    a, c = np.nonzero(rotated >= epsilon)
+    return rotated.shape, a, c, rotated[a, c]
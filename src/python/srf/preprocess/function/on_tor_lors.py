@@ -134,36 +134,27 @@ class SquareOf(WrappedFunction):
         return SliceByAxis(self.axis)(arr) ** 2
 
 
-def sigma2_factor(lors):
+def sigma2_factor(lors, out=None):
     """compute the variable tor kernel sigma factor square.
 
     The sigma factor is used to provide a shift-variant tor kernel.
-    A single lor 
+    It is computed in the dtype of lors, with column temporaries only.
 
     """
-    # p_diff = direction(lors)
-    # p_dis2 = np.sum(np.square(p_diff), 1)
-    # p0, p1 = HitOfIndex(0)(lors), HitOfIndex(1)(lors)
-
-    # def square_sum(arr):
-    #     return SquareOf(Axis.x)(arr) + SquareOf(Axis.y)(arr)
-
-    # dsq = square_sum(p_diff)
-    # Rsq = square_sum(p0) + square_sum(p1)
-    # return dsq ** 2 / Rsq / p_dis2 / 2
-    p_start = lors[:, 0:3]
-    p_end = lors[:, 3:6]
-    x_start = p_start[:, 0]
-    x_end = p_end[:, 0]
-    y_start = p_start[:, 1]
-    y_end = p_end[:, 1]
-    
-    p_diff = p_end - p_start
-    p_dis2 = np.sum(np.square(p_diff), 1)
-    dsq = p_diff[:, 0]**2 + p_diff[:, 1]**2
-    Rsq = x_start**2+x_end **2 + y_start**2 + y_end**2    
-    sigma2_factor = dsq**2/Rsq/p_dis2/2
-    return sigma2_factor
+    # dsq ** 2 / Rsq / p_dis2 / 2, where dsq is the squared xy length of the lor,
+    # Rsq the sum of squared xy radius of the two points and p_dis2 the squared length.
+    p_diff = direction(lors)
+    dsq = np.square(p_diff[:, 0])
+    dsq += np.square(p_diff[:, 1])
+    p_dis2 = np.square(p_diff[:, 2])
+    p_dis2 += dsq
+    rsq = np.square(lors[:, 0])
+    for c in (1, 3, 4):
+        rsq += np.square(lors[:, c])
+    rsq *= p_dis2
+    rsq *= 2
+    np.square(dsq, out=dsq)
+    return np.divide(dsq, rsq, out=out)
 
 
 def partition3(lors):
@@ -201,36 +192,41 @@ class CutLoRs(WrappedFunction):
         self.f = self.kernel
 
     def kernel(self, lors):
-        p_diff = direction(lors)
-        p_dis = arr_norm(p_diff)
-
-        dcos = np.array(
-            [p_diff[:, a.value] / p_dis for a in Axis]).T.reshape((-1, 3))
-
-        ratio = np.array(0.5 - (tof(lors) / p_dis))
-
-        p0 = HitOfIndex(0)(lors)
-        p1 = HitOfIndex(1)(lors)
-        lor_center = np.array([ratio * p_diff[:, a.value]
-                               for a in Axis]).T + p0
-
-        dcs = arr_norm(lor_center - p0)
-        if self.tof_res <10000:
-            print(f"with tof of {self.tof_res} ps.")
-            GAUSSIAN_FACTOR = 2.35482005
-            limit = self.tof_res* 0.15 / GAUSSIAN_FACTOR * 3
-            index = dcs > limit
-            p0[index] = lor_center[index] - limit * dcos[index, :]
-            p1[index] = lor_center[index] + limit * dcos[index, :]
-        return np.hstack((np.array(p0),
-                          np.array(p1),
-                          np.array(lor_center),
-                          np.array(extra(lors))
-                          ))
+        result = np.empty([lors.shape[0], lors.shape[1] + 2], dtype=np.float32)
+        result[:, 0:7] = lors[:, 0:7]
+        result[:, 9:] = extra(lors)
+        return cut_lors(result, self.tof_res)
+
+
+def cut_lors(lors, tof_res):
+    """cut the lors (p0, p1, tof, -, -, ...) by the tof kernel in place.
+
+    The columns 6:9 are replaced by the lor center, the points are moved to
+    the limit of the tof kernel if they are further from the center.
+    """
+    p0, p1 = HitOfIndex(0)(lors), HitOfIndex(1)(lors)
+    p_diff = direction(lors)
+    p_dis = arr_norm(p_diff)
+    ratio = 0.5 - tof(lors) / p_dis
+    lor_center = lors[:, 6:9]
+    np.multiply(ratio[:, None], p_diff, out=lor_center)
+    lor_center += p0
+    if tof_res < 10000:
+        GAUSSIAN_FACTOR = 2.35482005
+        limit = tof_res * 0.15 / GAUSSIAN_FACTOR * 3
+        # distance of the center to p0 is |ratio| * p_dis
+        index = np.abs(ratio) * p_dis > limit
+        dcos = p_diff[index] * (limit / p_dis[index])[:, None]
+        p0[index] = lor_center[index] - dcos
+        p1[index] = lor_center[index] + dcos
+    return lors
 
 
 def compute_sigma2_factor_and_append(lors):
-    return np.hstack([lors, np.expand_dims(sigma2_factor(lors), 1)])
+    result = np.empty([lors.shape[0], lors.shape[1] + 1], dtype=lors.dtype)
+    result[:, :-1] = lors
+    sigma2_factor(lors, out=result[:, -1])
+    return result
 
 
 @func(nargs=1, nouts=1)
@@ -238,25 +234,87 @@ def func_on(a: Axis):
     return Partition(a) >> SwapPointsOrder(a)
 
 
+# p0, p1, lor center, sigma2 factor
+NB_TOR_COLUMNS = 10
+
+# position columns of a point in the tor op order, the dominant axis is the last one.
+POINT_PERMUTATION = {Axis.x: [1, 2, 0], Axis.y: [0, 2, 1], Axis.z: [0, 1, 2]}
+
+
+def dominant_axis(lors):
+    """ [N] index of the dominant axis of lors, ties are broken in the order of x, y, z,
+    same to `dominentBy`.
+    """
+    return np.argmax(np.abs(direction(lors)), 1)
+
+
+def partition_by_axis(lors, out=None, negate_tof=None):
+    """partition the lors into three groups according to the dominent direction in one pass.
+
+    The lors of a group keep their input order, the ones of positive direction on
+    the dominant axis first, and the points of the others are swapped (with the
+    tof column negated if negate_tof, by default if there are more than 7 columns),
+    same to `func_on(a)(lors)` for every axis a.
+
+    Args:
+        out: optional [N, M] array with M >= lors.shape[1], the reordered lors
+            are written to its first columns.
+
+    Returns:
+        dict of Axis -> views of one reordered copy of lors (or of out).
+    """
+    if negate_tof is None:
+        negate_tof = lors.shape[1] > 7
+    axis = dominant_axis(lors)
+    negative = lors[np.arange(lors.shape[0]), axis + 3] < lors[np.arange(lors.shape[0]), axis]
+    key = (2 * axis + negative).astype(np.int8)
+    order = np.argsort(key, kind='stable')
+    if out is None:
+        result = lors[order]
+    else:
+        # gathered column by column, the temporary is a single column.
+        result = out
+        for c in range(lors.shape[1]):
+            result[:, c] = lors[order, c]
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(key, minlength=6))])
+
+    swapped = result[offsets[1]:offsets[2]], result[offsets[3]:offsets[4]], result[offsets[5]:offsets[6]]
+    for group in swapped:
+        p0 = group[:, 0:3].copy()
+        group[:, 0:3] = group[:, 3:6]
+        group[:, 3:6] = p0
+        if negate_tof:
+            group[:, 6] *= -1
+    return {a: result[offsets[2 * a.value]:offsets[2 * a.value + 2]] for a in Axis}
+
+
+def permute_points(lors3, nb_points):
+    """permute the position columns of the first nb_points points of every group in place.
+    """
+    for a, lors in lors3.items():
+        if a == Axis.z:
+            continue
+        columns = [3 * i + c for i in range(nb_points) for c in POINT_PERMUTATION[a]]
+        lors[:, 0:3 * nb_points] = lors[:, columns]
+    return lors3
 
 
 def map_process(lors):
     lors = compute_sigma2_factor_and_append(lors)
-    lors3 = {a: func_on(a)(lors) for a in Axis}
-    lors3[Axis.x][:, 0:6] = lors3[Axis.x][:, [1, 2, 0, 4, 5, 3]]
-    lors3[Axis.y][:, 0:6] = lors3[Axis.y][:, [0, 2, 1, 3, 5, 4]]
-    return lors3
+    return permute_points(partition_by_axis(lors), 2)
 
 
 def recon_process(lors, tof_res):
-    # if limit == None:
-        # limit = 30000
+    """preprocess [N, 7] (p0, p1, tof) lors for ToR reconstruction.
 
-    lors = compute_sigma2_factor_and_append(lors)
-    lors3 = {a: func_on(a)(lors) for a in Axis}
+    The float32 [N, 10] (p0, p1, lor center, sigma2 factor) result is
+    allocated once, partition, swap, sigma2 factor and cut are done in place.
 
-    lors3 = {a: CutLoRs(tof_res)(lors3[a]) for a in Axis}
-    lors3[Axis.x][:, 0:9] = lors3[Axis.x][:, [1, 2, 0, 4, 5, 3, 7, 8, 6]]
-    lors3[Axis.y][:, 0:9] = lors3[Axis.y][:, [0, 2, 1, 3, 5, 4, 6, 8, 7]]
-    # print('!!!!!!!!!!!!!!!! The shape of tor recon lors is :',lors3[Axis.x].shape)
-    return lors3
+    Returns:
+        dict of Axis -> views of the result.
+    """
+    result = np.empty([lors.shape[0], NB_TOR_COLUMNS], dtype=np.float32)
+    lors3 = partition_by_axis(lors[:, 0:7], out=result, negate_tof=True)
+    sigma2_factor(result, out=result[:, 9])
+    cut_lors(result, tof_res)
+    return permute_points(lors3, 3)
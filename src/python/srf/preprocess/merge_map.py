@@ -1,47 +1,87 @@
-import time
-
 import numpy as np
 
 from srf.scanner.pet.block import RingBlock
 
 
-def merge_effmap(scanner, grid, center, size, z_factor, crop_ratio, path, merge_effmap_file):
+class EffmapMerger:
+    """
+    Accumulate effmaps of ring pairs into one float32 image.
+
+    The image is a memory-mapped `.npy` file when `filename` is given, all
+    the effmaps are added in place, so only one effmap is loaded at a time.
+    The effmaps are of (x, y, z) layout.
+    """
+
+    def __init__(self, grid, filename=None):
+        grid = tuple(int(g) for g in grid)
+        if filename is None:
+            self.result = np.zeros(grid, dtype=np.float32)
+        else:
+            self.result = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float32, shape=grid)
+            self.result[...] = 0.0
+
+    def add(self, effmap, nb_shifts=1, shift=1, weight=1.0):
+        """ Add `weight * effmap` shifted by 0, shift, ..., (nb_shifts - 1) * shift
+        slices along z.
+
+        The shifted sum is a box filter along z, computed by the difference of
+        a cumulative sum with stride `shift`.
+        """
+        effmap = np.asarray(effmap, dtype=np.float32)
+        nb_z = effmap.shape[2]
+        if nb_shifts == 1:
+            self.result += weight * effmap
+            return
+        # pad z to a multiple of shift, and cumsum along every residue of z mod shift.
+        nb_blocks = -(-nb_z // shift)
+        cumsum = np.zeros(effmap.shape[:2] + (nb_blocks * shift,), dtype=np.float32)
+        cumsum[:, :, :nb_z] = effmap
+        cumsum = cumsum.reshape(effmap.shape[:2] + (nb_blocks, shift))
+        np.cumsum(cumsum, axis=2, out=cumsum)
+        cumsum = cumsum.reshape(effmap.shape[:2] + (nb_blocks * shift,))[:, :, :nb_z]
+        width = nb_shifts * shift
+        box = cumsum.copy()
+        if width < nb_z:
+            box[:, :, width:] -= cumsum[:, :, :nb_z - width]
+        box *= weight
+        self.result += box
+
+    def flush(self):
+        if isinstance(self.result, np.memmap):
+            self.result.flush()
+
+
+def _load(path, filename):
+    return np.load(path + filename, mmap_mode='r')
+
+
+def _npy(filename):
+    return filename if filename.endswith('.npy') else filename + '.npy'
+
+
+def merge_effmap(scanner, grid, center, size, z_factor, crop_ratio, path, merge_effmap_file,
+                 effmaps=None):
     """
-    to do: implemented in GPU to reduce the calculated time
+    merge the effmaps of ring pairs (0, ir) by the translation along z.
+
+    Args:
+        effmaps: optional iterable of ((0, ir), effmap) pairs, e.g. from
+            `EffmapRunner.compute`, instead of the `effmap_{ir}.npy` files.
     """
-    temp = np.load(path + 'effmap_{}.npy'.format(0)).T
-    nb_image_layers = int(temp.shape[0])
-    final_map = np.zeros(temp.shape)
-    print(final_map.shape)
-    st = time.time()
     nb_rings = scanner.nb_rings
-    for ir in range(nb_rings):
-        temp = np.load(path + 'effmap_{}.npy'.format(ir)).T
-        print("process :{}/{}".format(ir + 1, nb_rings))
-        for jr in range(nb_rings - ir):
-            if ir == 0:
-                final_map[jr:nb_image_layers, :, :] += temp[0:nb_image_layers - jr, :, :]
-            else:
-                final_map[jr:nb_image_layers, :, :] += temp[0:nb_image_layers - jr, :, :]
-        et = time.time()
-        tr = (et - st) / (nb_rings * (nb_rings - 1) / 2 - (nb_rings - ir - 1) * (
-                nb_rings - ir - 2) / 2) * ((nb_rings - ir - 1) * (nb_rings - ir - 2) / 2)
-        print("time used: {} seconds".format(et - st))
-        print("estimated time remains: {} seconds".format(tr))
+    if effmaps is None:
+        effmaps = (((0, ir), _load(path, 'effmap_{}.npy'.format(ir))) for ir in range(nb_rings))
+    merger = EffmapMerger(grid, path + _npy(merge_effmap_file))
+    for (_, ir), effmap in effmaps:
+        merger.add(effmap, nb_shifts=nb_rings - ir)
 
     # normalize the max value of 
     # the map to 1.
-    # cut_start = int((nb_image_layers-nb_rings*z_factor)/2)
-    # final_map = final_map[cut_start:nb_image_layers-cut_start,:,:]
-
-    final_map = crop_image(scanner, final_map.T, grid, center, size, crop_ratio)
-
-    final_map = final_map / np.max(final_map)
+    final_map = crop_image(scanner, merger.result, grid, center, size, crop_ratio)
+    final_map /= np.max(final_map)
     final_map[final_map <= 1e-6] = 0
     final_map[final_map > 1e-6] = 1 / final_map[final_map > 1e-6]
-
-    # final_map = final_map.T
-    np.save(path+merge_effmap_file, final_map)
+    merger.flush()
 
 
 def crop_image(scanner, image, grid, center, size, crop_ratio):
@@ -65,27 +105,65 @@ def crop_image(scanner, image, grid, center, size, crop_ratio):
     return image.reshape((grid[0], grid[1], grid[2]))
 
 
-def merge_effmap_full(scanner, grid, center, size, z_factor, crop_ratio, path):
+def merge_effmap_full(scanner, grid, center, size, z_factor, crop_ratio, path, effmaps=None):
     """
-    to do: implemented in GPU to reduce the calculated time
+    merge the effmaps of all ring pairs.
+
+    Args:
+        effmaps: optional iterable of ((ir1, ir2), effmap) pairs, e.g. from
+            `EffmapRunner.compute`, instead of the `effmap/effmap_{ir1}_{ir2}.npy`
+            files.
     """
-    temp = np.load(path + './effmap/effmap_0_0.npy').T
-    final_map = np.zeros(temp.shape)
-    print(final_map.shape)
-    st = time.time()
     nb_rings = scanner.nb_rings
+    if effmaps is None:
+        effmaps = (((ir1, ir2), _load(path, f'./effmap/effmap_{ir1}_{ir2}.npy'))
+                   for ir1 in range(nb_rings) for ir2 in range(nb_rings))
+    merger = EffmapMerger(grid, path + 'summap.npy')
+    for _, effmap in effmaps:
+        merger.add(effmap)
+
+    # normalize the max value of the map to 1.
+    final_map = crop_image(scanner, merger.result, grid, center, size, crop_ratio)
+    final_map /= np.max(final_map)
+    final_map[final_map > 1e-7] = 1 / final_map[final_map > 1e-7]
+    merger.flush()
+
+
+def ring_shift(scanner, grid, size):
+    """ Number of image slices between two neighbouring rings.
+    """
+    pitch = scanner.block_proto.block_size[2] + scanner.gap
+    nb_slices = pitch / (size[2] / grid[2])
+    if not np.isclose(nb_slices, np.round(nb_slices)):
+        raise ValueError(f"Ring pitch {pitch} is not a multiple of the voxel size {size[2] / grid[2]} along z.")
+    return int(np.round(nb_slices))
+
 
-    for ir1 in range(nb_rings):
-        for ir2 in range(nb_rings):
-            temp = np.load(path + f'./effmap/effmap_{ir1}_{ir2}.npy').T
-            print(f"process :{ir1}/{nb_rings} and {ir2}/{nb_rings}")
-            final_map += temp
+def merge_effmap_ring_difference(scanner, grid, center, size, crop_ratio, path, effmaps=None):
+    """
+    merge the effmaps of ring pairs (0, d) for every ring difference d.
+
+    The map of ring pair (r, r + d) is the one of (0, d) shifted by r rings
+    along z, and the map of (r + d, r) equals the one of (r, r + d), so the
+    sum is the same as `merge_effmap_full`.
+
+    Args:
+        effmaps: optional iterable of ((0, d), effmap) pairs, e.g. from
+            `EffmapRunner.compute`, instead of the `effmap/effmap_0_{d}.npy` files.
+    """
+    nb_rings = scanner.nb_rings
+    shift = ring_shift(scanner, grid, size)
+    if effmaps is None:
+        effmaps = (((0, d), _load(path, f'./effmap/effmap_0_{d}.npy')) for d in range(nb_rings))
+    merger = EffmapMerger(grid, path + 'summap.npy')
+    for (_, d), effmap in effmaps:
+        merger.add(effmap, nb_shifts=nb_rings - d, shift=shift, weight=1.0 if d == 0 else 2.0)
 
     # normalize the max value of the map to 1.
-    final_map = crop_image(scanner, final_map.T, grid, center, size, crop_ratio)
-    final_map = final_map / np.max(final_map)
+    final_map = crop_image(scanner, merger.result, grid, center, size, crop_ratio)
+    final_map /= np.max(final_map)
     final_map[final_map > 1e-7] = 1 / final_map[final_map > 1e-7]
-    np.save(path + 'summap.npy', final_map)
+    merger.flush()
 
 
 def make_meshes(grid, center, size):
@@ -33,28 +33,10 @@ def partition_lors(lors: np.ndarray):
     according to the dominant direction.
     """
     dim_size1 = (lors.shape)[1]
-    lors.reshape((-1, dim_size1))
-    # lors = np.reshape(lors, (-1, dim_size1))
-    p1 = lors[:, 0:3]
-    p2 = lors[:, 3:6]
-
-    # find the index of x_main, y_main and z_main
-    diff = np.abs(p2 - p1)
-    x_d = diff[:, 0]
-    y_d = diff[:, 1]
-    z_d = diff[:, 2]
-    # x_mask = np.logical_and(x_d >= y_d,x_d >= z_d)
-    # y_mask = np.logical_and(np.logical_and(x_d < y_d,y_d >= z_d), np.logical_not(x_mask))
-    # z_mask = np.logical_not(np.logical_or(x_mask, y_mask))
-    # xlors = lors[x_mask, :]
-    # ylors = lors[y_mask, :]
-    # zlors = lors[z_mask, :]
-    xlors = lors[np.array([np.intersect1d(np.where(x_d >= y_d),
-                                          np.where(x_d >= z_d))])].reshape((-1, dim_size1))
-    ylors = lors[np.array([np.intersect1d(np.where(y_d > x_d),
-                                          np.where(y_d >= z_d))])].reshape((-1, dim_size1))
-    zlors = lors[np.array([np.intersect1d(np.where(z_d > x_d),
-                                          np.where(z_d > y_d))])].reshape((-1, dim_size1))
+    lors = lors.reshape((-1, dim_size1))
+    # the dominant axis of every lor in one pass, ties are broken in the order of x, y, z.
+    axis = np.argmax(np.abs(lors[:, 3:6] - lors[:, 0:3]), 1)
+    xlors, ylors, zlors = (lors[axis == a] for a in range(3))
     return xlors, ylors, zlors
 
 # exchange the start point and end point if the
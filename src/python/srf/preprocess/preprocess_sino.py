@@ -1,55 +1,45 @@
+"""
+Layout transforms of the sinogram pipeline.
+
+The reorders are transposes and reshapes of numpy, a view of the input is
+returned whenever the memory layout allows it:
+
+    sinogram [i, j, k] -> column [(i * n1 + j) * n2 + k, 0]   (C order)
+    image [i, j, k]    -> vector [(k * n1 + j) * n0 + i]      (Fortran order)
+"""
 import numpy as np
-import matplotlib.pyplot as plt
-import pylab
-# from scanner import Block
+
+__all__ = ['sino_to_column', 'image_to_vector', 'vector_to_image',
+           'preprocess_sino', 'preprocess_X', 'posprocess_X']
+
+
+def sino_to_column(sino: np.ndarray, dtype=np.float32):
+    """ [n0, n1, n2] sinogram to the [n0 * n1 * n2, 1] column. """
+    return np.asarray(sino, dtype=dtype).reshape([-1, 1])
+
+
+def image_to_vector(image: np.ndarray, dtype=None):
+    """ [n0, n1, n2] image to the flat vector with the first axis varying fastest. """
+    return np.asarray(image, dtype=dtype).ravel(order='F')
+
+
+def vector_to_image(vector: np.ndarray, shape):
+    """ Inverse of `image_to_vector`. """
+    vector = np.asarray(vector)
+    shape = tuple(int(s) for s in np.ravel(shape))
+    if vector.size != np.prod(shape):
+        raise ValueError(f"Can not reshape vector of size {vector.size} to image of shape {shape}.")
+    return vector.reshape(shape, order='F')
 
 
 def preprocess_sino(sino: np.ndarray):
-    npsize = sino.shape 
-    temp_sino =np.zeros((npsize[1],npsize[2],npsize[0]),dtype=np.float32)
-    for i in range(npsize[0]):
-        for j in range(npsize[1]):
-            for k in range(npsize[2]):
-                temp_sino[j,k,i]=sino[i,j,k]
-    # plt.figure()
-    # plt.imshow(temp_sino[:,:,5])
-    # pylab.show()
-    sinoline = np.zeros((sino.size,1),dtype=np.float32)
-    a=0
-    for i in range(npsize[0]):
-        for j in range(npsize[1]):
-            for k in range(npsize[2]):
-                #voxel = i*npsize[0]*npsize[1]+j*npsize[0]+k
-                sinoline[a] = temp_sino[j,k,i] 
-                a=a+1       
-    return sinoline
-
-
-def preprocess_X(X:np.ndarray):
-    #X=x.numpy()
-    npsize = X.shape
-    #print(X)
-    Xline = np.zeros((npsize[0]*npsize[1]*npsize[2]))
-    for i in range(npsize[0]):
-        for j in range(npsize[1]):
-            for k in range(npsize[2]):
-                voxel = k*int(npsize[0]*npsize[1])+j*int(npsize[0])+i
-                Xline[voxel] = variable(X[i,j,k])            
-    return Xline
-    
-
-def posprocess_X(x,shape: np.ndarray):
-    X=x.numpy()
-    if X.size ==shape[0,0]*shape[0,1]*shape[0,2]:
-        result = np.zeros(shape)
-        for i in range(shape[0]):
-            for j in range(shape[1]):
-                for k in range(shape[2]):
-                    voxel = k*shape[0]*shape[1]+j*shape[0]+i
-                    result[i,j,k] = X[voxel]
-        return result
-    else:
-        print("It's a bad trans")
-    
-                
-    
+    return sino_to_column(sino)
+
+
+def preprocess_X(X: np.ndarray):
+    return image_to_vector(X, np.float64)
+
+
+def posprocess_X(x, shape):
+    X = x.numpy() if hasattr(x, 'numpy') else x
+    return vector_to_image(X, shape)
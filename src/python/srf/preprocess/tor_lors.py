@@ -0,0 +1,142 @@
+"""
+Out-of-core preprocessing of listmode data for ToR reconstruction.
+
+The events of the `listmode_data` group are read chunk by chunk, and every
+chunk goes through `recon_process` (sigma2 factor, partition, swap and
+`CutLoRs`), the x/y/z lors are appended to resizable datasets of the
+`tor_lors` group of the output file. Memory is bounded by the chunk size,
+hence studies larger than the memory can be prepared. `SplitWorkerLoader`
+loads such a file without preprocessing again.
+
+`ToRLoRsCache` keeps the x/y/z lors of in-memory preprocessing as `.npy`
+files keyed by the input file and the preprocessing parameters, later runs
+memory-map them instead of preprocessing again.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import h5py
+import numpy as np
+
+from srf.io.listmode import iter_h5, DEFAULT_GROUP_NAME
+from .function.on_tor_lors import Axis, recon_process, NB_TOR_COLUMNS
+
+__all__ = ['preprocess_tor_h5', 'load_tor_h5', 'is_tor_h5', 'ToRLoRsCache']
+
+logger = logging.getLogger(__name__)
+
+TOR_GROUP_NAME = 'tor_lors'
+
+# bump it when the output of `recon_process` changes, which invalidates caches.
+PREPROCESS_VERSION = 2
+
+
+def events_to_lors(events):
+    return np.hstack([events['fst'], events['snd'], np.reshape(events['tof'], [-1, 1])])
+
+
+def preprocess_tor_h5(source, target, tof_res, chunk_size=None, group_name=DEFAULT_GROUP_NAME):
+    """ Preprocess the listmode file `source` to the ToR lors file `target`.
+
+    Returns:
+        dict of axis name -> number of lors.
+    """
+    if tof_res < 10000:
+        logger.info(f"with tof of {tof_res} ps.")
+    with h5py.File(target, 'w') as fout:
+        group = fout.create_group(TOR_GROUP_NAME)
+        group.attrs['tof_res'] = tof_res
+        datasets = {a: group.create_dataset(a.name, shape=(0, NB_TOR_COLUMNS), dtype=np.float32,
+                                            maxshape=(None, NB_TOR_COLUMNS), chunks=True)
+                    for a in Axis}
+        for events in iter_h5(source, ['fst', 'snd', 'tof'], chunk_size, group_name):
+            lors3 = recon_process(events_to_lors(events), tof_res)
+            for a in Axis:
+                offset = datasets[a].shape[0]
+                datasets[a].resize(offset + lors3[a].shape[0], axis=0)
+                datasets[a][offset:] = lors3[a]
+        return {a.name: datasets[a].shape[0] for a in Axis}
+
+
+def is_tor_h5(path):
+    with h5py.File(path, 'r') as fin:
+        return TOR_GROUP_NAME in fin
+
+
+def load_tor_h5(path, tof_res=None):
+    """ Load the x/y/z lors of a file made by `preprocess_tor_h5`.
+
+    Returns:
+        dict of axis name -> [N, 10] lors.
+    """
+    with h5py.File(path, 'r') as fin:
+        group = fin[TOR_GROUP_NAME]
+        if tof_res is not None and group.attrs['tof_res'] != tof_res:
+            raise ValueError(f"{path} is preprocessed with tof_res {group.attrs['tof_res']},"
+                             f" but {tof_res} is required.")
+        return {a.name: np.array(group[a.name]) for a in Axis}
+
+
+class ToRLoRsCache:
+    """
+    Content-addressed cache of preprocessed ToR lors under `root`.
+
+    The key is the hash of the identity of the input file (absolute path,
+    size and modification time, hashing the content of huge files costs as
+    much as the preprocessing), tof_res, the column layout and
+    `PREPROCESS_VERSION`. An entry is a directory `{key}/` of `x.npy`,
+    `y.npy`, `z.npy` and `meta.json`.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def key(self, path, tof_res, columns):
+        stat = os.stat(path)
+        identity = {'path': os.path.abspath(path),
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'tof_res': float(tof_res),
+                    'columns': list(columns),
+                    'version': PREPROCESS_VERSION}
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+    def load(self, key, mmap_mode='r'):
+        """ dict of axis name -> memory-mapped lors, None if key is not cached.
+        """
+        entry = os.path.join(self.root, key)
+        if not os.path.exists(os.path.join(entry, 'meta.json')):
+            return None
+        return {a.name: np.load(os.path.join(entry, f'{a.name}.npy'), mmap_mode=mmap_mode)
+                for a in Axis}
+
+    def save(self, key, lors, **meta):
+        """ Save dict of axis name -> lors, the entry appears atomically.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=self.root, prefix=f'.{key}.')
+        for a in Axis:
+            np.save(os.path.join(tmp, f'{a.name}.npy'), np.asarray(lors[a.name], dtype=np.float32))
+        # meta.json marks a complete entry
+        with open(os.path.join(tmp, 'meta.json'), 'w') as fout:
+            json.dump(meta, fout)
+        try:
+            os.rename(tmp, os.path.join(self.root, key))
+        except OSError:
+            # made by another process in the meantime
+            shutil.rmtree(tmp)
+
+    def get(self, path, tof_res, columns, make):
+        """ The cached lors of `path`, `make()` is called to preprocess
+        and its result is cached on miss.
+        """
+        key = self.key(path, tof_res, columns)
+        lors = self.load(key)
+        if lors is None:
+            self.save(key, make(), path=os.path.abspath(path), tof_res=tof_res, columns=list(columns))
+            lors = self.load(key)
+        return lors
@@ -2,7 +2,8 @@ import numpy as np
 from numpy import matlib
 from scipy.optimize import curve_fit
 
-__all__ = ['gaussian1d', 'gaussian2d', 'gaussFit1d', 'gaussFit2d', 'gaussFit1d_solver', 'gaussFit2d_solver']
+__all__ = ['gaussian1d', 'gaussian2d', 'gaussFit1d', 'gaussFit2d', 'gaussFit1d_solver', 'gaussFit2d_solver',
+           'gaussFit_batch', 'fit_xy_kernels', 'fit_z_kernels']
 
 def gaussian1d(x, a, sigma):
     if isinstance(x, list):
@@ -42,42 +43,131 @@ def gaussFit2d(data, zn):
     
     return gaussFit1d(r, zn)
 
-def gaussFit1d_solver(x, yn):
-    if isinstance(x, list):
-        x = np.array(x)
-    if isinstance(yn, list):
-        yn = np.array(yn)
-    def func(r2, alpha, beta):
-        return alpha + beta * r2
-    r2, out = [], []
-    for i in range(len(x)):
-        if yn[i] > 1e-7:
-            r2 = r2 + [x[i] ** 2]
-            out = out + [np.log(yn[i])]
-    r2 = np.array(r2)
-    out = np.array(out)
-    popt, _ = curve_fit(func, r2, out)
-    return float(np.exp(popt[0])), float(np.sqrt(-0.5 / popt[1]))
+def _log_linear_solver(r2, zn):
+    """ Least squares of log(zn) = alpha + beta * r2 over the samples above 1e-7. """
+    r2 = np.asarray(r2, dtype=np.float64)
+    zn = np.asarray(zn, dtype=np.float64)
+    mask = zn > 1e-7
+    design = np.stack([np.ones(np.count_nonzero(mask)), r2[mask]], axis=1)
+    (alpha, beta), *_ = np.linalg.lstsq(design, np.log(zn[mask]), rcond=None)
+    return float(np.exp(alpha)), float(np.sqrt(-0.5 / beta))
+
 
+def gaussFit1d_solver(x, yn):
+    x = np.asarray(x, dtype=np.float64)
+    return _log_linear_solver(x ** 2, yn)
 
 
 def gaussFit2d_solver(xy, zn):
-    x = xy[0]
-    y = xy[1]
-    if isinstance(x, list):
-        x = np.array(x)
-    if isinstance(y, list):
-        y = np.array(y)
-    if isinstance(zn, list):
-        zn = np.array(zn)
-    def func(r2, alpha, beta):
-        return alpha + beta * r2
-    r2, out = [], []
-    for i in range(len(x)):
-        if zn[i] > 1e-7:
-            r2 = r2 + [x[i] ** 2 + y[i] ** 2]
-            out = out + [np.log(zn[i])]
-    r2 = np.array(r2)
-    out = np.array(out)
-    popt, _ = curve_fit(func, r2, out)
-    return float(np.exp(popt[0])), float(np.sqrt(-0.5 / popt[1]))
\ No newline at end of file
+    x = np.asarray(xy[0], dtype=np.float64)
+    y = np.asarray(xy[1], dtype=np.float64)
+    return _log_linear_solver(x ** 2 + y ** 2, zn)
+
+
+def _design(shape):
+    """ Design matrix [1, t0, t0^2, t1, t1^2, ...] of the C order flattened
+    pixels, t is the pixel index centered and scaled to about [-1, 1] for
+    conditioning of the normal equations.
+    """
+    meshes = np.meshgrid(*[np.arange(n, dtype=np.float64) for n in shape], indexing='ij')
+    centers = np.array([(n - 1) / 2 for n in shape])
+    scales = np.array([max(n / 2, 1.0) for n in shape])
+    columns = [np.ones(int(np.prod(shape)))]
+    for m, c, s in zip(meshes, centers, scales):
+        t = (m.ravel() - c) / s
+        columns += [t, t ** 2]
+    return np.stack(columns, axis=1), centers, scales
+
+
+def _gaussian_nd(coordinates, a, *params):
+    d = len(coordinates)
+    u, sigma = params[:d], params[d:]
+    return a * np.exp(-sum((x - m) ** 2 / (2 * s ** 2) for x, m, s in zip(coordinates, u, sigma)))
+
+
+def _refine_fit(job):
+    coordinates, profile, p0 = job
+    if not np.all(np.isfinite(p0)):
+        return p0
+    try:
+        popt, _ = curve_fit(_gaussian_nd, coordinates, profile, p0=p0)
+    except (RuntimeError, ValueError):
+        return p0
+    d = len(coordinates)
+    popt[1 + d:] = np.abs(popt[1 + d:])
+    return popt
+
+
+def gaussFit_batch(profiles, epsilon=1e-3, weighted=True, refine=False, nb_workers=1):
+    """ Fit `a * exp(-sum_d (x_d - u_d)^2 / (2 sigma_d^2))` to a stack of sampled
+    profiles, x_d is the pixel index of axis d.
+
+    The log-linear fits of all profiles are solved in closed form by batched
+    normal equations, samples below epsilon of the peak of their profile are
+    ignored and, if weighted, the rest are weighted by the square of the
+    sample to compensate the noise amplified by the log.
+
+    Args:
+        profiles: [N, n0] or [N, n0, n1] samples.
+        refine: refine the closed form fits by nonlinear least squares.
+        nb_workers: number of processes of the refinement.
+
+    Returns:
+        (a [N], u [N, d], sigma [N, d]), nan of profiles not fitted by a Gaussian.
+    """
+    profiles = np.asarray(profiles, dtype=np.float64)
+    shape = profiles.shape[1:]
+    if len(shape) not in (1, 2):
+        raise ValueError(f"Profiles must be 1D or 2D, got a stack of shape {profiles.shape}.")
+    d = len(shape)
+    samples = profiles.reshape([profiles.shape[0], -1])
+    design, centers, scales = _design(shape)
+    peaks = np.max(samples, axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = samples / peaks
+        mask = normalized > epsilon
+        logs = np.where(mask, np.log(np.where(mask, normalized, 1.0)), 0.0)
+        weights = np.where(mask, normalized ** 2 if weighted else 1.0, 0.0)
+        nb_params = design.shape[1]
+        outer = (design[:, :, None] * design[:, None, :]).reshape([-1, nb_params * nb_params])
+        normal = (weights @ outer).reshape([-1, nb_params, nb_params])
+        rhs = (weights * logs) @ design
+        coefficients = np.einsum('npq,nq->np', np.linalg.pinv(normal), rhs)
+        linear, quadratic = coefficients[:, 1::2], coefficients[:, 2::2]
+        sigma = np.sqrt(-0.5 / quadratic)
+        u = -linear / (2 * quadratic)
+        a = peaks[:, 0] * np.exp(coefficients[:, 0] - np.sum(linear ** 2 / (4 * quadratic), axis=1))
+    u = centers + scales * u
+    sigma = scales * sigma
+    if refine:
+        coordinates = np.stack([m.ravel() for m in np.meshgrid(*[np.arange(n, dtype=np.float64) for n in shape],
+                                                                 indexing='ij')])
+        jobs = [(coordinates, samples[i], np.concatenate([[a[i]], u[i], sigma[i]]))
+                for i in range(samples.shape[0])]
+        if nb_workers > 1 and len(jobs) > 1:
+            import multiprocessing
+            # spawn, forking a process which has loaded TensorFlow may deadlock
+            with multiprocessing.get_context('spawn').Pool(min(nb_workers, len(jobs))) as pool:
+                params = pool.map(_refine_fit, jobs)
+        else:
+            params = [_refine_fit(job) for job in jobs]
+        params = np.reshape(params, [-1, 1 + 2 * d])
+        a, u, sigma = params[:, 0], params[:, 1:1 + d], params[:, 1 + d:]
+    return a, u, sigma
+
+
+def fit_xy_kernels(images, **kwargs):
+    """ Kernel table of `PSFMaker.preprocess_xy_para` from [N, nx, ny] images
+    of point sources, arguments are passed to `gaussFit_batch`.
+    Save it by `srf.io.listmode.save_h5` as input of `PSFMaker.run`.
+    """
+    a, u, sigma = gaussFit_batch(images, **kwargs)
+    return {'axy': a, 'ux': u[:, 0], 'uy': u[:, 1], 'sigmax': sigma[:, 0], 'sigmay': sigma[:, 1]}
+
+
+def fit_z_kernels(profiles, **kwargs):
+    """ Kernel table of `PSFMaker.preprocess_z_para` from [N, nz] profiles
+    of point sources, see `fit_xy_kernels`.
+    """
+    a, u, sigma = gaussFit_batch(profiles, **kwargs)
+    return {'az': a, 'uz': u[:, 0], 'sigmaz': sigma[:, 0]}
@@ -1,5 +1,4 @@
 import numpy as np
-import itertools
 
 from dxl.shape.function.rotation import axis_to_axis
 
@@ -70,15 +69,18 @@ class RingBlock(Block):
     def rad_z(self):
         return self._rad_z
 
-    def get_meshes(self) -> np.array:
-        """ compute the mesh points of this block.
-        Args: 
-            None
+    @property
+    def rotation(self):
+        """ The [3, 3] rotation matrix of the block orientation. """
+        # HACK for compat with dxshape
+        return np.asarray(axis_to_axis([1.0, 0.0, 0.0],
+                                       [np.cos(self.rad_z), np.sin(self.rad_z), 0]).unbox())
+
+    def get_local_meshes(self) -> np.array:
+        """ compute the mesh points of this block before rotated.
         returns:
-            rps: crystal centers positions in a block, and the positions 
-                 is organized in an ndarray with the shape of [N, 3].  
+            crystal centers positions of the unrotated block, [N, 3].
         """
-
         interval = self.block_size / self.grid
         grid = self.grid
 
@@ -89,24 +91,17 @@ class RingBlock(Block):
             p_start[i], p_end[i], grid[i]) for i in range(3)]
 
         meshes = np.array(np.meshgrid(mrange_x, mrange_y, mrange_z))
+        return np.transpose(np.reshape(meshes, (3, -1)))
 
-        # print(meshes)
-        # meshes = np.transpose(meshes)
-        # source_axis = AXIS3_X
-        # target_axis = Axis3(
-        # Vector3([np.cos(self.rad_z), np.sin(self.rad_z), 0]))
-        # target_axis = np.array([np.cos(self.rad_z), np.sin(self.rad_z), 0])
-        # rot = axis_to_axis(source_axis, target_axis)
-        # HACK for compat with dxshape
-        rot = axis_to_axis([1.0, 0.0, 0.0], [np.cos(self.rad_z), np.sin(self.rad_z), 0])
-        # rot = np.ones([3, 3])
-
-        # print('type of rot!!!!!:', type(rot))
-        # print(meshes.reshape((-1,3)))
-        rps = rot.unbox()@np.reshape(meshes,(3, -1))
-        # rps = Tensor(rot @ np.reshape(meshes, (3, -1)))
-        # print(np.transpose(rps))
-        return np.transpose(rps)
+    def get_meshes(self) -> np.array:
+        """ compute the mesh points of this block.
+        Args: 
+            None
+        returns:
+            rps: crystal centers positions in a block, and the positions 
+                 is organized in an ndarray with the shape of [N, 3].  
+        """
+        return self.get_local_meshes() @ self.rotation.T
 
 
 class PatchBlock(Block):
@@ -143,12 +138,23 @@ class BlockPair(object):
             lors: an np.ndarray with the shape of N*6, each column of which
                   contain the 3D position of two end points of an lor.
         """
-        lors = []
-        m0 = self.block1.get_meshes()
-        m1 = self.block2.get_meshes()
-        # HACK for 
-        # m0, m1 = m0.unbox(), m1.unbox()
-
-        lors = [x for x in itertools.product(m0, m1)]
-        return lors
-        # return np.array(lors).reshape(-1, 6)
+        return pair_lors(self.block1.get_meshes(), self.block2.get_meshes())
+
+
+def pair_lors(meshes1, meshes2) -> np.ndarray:
+    """ Connect every crystal of meshes1 to every crystal of meshes2.
+
+    Args:
+        meshes1: [..., N, 3] crystal positions.
+        meshes2: [..., M, 3] crystal positions, the leading dimensions are
+            broadcasted with the ones of meshes1.
+    Returns:
+        lors: [..., N*M, 6], in the order of itertools.product(meshes1, meshes2).
+    """
+    meshes1, meshes2 = np.asarray(meshes1), np.asarray(meshes2)
+    n, m = meshes1.shape[-2], meshes2.shape[-2]
+    shape = np.broadcast_shapes(meshes1.shape[:-2], meshes2.shape[:-2]) + (n, m, 6)
+    lors = np.empty(shape, dtype=np.result_type(meshes1, meshes2))
+    lors[..., 0:3] = meshes1[..., :, None, :]
+    lors[..., 3:6] = meshes2[..., None, :, :]
+    return lors.reshape(shape[:-3] + (n * m, 6))
@@ -2,10 +2,13 @@ import numpy as np
 
 import itertools
 from typing import Iterable
-from srf.scanner.pet.block import Block, BlockPair, RingBlock
+from srf.scanner.pet.block import Block, BlockPair, RingBlock, pair_lors
 from srf.scanner.pet.geometry import RingGeometry
 from srf.scanner.pet.spec import TOF
 
+# default number of lors of a chunk yielded by `CylindricalPET.lor_chunks`.
+DEFAULT_CHUNK_SIZE = 1 << 20
+
 
 class PETScanner():
     """ A PETScanner is an abstract class of PET detectors.
@@ -70,6 +73,7 @@ class CylindricalPET(PETScanner):
         super().__init__(name=name, block_proto=block, tof=tof)
         self._geometry = scanner_para
         self._rings = self._make_rings()
+        self._crystal_table = None
 
     @property
     def geometry(self):
@@ -102,8 +106,23 @@ class CylindricalPET(PETScanner):
     @property
     def rings(self):
         return self._rings
-    
 
+    @property
+    def crystal_table(self):
+        """ Crystal center positions of the whole scanner, an ndarray with the
+        shape of [nb_rings, nb_blocks_per_ring, nb_crystals_per_block, 3],
+        crystals of a block are in the order of `RingBlock.get_meshes`.
+        """
+        if self._crystal_table is None:
+            self._crystal_table = self._make_crystal_table()
+        return self._crystal_table
+
+    def _make_crystal_table(self):
+        # all blocks of a ring share the unrotated meshes,
+        # blocks of the same index in different rings share the rotation.
+        local = np.stack([ring[0].get_local_meshes() for ring in self.rings])
+        rotations = np.stack([b.rotation for b in self.rings[0]])
+        return np.einsum('rnj,bij->rbni', local, rotations)
 
     def _make_rings(self):
         """ Generate a list of rings in the cylindrical scanner.
@@ -167,14 +186,151 @@ class CylindricalPET(PETScanner):
                            for i2, b2 in enumerate(ring2) if i1 != i2]
         return block_pairs
 
-    @classmethod
-    def make_ring_pairs_lors(cls, ring1: list, ring2: list) -> np.ndarray:
+    def block_pair_indices(self, ir1: int, ir2: int) -> np.ndarray:
+        """ Return the [N, 2] block indices of the block pairs within two rings,
+        in the same order of `make_block_pairs`.
+        """
+        i1, i2 = np.meshgrid(np.arange(self.nb_blocks_per_ring),
+                             np.arange(self.nb_blocks_per_ring), indexing='ij')
+        valid = i1 < i2 if ir1 == ir2 else i1 != i2
+        return np.stack([i1[valid], i2[valid]], 1)
+
+    def make_lors(self, ir1: int, ir2: int, block_pairs=None) -> np.ndarray:
+        """ Return the [N, 6] lors of block pairs from ring ir1 to ring ir2.
+
+        Args:
+            ir1: index of the first ring.
+            ir2: index of the second ring.
+            block_pairs: [P, 2] block indices, all block pairs of the two rings
+                by default.
+        """
+        if block_pairs is None:
+            block_pairs = self.block_pair_indices(ir1, ir2)
+        block_pairs = np.asarray(block_pairs).reshape(-1, 2)
+        table = self.crystal_table
+        return pair_lors(table[ir1, block_pairs[:, 0]],
+                         table[ir2, block_pairs[:, 1]]).reshape(-1, 6)
+
+    def lor_chunks(self, ring_pairs=None, block_pairs=None, chunk_size=None):
+        """ Return the lazy `LoRChunks` of a ring pair or block pair selection.
+
+        Args:
+            ring_pairs: list of (ir1, ir2), all ring pairs by default.
+            block_pairs: [P, 2] block indices used for every ring pair, all
+                block pairs of the ring pair by default.
+            chunk_size: number of lors of a chunk.
         """
+        if ring_pairs is None:
+            ring_pairs = [(ir1, ir2) for ir1 in range(self.nb_rings) for ir2 in range(self.nb_rings)]
+        return LoRChunks(self, [(ir1, ir2, block_pairs) for ir1, ir2 in ring_pairs], chunk_size)
+
+    def _ring_index(self, ring):
+        for ir, r in enumerate(self.rings):
+            if r is ring:
+                return ir
+        return None
+
+    def make_ring_pairs_lors(self, ring1: list, ring2: list) -> np.ndarray:
+        """ Return the [N, 6] lors of all block pairs within two rings.
+        """
+        ir1, ir2 = self._ring_index(ring1), self._ring_index(ring2)
+        if ir1 is not None and ir2 is not None:
+            return self.make_lors(ir1, ir2)
+        block_pairs = self.make_block_pairs(ring1, ring2)
+        return np.concatenate([bp.make_lors() for bp in block_pairs]).reshape(-1, 6)
+
+    def make_sector_lors(self, ring1: list, ring2: list) -> np.ndarray:
+        """ Return the lors from the first block of ring1 to the other blocks of ring2.
+
+        The lors of block pair (ib, ib + d) are the ones of (0, d) rotated by
+        ib*2*pi/nb_blocks, so the sector lors represent all the lors of the
+        ring pair up to rotation.
+        """
+        ir1, ir2 = self._ring_index(ring1), self._ring_index(ring2)
+        if ir1 is not None and ir2 is not None:
+            block_pairs = [(0, i2) for i2 in range(1, self.nb_blocks_per_ring)]
+            return self.make_lors(ir1, ir2, block_pairs)
+        block_pairs = [BlockPair(ring1[0], b2) for i2, b2 in enumerate(ring2) if i2 != 0]
+        return np.concatenate([bp.make_lors() for bp in block_pairs]).reshape(-1, 6)
+
+
+class LoRChunks:
+    """ Lazy lors of a selection of ring pairs of a `CylindricalPET`.
+
+    The lors are the concatenation of `scanner.make_lors(ir1, ir2, block_pairs)`
+    of the selection, and are gathered from the crystal table chunk by chunk,
+    so the memory is bounded by the chunk size.
+
+    Args:
+        scanner: `CylindricalPET`.
+        selection: list of (ir1, ir2, block_pairs), block_pairs is [P, 2]
+            block indices or None for all block pairs of the ring pair.
+        chunk_size: number of lors of a chunk, the last chunk may be smaller.
+    """
+
+    def __init__(self, scanner, selection, chunk_size=None):
+        if chunk_size is None:
+            chunk_size = DEFAULT_CHUNK_SIZE
+        if chunk_size <= 0:
+            raise ValueError(f"Invalid chunk size {chunk_size}.")
+        self.scanner = scanner
+        self.chunk_size = int(chunk_size)
+        self.selection = []
+        for ir1, ir2, block_pairs in selection:
+            if block_pairs is None:
+                block_pairs = scanner.block_pair_indices(ir1, ir2)
+            self.selection.append((ir1, ir2, np.asarray(block_pairs).reshape(-1, 2)))
+        table = scanner.crystal_table
+        self.nb_lors_per_block_pair = table.shape[2] ** 2
+        counts = [bp.shape[0] * self.nb_lors_per_block_pair for _, _, bp in self.selection]
+        self.offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+
+    @property
+    def nb_lors(self):
+        return int(self.offsets[-1])
+
+    @property
+    def nb_chunks(self):
+        return -(-self.nb_lors // self.chunk_size)
+
+    def __len__(self):
+        return self.nb_chunks
+
+    def __iter__(self):
+        for k in range(self.nb_chunks):
+            yield self.chunk(k)
+
+    def segments(self):
+        """ Yield (ir1, ir2, start, stop) lor range of every ring pair of the selection.
+        """
+        for (ir1, ir2, _), start, stop in zip(self.selection, self.offsets[:-1], self.offsets[1:]):
+            yield ir1, ir2, int(start), int(stop)
+
+    def chunk(self, k):
+        """ The [<=chunk_size, 6] lors of the k-th chunk. """
+        return self.lors(k * self.chunk_size, min((k + 1) * self.chunk_size, self.nb_lors))
 
+    def lors(self, start, stop):
+        """ The [stop - start, 6] lors in range [start, stop) of the selection.
         """
-        block_pairs = cls.make_block_pairs(ring1, ring2)
-        lors = [bp.make_lors() for bp in block_pairs]
-        return np.array(lors).reshape(-1, 6)
+        table = self.scanner.crystal_table
+        nb_crystals = table.shape[2]
+        result = np.empty([stop - start, 6], dtype=table.dtype)
+        first = np.searchsorted(self.offsets, start, side='right') - 1
+        for i in range(max(first, 0), len(self.selection)):
+            lower, upper = max(start, self.offsets[i]), min(stop, self.offsets[i + 1])
+            if lower >= stop:
+                break
+            if lower >= upper:
+                continue
+            ir1, ir2, block_pairs = self.selection[i]
+            index = np.arange(lower - self.offsets[i], upper - self.offsets[i])
+            pair, crystal = np.divmod(index, self.nb_lors_per_block_pair)
+            c1, c2 = np.divmod(crystal, nb_crystals)
+            out = result[lower - start:upper - start]
+            out[:, 0:3] = table[ir1, block_pairs[pair, 0], c1]
+            out[:, 3:6] = table[ir2, block_pairs[pair, 1], c2]
+        return result
 
 
 class MultiPatchPET(PETScanner):
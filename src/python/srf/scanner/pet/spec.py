@@ -16,10 +16,12 @@ class TOF():
         return self._bin
 
 class PSF():
-    def __init__(self, flag:bool, xy_file: str, z_file:str):
+    def __init__(self, flag:bool, xy_file: str, z_file:str, operator:str = 'sparse', nb_zones:int = None):
         self._flag = flag
         self._xy = xy_file
         self._z = z_file
+        self._operator = operator
+        self._nb_zones = nb_zones
     
     @property
     def flag(self):
@@ -32,6 +34,15 @@ class PSF():
     def z(self):
         return self._z
 
+    @property
+    def operator(self):
+        """ 'sparse', 'fft' or 'radial_fft', see `srf.model.psf`. """
+        return self._operator
+
+    @property
+    def nb_zones(self):
+        return self._nb_zones
+
 class Attenuation():
     def __init__(self, map_file: str):
         self._map_file = map_file
@@ -70,7 +81,8 @@ def make_correction(correction_config:dict):
         if cc.__contains__('psf_kernel'):
             if cc['psf_kernel']['flag'] is True:
                 print(cc['psf_kernel']['flag'])
-                psf = PSF(cc['psf_kernel']['flag'], cc['psf_kernel']['psf_xy'], cc['psf_kernel']['psf_z'])
+                psf = PSF(cc['psf_kernel']['flag'], cc['psf_kernel']['psf_xy'], cc['psf_kernel']['psf_z'],
+                          cc['psf_kernel'].get('operator', 'sparse'), cc['psf_kernel'].get('nb_zones'))
             else:
                 psf = None
         else:
@@ -296,9 +296,7 @@ class SinoTask(SRFTask):
         #NS = self.Reconinfo.nb_subsets
         SI = self.sino_info
         worker_step =  SI.sino_steps()
-        sino_ranges = np.zeros(SI.sino_shape()[0],dtype=np.int32)
-        for i in range (SI.sino_shape()[0]):
-            sino_ranges[i] = i  
+        sino_ranges = np.arange(SI.sino_shape()[0], dtype=np.int32)
 
         msg = "Loading sinos from file: {}"
         logger.info(msg.format(SI.sino_file()))
@@ -1,7 +1,11 @@
 import pytest
 from srf.test import TestCase
 from pathlib import Path
-from srf.external.castor.function.listmode2cdhf import generate_cdh
+import numpy as np
+from srf.external.castor.data import DataHeader
+from srf.external.castor.function.listmode2cdhf import (generate_cdh, generate_cdf, cdf_dtype,
+                                                        castor_crystal_ids, get_scanner)
+from srf.external.stir.function.on_event import positions2detectorids
 
 class ConverterTestBase(TestCase):
     def setUp(self):
@@ -24,3 +28,52 @@ class TestDataConverter(ConverterTestBase):
         assert expected_data_str.split('\n') == result_data_str.split('\n')
 
         
+
+
+class TestGenerateCdf(ConverterTestBase):
+    def setUp(self):
+        super().setUp()
+        import tempfile
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def get_config(self, tof_info_flag=False):
+        from srf.io.listmode import save_h5
+        angles = np.random.uniform(0.0, 2 * np.pi, [2, 20])
+        z = np.random.uniform(-16.0, 16.0, [2, 20])
+        fst, snd = (np.stack([55.0 * np.cos(a), 55.0 * np.sin(a), h], axis=1) for a, h in zip(angles, z))
+        path = self.tmp_dir.name + '/listmode.h5'
+        save_h5(path, {'fst': fst, 'snd': snd, 'tof': np.random.rand(20)})
+        config = {'input_data_file': path,
+                  'data_file_name': self.tmp_dir.name + '/mydata',
+                  'scanner': {'ring': {'inner_radius': 49.5, 'outer_radius': 59.5, 'axial_length': 33.4,
+                                       'nb_rings': 1, 'nb_blocks_per_ring': 16, 'gap': 0.0},
+                              'block': {'size': [20.0, 33.4, 33.4], 'grid': [1, 10, 10]}},
+                  'scanner_name': 'test', 'nb_events': None, 'start_time': 0, 'duration': 1,
+                  'data_mode': 'list-mode', 'data_type': 'PET', 'max_axial_difference': 0.0,
+                  'max_nb_lines_per_event': 1, 'calibration_factor': 1.0, 'isotope': 'unknown',
+                  'attenuation_correction_flag': False, 'normalization_correction_flag': True,
+                  'scatter_correction_flag': False, 'random_correction_flag': False,
+                  'tof_info_flag': tof_info_flag, 'nb_tof_bins': 1, 'tof_bin_size': 1.0, 'tof_range': 1.0}
+        return config, fst, snd
+
+    def test_generate_cdf(self):
+        config, fst, snd = self.get_config(tof_info_flag=True)
+        nb_events, path = generate_cdf(config, chunk_size=7)
+        assert nb_events == 20
+        records = np.fromfile(path, dtype=cdf_dtype(DataHeader(config)))
+        assert records.shape == (20,)
+        scanner = get_scanner(config['scanner'])
+        np.testing.assert_array_equal(records['id1'], castor_crystal_ids(scanner, fst))
+        np.testing.assert_array_equal(records['id2'], castor_crystal_ids(scanner, snd))
+        self.assertFloatArrayEqual(records['normalization_factor'], np.ones([20]))
+
+    def test_castor_crystal_ids(self):
+        config, fst, _ = self.get_config()
+        scanner = get_scanner(config['scanner'])
+        rings, blocks, crystals = positions2detectorids(scanner, fst)
+        result = castor_crystal_ids(scanner, fst)
+        np.testing.assert_array_equal(result // 160, rings)
+        np.testing.assert_array_equal(result % 160, crystals + 5)
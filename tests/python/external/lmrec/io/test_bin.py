@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from srf.io.listmode import save_h5
+from srf.external.lmrec.io.bin import save_bin, load_bin
+
+
+@pytest.fixture
+def sources(tmpdir):
+    result = []
+    for k, n in enumerate([13, 5]):
+        path = str(tmpdir.join(f'listmode_{k}.h5'))
+        save_h5(path, {'fst': np.random.rand(n, 3), 'snd': np.random.rand(n, 3), 'weight': np.random.rand(n)})
+        result.append((path, n))
+    return result
+
+
+def expected_records(path):
+    import h5py
+    with h5py.File(path, 'r') as fin:
+        g = fin['listmode_data']
+        return np.hstack([g['fst'], g['snd'], np.reshape(g['weight'], [-1, 1])]).astype(np.float32)
+
+
+@pytest.mark.parametrize('nb_workers', [1, 2])
+def test_save_bin(tmpdir, sources, nb_workers):
+    target = str(tmpdir.join('input.txt'))
+    nb_events = save_bin([p for p, _ in sources], target, chunk_size=4, nb_workers=nb_workers)
+    assert nb_events == 18
+    with open(target + '.hdr') as fin:
+        assert fin.read() == '18'
+    expected = np.concatenate([expected_records(p) for p, _ in sources])
+    np.testing.assert_array_equal(np.fromfile(target, dtype=np.float32).reshape([-1, 7]), expected)
+    np.testing.assert_array_equal(load_bin(target), expected)
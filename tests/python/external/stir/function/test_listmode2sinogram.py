@@ -2,9 +2,10 @@ import pytest
 import numpy as np
 from srf.data import PETSinogram3D, PETCylindricalScanner, Block
 from srf.external.stir.function import ndarray2listmode, listmode2sinogram, position2detectorid
-from srf.external.stir.function._listmode2sinogram import rework_indices, id_sinogram, id_view, id_bin
+from srf.external.stir.function._listmode2sinogram import (rework_indices, id_sinogram, id_view, id_bin,
+                                                             id_sinogram_columns, id_bin_columns)
 from functools import partial
-from doufo import List, x
+from doufo import List, Pair, x
 
 
 @pytest.fixture
@@ -54,3 +55,25 @@ def test_id_bin(scanner, crystal_ids, stir_data_root, id_sinogram_matlab):
 def test_id_view(scanner, crystal_ids, stir_data_root, id_sinogram_matlab):
     result = crystal_ids.fmap(partial(id_view, scanner))
     assert result == id_sinogram_matlab['id_view']
+
+
+def test_listmode_to_sinogram_of_positions(scanner, l2sdata, listmode_data):
+    sinogram = listmode2sinogram(scanner, np.asarray(l2sdata['input'], dtype=np.float64))
+    assert sinogram == listmode2sinogram(scanner, listmode_data)
+
+
+def test_id_sinogram_columns(scanner):
+    nb_rings = scanner.nb_rings * scanner.blocks[0].grid[2]
+    r1, r2 = np.meshgrid(np.arange(nb_rings), np.arange(nb_rings), indexing='ij')
+    rings = np.stack([r1.ravel(), r2.ravel()])
+    expected = [id_sinogram(scanner, Pair(int(a), int(b))) for a, b in rings.T]
+    assert id_sinogram_columns(scanner, rings).tolist() == expected
+
+
+def test_id_bin_columns(scanner):
+    nb_detectors = scanner.nb_detectors_per_ring
+    c1, c2 = np.meshgrid(np.arange(nb_detectors), np.arange(nb_detectors), indexing='ij')
+    crystals = np.stack([c1.ravel(), c2.ravel()])
+    views = id_view(scanner, Pair(crystals[0], crystals[1]))
+    expected = [id_bin(scanner, Pair(int(a), int(b))) for a, b in crystals.T]
+    assert id_bin_columns(scanner, crystals, views).tolist() == expected
@@ -3,7 +3,7 @@ import numpy as np
 from srf.data import PositionEvent, DetectorIdEvent
 from doufo import List
 from dxl.shape.data import Point
-from srf.external.stir.function import position2detectorid
+from srf.external.stir.function import position2detectorid, positions2detectorids, AngularLUT
 from functools import partial
 
 
@@ -19,3 +19,21 @@ def pos_and_ids(stir_data_root):
 def test_position2detectorid(scanner, pos_and_ids):
     result = pos_and_ids['input'].fmap(partial(position2detectorid, scanner))
     assert result == pos_and_ids['expect']
+
+
+def test_positions2detectorids(scanner, stir_data_root):
+    data = np.load(stir_data_root / 'position2detectorids.npz')
+    rings, blocks, crystals = positions2detectorids(scanner, data['position'])
+    np.testing.assert_array_equal(rings, data['ids'][:, 0])
+    np.testing.assert_array_equal(blocks, data['ids'][:, 1] // 10)
+    np.testing.assert_array_equal(crystals, data['ids'][:, 1])
+
+
+def test_positions2detectorids_of_lut(scanner):
+    angles = np.random.uniform(0.0, 2 * np.pi, [1000])
+    positions = np.stack([55.0 * np.cos(angles), 55.0 * np.sin(angles),
+                          np.random.uniform(-16.0, 16.0, [1000])], axis=1)
+    expected = positions2detectorids(scanner, positions)
+    result = positions2detectorids(scanner, positions, AngularLUT(scanner, 4))
+    for r, e in zip(result, expected):
+        np.testing.assert_array_equal(r, e)
@@ -0,0 +1,120 @@
+import copy
+import os
+import tempfile
+from unittest import mock
+
+import numpy as np
+import tensorflow as tf
+
+from srf.test import TestCase
+from srf.api.app import map_runner
+from srf.api.app.map_runner import Manifest, EffmapRunner, _MapWorker
+from srf.data import ListModeDataWithoutTOF, ScannerClass
+from srf.function import make_scanner, create_listmode_data
+from srf.graph.reconstruction import RingEfficiencyMap
+from srf.model import BackProjectionOrdinary
+from srf.physics import CompleteLoRsModel
+
+TASK_CONFIG = {
+    'scanner': {
+        'petscanner': {
+            'ring': {'inner_radius': 50.0, 'outer_radius': 60.0, 'axial_length': 8.0,
+                     'nb_rings': 2, 'nb_blocks_per_ring': 8, 'gap': 0.0},
+            'block': {'grid': [1, 4, 1], 'size': [10.0, 16.0, 4.0], 'interval': [0.0, 0.0, 0.0]},
+        }
+    },
+    'algorithm': {
+        'projection_model': {'siddon': {'backend': 'cpu'}},
+        'effmap_chunk_size': 100,
+    },
+    'output': {
+        'image': {'grid': [16, 16, 4], 'center': [0.0, 0.0, 0.0], 'size': [64.0, 64.0, 16.0],
+                  'map_file': {'path_file': 'summap.npy'}}
+    },
+}
+
+
+class FakeWorker:
+    """ `_MapWorker` without graph, the map of (ir1, ir2) is filled by 10 * ir1 + ir2. """
+    computed = []
+
+    def __init__(self, task_config):
+        pass
+
+    def compute(self, ir1, ir2):
+        FakeWorker.computed.append((ir1, ir2))
+        return np.full([2, 2, 2], 10 * ir1 + ir2, np.float32)
+
+    run = _MapWorker.run
+
+    def close(self):
+        pass
+
+
+class TestManifest(TestCase):
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as path:
+            filename = os.path.join(path, 'manifest.txt')
+            manifest = Manifest(filename)
+            manifest.add('effmap/effmap_0_1.npy')
+            self.assertIn('effmap/effmap_0_1.npy', manifest)
+            resumed = Manifest(filename)
+            self.assertIn('effmap/effmap_0_1.npy', resumed)
+            self.assertNotIn('effmap/effmap_1_0.npy', resumed)
+
+
+class TestEffmapRunner(TestCase):
+    def setUp(self):
+        FakeWorker.computed = []
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_resume_skips_finished_pairs(self):
+        manifest = Manifest(os.path.join(self.path, map_runner.DEFAULT_MANIFEST))
+        manifest.add(os.path.normpath('effmap/effmap_0_0.npy'))
+        with mock.patch.object(map_runner, '_MapWorker', FakeWorker):
+            EffmapRunner(TASK_CONFIG, path=self.path).run([(0, 0), (0, 1), (1, 0)])
+            self.assertEqual(FakeWorker.computed, [(0, 1), (1, 0)])
+            self.assertFloatArrayEqual(np.full([2, 2, 2], 10),
+                                       np.load(os.path.join(self.path, 'effmap', 'effmap_1_0.npy')))
+            FakeWorker.computed = []
+            EffmapRunner(TASK_CONFIG, path=self.path).run([(0, 0), (0, 1), (1, 0)])
+            self.assertEqual(FakeWorker.computed, [])
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'effmap', 'effmap_0_0.npy')))
+
+    def test_output_is_replaced_from_temp_file(self):
+        filename = os.path.join(self.path, 'effmap_0_1.npy')
+        with mock.patch.object(map_runner.os, 'replace', wraps=os.replace) as replace:
+            FakeWorker(TASK_CONFIG).run(0, 1, filename)
+        replace.assert_called_once_with(filename + '.tmp.npy', filename)
+        self.assertFalse(os.path.exists(filename + '.tmp.npy'))
+        self.assertFloatArrayEqual(np.full([2, 2, 2], 1), np.load(filename))
+
+
+class TestMapWorker(TestCase):
+    def reference_map(self, ir1, ir2):
+        config = copy.deepcopy(TASK_CONFIG)
+        scanner = make_scanner(ScannerClass.CylinderPET, config['scanner']['petscanner'])
+        im_config = config['output']['image']
+        lors = scanner.make_ring_pairs_lors(scanner.rings[ir1], scanner.rings[ir2])
+        # a plain session of its own graph, the dxl session resets the default graph on exit
+        with tf.Graph().as_default() as graph:
+            model = CompleteLoRsModel('map_model', backend='cpu')
+            effmap = RingEfficiencyMap('effmap', BackProjectionOrdinary(model),
+                                       create_listmode_data[ListModeDataWithoutTOF](lors),
+                                       grid=im_config['grid'], center=im_config['center'],
+                                       size=im_config['size'])
+            effmap.make()
+            with tf.Session(graph=graph) as sess:
+                return effmap.run(sess)
+
+    def test_same_as_ring_efficiency_map(self):
+        expected = self.reference_map(0, 1)
+        worker = _MapWorker(copy.deepcopy(TASK_CONFIG))
+        # the pair is fed in several chunks of effmap_chunk_size lors
+        result = worker.compute(0, 1)
+        worker.close()
+        self.assertFloatArrayEqual(expected, result)
@@ -0,0 +1,96 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy import ndimage
+from srf.test import TestCase
+from srf.model.psf import PSFOperator, FFTPSF, RadialZonePSF, local_kernel, make_psf_operator
+
+
+class PSFModelTestCase(TestCase):
+    grid = [15, 14, 7]
+    center = [0.0, 0.0, 0.0]
+    size = [15.0, 14.0, 7.0]
+
+    def get_kernel(self):
+        x, y, z = np.meshgrid(np.arange(-2, 3), np.arange(-1, 2), np.arange(-1, 2), indexing='ij')
+        return np.exp(-(x - 0.3) ** 2 - y ** 2 / 0.5 - z ** 2 / 2.0)
+
+    def get_sparse_model(self, kernel):
+        """ Shift-invariant psf_xy and psf_z of a separable kernel. """
+        nx, ny, nz = self.grid
+        kernel_xy, kernel_z = kernel[:, :, 1] / kernel[2, 1, 1], kernel[2, 1, :]
+        eye = np.eye(nx * ny).reshape([nx * ny, nx, ny])
+        psf_xy = np.stack([ndimage.convolve(e, kernel_xy, mode='constant') for e in eye])
+        psf_xy = psf_xy.reshape([nx * ny, nx * ny])
+        psf_z = np.stack([np.convolve(e, kernel_z, mode='same') for e in np.eye(nz)])
+        return sp.csr_matrix(psf_xy), psf_z, kernel_xy[:, :, None] * kernel_z[None, None, :]
+
+    def apply_sparse(self, psf_xy, psf_z, image):
+        nx, ny, nz = self.grid
+        return (psf_xy @ (image.reshape([nx * ny, nz]) @ psf_z.T)).reshape(self.grid)
+
+
+class TestPSFOperator(PSFModelTestCase):
+    def test_fft(self):
+        kernel = self.get_kernel()
+        image = np.random.rand(*self.grid)
+        expected = ndimage.correlate(image, kernel, mode='constant')
+        self.assertFloatArrayEqual(expected, FFTPSF(kernel).apply(image))
+
+    def test_transpose(self):
+        image, other = np.random.rand(*self.grid), np.random.rand(*self.grid)
+        kernel = self.get_kernel()
+        for psf in [FFTPSF(kernel),
+                    RadialZonePSF([kernel, kernel[::-1]], [2.0, 5.0], self.grid, self.center, self.size)]:
+            self.assertAlmostEqual(np.sum(psf.apply(image) * other) / np.sum(image * psf.apply_transpose(other)),
+                                   1.0, places=5)
+
+    def test_local_kernel(self):
+        psf_xy, psf_z, kernel = self.get_sparse_model(self.get_kernel())
+        self.assertFloatArrayEqual(kernel, local_kernel(psf_xy, psf_z, self.grid, (7, 7)))
+
+    def test_operators_of_shift_invariant_model(self):
+        psf_xy, psf_z, _ = self.get_sparse_model(self.get_kernel())
+        image = np.random.rand(*self.grid)
+        expected = self.apply_sparse(psf_xy, psf_z, image)
+        for operator in ['fft', 'radial_fft']:
+            psf = make_psf_operator(operator, psf_xy, psf_z, self.grid, self.center, self.size, nb_zones=2)
+            self.assertFloatArrayEqual(expected, psf.apply(image))
+        self.assertIsNone(make_psf_operator('sparse', psf_xy, psf_z, self.grid, self.center, self.size))
+        with self.assertRaises(ValueError):
+            make_psf_operator('dense', psf_xy, psf_z, self.grid, self.center, self.size)
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            PSFOperator()
+
+
+class TestPSFReconStep(PSFModelTestCase):
+    def run_step(self, psf, psf_xy, psf_z, image, efficiency_map):
+        """ One graph mode `PSFReconStep` with identity projection and backprojection. """
+        import tensorflow as tf
+        from types import SimpleNamespace
+        from srf.data import Image
+        from srf.model import PSFReconStep, mlem_update
+        with tf.Graph().as_default():
+            coo = psf_xy.tocoo()
+            psf_xy = tf.sparse_reorder(tf.SparseTensor(np.stack([coo.row, coo.col], axis=1).astype(np.int64),
+                                                       coo.data.astype(np.float32), coo.shape))
+            step = PSFReconStep('recon', lambda image, data: image, lambda proj, image: proj,
+                                mlem_update, psf=psf)
+            KT = step.KEYS.TENSOR
+            result = step.kernel({
+                KT.IMAGE: Image(tf.constant(image, tf.float32), self.center, self.size),
+                KT.EFFICIENCY_MAP: Image(tf.constant(efficiency_map, tf.float32), self.center, self.size),
+                KT.PROJECTION_DATA: None,
+                KT.PSF_XY: SimpleNamespace(data=psf_xy),
+                KT.PSF_Z: SimpleNamespace(data=tf.constant(psf_z, tf.float32))})
+            with tf.Session() as sess:
+                return sess.run(result.data)
+
+    def test_fft_same_as_sparse(self):
+        psf_xy, psf_z, kernel = self.get_sparse_model(self.get_kernel())
+        image, efficiency_map = np.random.rand(*self.grid), np.random.rand(*self.grid)
+        expected = self.run_step(None, psf_xy, psf_z, image, efficiency_map)
+        result = self.run_step(FFTPSF(kernel), psf_xy, psf_z, image, efficiency_map)
+        # float32 FFT round-off is relative to the values
+        np.testing.assert_allclose(result, expected, rtol=1e-5)
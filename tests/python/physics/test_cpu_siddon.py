@@ -0,0 +1,83 @@
+import numpy as np
+from srf.test import TestCase
+from srf.physics.cpu.siddon import siddon_projection, siddon_backprojection, siddon_maplors
+
+
+class TestCPUSiddon(TestCase):
+    def get_geometry(self):
+        return [4, 5, 6], [0.0, 0.0, 0.0], [8.0, 10.0, 12.0]
+
+    def get_dummy_lors(self):
+        return np.array([
+            [-10.0, 0.3, 0.1, 10.0, 0.3, 0.1, 0.0],
+            [0.1, -20.0, 0.2, 0.1, 20.0, 0.2, 0.0],
+            [-10.0, -10.0, -10.0, 10.0, 10.0, 10.0, 0.0],
+            [50.0, 50.0, 0.0, 60.0, 60.0, 0.0, 0.0],
+        ], dtype=np.float32)
+
+    def get_random_lors(self, nb_lors=100):
+        rng = np.random.RandomState(0)
+        return np.hstack([rng.uniform(-15.0, 15.0, (nb_lors, 6)),
+                          rng.uniform(-3.0, 3.0, (nb_lors, 1))]).astype(np.float32)
+
+    def test_projection_uniform_image(self):
+        grid, center, size = self.get_geometry()
+        image = np.ones(grid[::-1], dtype=np.float32)
+        lors = self.get_dummy_lors()
+        result = siddon_projection(lors, image, grid, center, size, 1.0e4, 1.0e6)
+        lor_length = np.linalg.norm(lors[:, 3:6] - lors[:, 0:3], axis=1)
+        expected = np.array([8.0, 10.0, np.sqrt(3.0) * 8.0, 0.0]) / lor_length ** 2
+        self.assertFloatArrayEqual(expected, result)
+
+    def test_chunk_size(self):
+        grid, center, size = self.get_geometry()
+        image = np.random.RandomState(1).rand(*grid[::-1]).astype(np.float32)
+        lors = self.get_random_lors()
+        expected = siddon_projection(lors, image, grid, center, size, 2.0, 4.0)
+        result = siddon_projection(lors, image, grid, center, size, 2.0, 4.0, chunk_size=7)
+        self.assertFloatArrayEqual(expected, result)
+
+    def test_backprojection_is_adjoint(self):
+        grid, center, size = self.get_geometry()
+        rng = np.random.RandomState(2)
+        image = rng.rand(*grid[::-1]).astype(np.float32)
+        lors = self.get_random_lors()
+        values = rng.rand(lors.shape[0]) + 0.5
+        for tof_sigma2 in [1.0e6, 4.0]:
+            proj = siddon_projection(lors, image, grid, center, size, 2.0, tof_sigma2)
+            back = siddon_backprojection(lors, 1.0 / values, np.zeros_like(image),
+                                         grid, center, size, 2.0, tof_sigma2)
+            np.testing.assert_allclose(np.dot(proj, values), np.sum(back * image), rtol=1e-4)
+
+    def test_maplors_without_tof(self):
+        grid, center, size = self.get_geometry()
+        image = np.zeros(grid[::-1], dtype=np.float32)
+        lors = self.get_random_lors()
+        values = np.ones([lors.shape[0], 1], dtype=np.float32)
+        expected = siddon_backprojection(lors, values, image, grid, center, size, 1.0e4, 1.0e6)
+        result = siddon_maplors(lors[:, 0:6], values, image, grid, center, size)
+        self.assertFloatArrayEqual(expected, result)
+
+    def test_sharded(self):
+        grid, center, size = self.get_geometry()
+        rng = np.random.RandomState(3)
+        image = rng.rand(*grid[::-1]).astype(np.float32)
+        lors = self.get_random_lors()
+        values = rng.rand(lors.shape[0]) + 0.5
+        expected = siddon_projection(lors, image, grid, center, size, 2.0, 4.0)
+        result = siddon_projection(lors, image, grid, center, size, 2.0, 4.0, nb_workers=3)
+        self.assertFloatArrayEqual(expected, result)
+        expected = siddon_backprojection(lors, values, image, grid, center, size, 2.0, 4.0)
+        result = siddon_backprojection(lors, values, image, grid, center, size, 2.0, 4.0,
+                                       nb_workers=3)
+        self.assertFloatArrayEqual(expected, result)
+
+    def test_sharded_process(self):
+        grid, center, size = self.get_geometry()
+        rng = np.random.RandomState(4)
+        image = rng.rand(*grid[::-1]).astype(np.float32)
+        lors = self.get_random_lors()
+        expected = siddon_projection(lors, image, grid, center, size, 2.0, 4.0)
+        result = siddon_projection(lors, image, grid, center, size, 2.0, 4.0,
+                                   nb_workers=2, pool='process')
+        self.assertFloatArrayEqual(expected, result)
@@ -0,0 +1,68 @@
+import numpy as np
+from srf.test import TestCase
+from srf.physics.cpu.tor import tor_projection, tor_backprojection, tor_maplors
+
+
+class TestCPUToR(TestCase):
+    def get_geometry(self):
+        return [10, 12, 8], [0.0, 0.0, 0.0], [20.0, 24.0, 16.0]
+
+    def get_dummy_lors(self, nb_lors=50):
+        rng = np.random.RandomState(0)
+        p0 = np.hstack([rng.uniform(-10.0, 10.0, (nb_lors, 2)), np.full((nb_lors, 1), -10.0)])
+        p1 = np.hstack([rng.uniform(-10.0, 10.0, (nb_lors, 2)), np.full((nb_lors, 1), 10.0)])
+        lor_center = (p0 + p1) / 2 + rng.normal(0.0, 1.0, (nb_lors, 3))
+        sigma2_factor = rng.uniform(0.5, 2.0, (nb_lors, 1))
+        return np.hstack([p0, p1, lor_center, sigma2_factor]).astype(np.float32)
+
+    def test_projection_through_voxel_column(self):
+        grid, center, size = self.get_geometry()
+        image = np.zeros(grid[::-1], dtype=np.float32)
+        image[:, 6, 5] = 1.0
+        lors = np.array([[1.0, 1.0, -10.0, 1.0, 1.0, 10.0, 1.0, 1.0, 0.0, 1.0]], dtype=np.float32)
+        result = tor_projection(lors, image, grid, center, size, 4.0, False, 1.0e4, 1.0e6)
+        self.assertFloatArrayEqual([grid[2]], result)
+
+    def test_chunk_size(self):
+        grid, center, size = self.get_geometry()
+        image = np.random.RandomState(1).rand(*grid[::-1]).astype(np.float32)
+        lors = self.get_dummy_lors()
+        expected = tor_projection(lors, image, grid, center, size, 4.0, True, 3.0, 9.0)
+        result = tor_projection(lors, image, grid, center, size, 4.0, True, 3.0, 9.0, chunk_size=7)
+        self.assertFloatArrayEqual(expected, result)
+
+    def test_backprojection_is_adjoint(self):
+        grid, center, size = self.get_geometry()
+        rng = np.random.RandomState(2)
+        image = rng.rand(*grid[::-1]).astype(np.float32)
+        lors = self.get_dummy_lors()
+        values = rng.rand(lors.shape[0]) + 0.5
+        for tof_sigma2 in [1.0e6, 9.0]:
+            proj = tor_projection(lors, image, grid, center, size, 4.0, True, 3.0, tof_sigma2)
+            back = tor_backprojection(lors, 1.0 / values, np.zeros_like(image),
+                                      grid, center, size, 4.0, True, 3.0, tof_sigma2)
+            np.testing.assert_allclose(np.dot(proj, values), np.sum(back * image), rtol=1e-4)
+
+    def test_maplors_without_tof(self):
+        grid, center, size = self.get_geometry()
+        image = np.zeros(grid[::-1], dtype=np.float32)
+        lors = self.get_dummy_lors()
+        values = np.ones([lors.shape[0], 1], dtype=np.float32)
+        expected = tor_backprojection(lors, values, image, grid, center, size, 4.0, True, 3.0, 1.0e6)
+        map_lors = np.hstack([lors[:, 0:6], lors[:, 9:10]])
+        result = tor_maplors(map_lors, values, image, grid, center, size, 4.0, True)
+        self.assertFloatArrayEqual(expected, result)
+
+    def test_sharded(self):
+        grid, center, size = self.get_geometry()
+        rng = np.random.RandomState(3)
+        image = rng.rand(*grid[::-1]).astype(np.float32)
+        lors = self.get_dummy_lors()
+        values = rng.rand(lors.shape[0]) + 0.5
+        expected = tor_projection(lors, image, grid, center, size, 4.0, True, 3.0, 9.0)
+        result = tor_projection(lors, image, grid, center, size, 4.0, True, 3.0, 9.0, nb_workers=3)
+        self.assertFloatArrayEqual(expected, result)
+        expected = tor_backprojection(lors, values, image, grid, center, size, 4.0, True, 3.0, 9.0)
+        result = tor_backprojection(lors, values, image, grid, center, size, 4.0, True, 3.0, 9.0,
+                                    nb_workers=3, pool='process')
+        self.assertFloatArrayEqual(expected, result)
@@ -0,0 +1,63 @@
+import tempfile
+import numpy as np
+from srf.test import TestCase
+from srf.physics import build_rotational_system_matrix, polar_to_cartesian
+from srf.physics.cpu.polar import PolarGrid, polar_matrix
+from srf.scanner.pet.block import Block
+from srf.scanner.pet.pet import CylindricalPET
+from srf.scanner.pet.geometry import RingGeometry
+from srf.scanner.pet.spec import TOF
+
+
+class TestRotationalSystemMatrix(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def get_scanner(self):
+        ring = RingGeometry({"inner_radius": 40.0, "outer_radius": 50.0, "axial_length": 20.0,
+                             "nb_rings": 2, "nb_blocks_per_ring": 8, "gap": 0.0})
+        block = Block(block_size=[10.0, 20.0, 10.0], grid=[1, 3, 2])
+        return CylindricalPET('test', ring, block, TOF(res=530, bin=40))
+
+    def get_polar_grid(self):
+        return PolarGrid((6, 16, 4), 30.0, 20.0)
+
+    def test_efficiency_map(self):
+        scanner = self.get_scanner()
+        polar_grid = self.get_polar_grid()
+        matrix = build_rotational_system_matrix(scanner, polar_grid, self.tmp_dir.name)
+        self.assertEqual(matrix.shape[0], 8 * 4 * 7 * 36)
+        expected = np.zeros([polar_grid.size])
+        for r1 in scanner.rings:
+            for r2 in scanner.rings:
+                lors = scanner.make_ring_pairs_lors(r1, r2)
+                for _, index, value in polar_matrix(lors, polar_grid):
+                    expected += np.bincount(index, value, minlength=polar_grid.size)
+        self.assertFloatArrayEqual(expected.reshape(polar_grid.shape) / expected.max(),
+                                   matrix.efficiency_map() / expected.max())
+
+    def test_rotated_sector(self):
+        scanner = self.get_scanner()
+        polar_grid = self.get_polar_grid()
+        matrix = build_rotational_system_matrix(scanner, polar_grid, self.tmp_dir.name,
+                                                ring_pairs=[(0, 1)])
+        image = np.random.RandomState(0).rand(*polar_grid.shape).astype(np.float32)
+        lors = scanner.make_sector_lors(scanner.rings[0], scanner.rings[1])
+        angle = 3 * 2 * np.pi / 8
+        rot = np.array([[np.cos(angle), -np.sin(angle), 0.0],
+                        [np.sin(angle), np.cos(angle), 0.0],
+                        [0.0, 0.0, 1.0]])
+        rotated = np.hstack([lors[:, 0:3] @ rot.T, lors[:, 3:6] @ rot.T])
+        expected = np.zeros([lors.shape[0]])
+        for ilor, index, value in polar_matrix(rotated, polar_grid):
+            expected += np.bincount(ilor, value * image.ravel()[index], minlength=lors.shape[0])
+        self.assertFloatArrayEqual(expected, matrix.project(image)[3])
+
+    def test_polar_to_cartesian_of_uniform_image(self):
+        polar_grid = self.get_polar_grid()
+        resample = polar_to_cartesian(polar_grid, [4, 4, 2], [0.0, 0.0, 0.0], [20.0, 20.0, 10.0])
+        result = resample @ np.ones([polar_grid.size], dtype=np.float32)
+        self.assertFloatArrayEqual(np.ones([32]), result)
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import numpy as np
+from srf.test import TestCase
+from srf.physics import (CompleteLoRsModel, SplitLoRsModel, build_system_matrix, SystemMatrix,
+                         system_matrix_identity, system_matrix_key)
+from srf.physics.cpu.siddon import siddon_projection, siddon_backprojection
+from srf.physics.cpu.tor import tor_projection
+
+
+class TestSystemMatrix(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def get_geometry(self):
+        return [4, 5, 6], [0.0, 0.0, 0.0], [8.0, 10.0, 12.0]
+
+    def get_siddon_lors(self, nb_lors=30):
+        rng = np.random.RandomState(0)
+        return np.hstack([rng.uniform(-15.0, 15.0, (nb_lors, 6)),
+                          rng.uniform(-3.0, 3.0, (nb_lors, 1))]).astype(np.float32)
+
+    def get_tor_lors(self, nb_lors=20):
+        rng = np.random.RandomState(1)
+        p0 = np.hstack([rng.uniform(-4.0, 4.0, (nb_lors, 2)), np.full((nb_lors, 1), -10.0)])
+        p1 = np.hstack([rng.uniform(-4.0, 4.0, (nb_lors, 2)), np.full((nb_lors, 1), 10.0)])
+        return np.hstack([p0, p1, rng.uniform(0.5, 2.0, (nb_lors, 1))]).astype(np.float32)
+
+    def test_complete_lors(self):
+        grid, center, size = self.get_geometry()
+        image = np.random.RandomState(2).rand(*grid).astype(np.float32)
+        lors = self.get_siddon_lors()
+        model = CompleteLoRsModel('test_sparse_complete', tof_bin=2.0, tof_sigma2=4.0, backend='cpu')
+        matrix = build_system_matrix(model, lors, grid, center, size, os.path.join(self.tmp_dir.name, 'complete'),
+                                     with_tof=True, shard_size=7)
+        self.assertEqual(len(matrix.shards), 5)
+        expected = siddon_projection(lors, image.T, grid, center, size, 2.0, 4.0)
+        self.assertFloatArrayEqual(expected, matrix.project(image))
+        values = expected + 0.5
+        expected = siddon_backprojection(lors, values, image.T, grid, center, size, 2.0, 4.0)
+        self.assertFloatArrayEqual(expected.T, matrix.backproject(values).reshape(grid))
+
+    def test_split_lors_reload(self):
+        grid, center, size = self.get_geometry()
+        image = np.random.RandomState(3).rand(*grid).astype(np.float32)
+        model = SplitLoRsModel(2.0, True, name='test_sparse_split', backend='cpu')
+        lors = {a: self.get_tor_lors() for a in model.AXIS}
+        path = os.path.join(self.tmp_dir.name, 'split')
+        build_system_matrix(model, lors, grid, center, size, path)
+        matrix = SystemMatrix.load(path)
+        result = matrix.project(image)
+        for a in model.AXIS:
+            perm = model.perm(a)
+            geometry = [list(np.asarray(v)[perm][::-1]) for v in (grid, center, size)]
+            expected = tor_projection(np.hstack([lors[a][:, :6], np.zeros([20, 3]), lors[a][:, 6:]]),
+                                      np.transpose(image, perm), *geometry, 2.0, True, 1.0, 1.0e6)
+            start, stop = matrix.segments[a]
+            self.assertFloatArrayEqual(expected, result[start:stop])
+
+    def test_identity(self):
+        grid, center, size = self.get_geometry()
+        source = os.path.join(self.tmp_dir.name, 'listmode.npy')
+        np.save(source, self.get_siddon_lors())
+        model = CompleteLoRsModel('test_sparse_identity', tof_bin=2.0, tof_sigma2=4.0, backend='cpu')
+        path = os.path.join(self.tmp_dir.name, 'identity')
+        matrix = build_system_matrix(model, self.get_siddon_lors(), grid, center, size, path,
+                                     with_tof=True, source=source)
+        identity = system_matrix_identity(model, grid, center, size, True, source)
+        self.assertEqual(identity, SystemMatrix.load(path).identity)
+        self.assertEqual(matrix.identity['source']['path'], os.path.abspath(source))
+        key = system_matrix_key(identity)
+        self.assertNotEqual(key, system_matrix_key(system_matrix_identity(model, [4, 5, 7], center, size,
+                                                                          True, source)))
+        self.assertNotEqual(key, system_matrix_key(system_matrix_identity(model, grid, center, size)))
+        os.utime(source, ns=(0, 0))
+        self.assertNotEqual(key, system_matrix_key(system_matrix_identity(model, grid, center, size,
+                                                                          True, source)))
+
+    def test_check_rows(self):
+        grid, center, size = self.get_geometry()
+        model = SplitLoRsModel(2.0, True, name='test_sparse_rows', backend='cpu')
+        lors = {a: self.get_tor_lors() for a in model.AXIS}
+        matrix = build_system_matrix(model, lors, grid, center, size, os.path.join(self.tmp_dir.name, 'rows'))
+        matrix.check_rows(60)
+        matrix.check_rows(20, 'x')
+        matrix.check_rows(None, 'y')
+        with self.assertRaises(ValueError):
+            matrix.check_rows(21, 'z')
+        with self.assertRaises(ValueError):
+            matrix.check_rows(59)
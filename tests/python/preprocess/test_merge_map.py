@@ -0,0 +1,58 @@
+import os
+import tempfile
+from types import SimpleNamespace
+import numpy as np
+from srf.test import TestCase
+from srf.preprocess.merge_map import EffmapMerger, merge_effmap_full, merge_effmap_ring_difference
+
+
+class TestMergeEffmap(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = self.tmp_dir.name + '/'
+        os.makedirs(self.path + 'effmap')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def get_scanner(self):
+        return SimpleNamespace(nb_rings=4, gap=0.0, inner_radius=20.0, axial_length=40.0,
+                               block_proto=SimpleNamespace(block_size=[10.0, 10.0, 10.0]))
+
+    def test_ring_difference_equals_full(self):
+        scanner = self.get_scanner()
+        grid, center, size = [4, 4, 8], [0.0, 0.0, 0.0], [20.0, 20.0, 40.0]
+        rng = np.random.RandomState(0)
+        for d in range(scanner.nb_rings):
+            base = np.zeros(grid)
+            base[:, :, 0:2 * (d + 1)] = rng.rand(4, 4, 2 * (d + 1))
+            np.save(self.path + f'effmap/effmap_0_{d}.npy', base)
+            for r in range(scanner.nb_rings - d):
+                shifted = np.roll(base, 2 * r, axis=2)
+                np.save(self.path + f'effmap/effmap_{r}_{r + d}.npy', shifted)
+                np.save(self.path + f'effmap/effmap_{r + d}_{r}.npy', shifted)
+        merge_effmap_full(scanner, grid, center, size, 1, 0.95, self.path)
+        expected = np.load(self.path + 'summap.npy')
+        merge_effmap_ring_difference(scanner, grid, center, size, 0.95, self.path)
+        self.assertFloatArrayEqual(expected, np.load(self.path + 'summap.npy'))
+
+    def test_merger_shifted_sum(self):
+        effmap = np.random.RandomState(1).rand(3, 4, 9)
+        expected = np.zeros([3, 4, 9])
+        for r in range(3):
+            expected[:, :, 2 * r:] += 0.5 * effmap[:, :, :9 - 2 * r]
+        merger = EffmapMerger([3, 4, 9], self.path + 'merged.npy')
+        merger.add(effmap, nb_shifts=3, shift=2, weight=0.5)
+        merger.flush()
+        self.assertFloatArrayEqual(expected, np.load(self.path + 'merged.npy'))
+
+    def test_ring_difference_from_arrays(self):
+        scanner = self.get_scanner()
+        grid, center, size = [4, 4, 8], [0.0, 0.0, 0.0], [20.0, 20.0, 40.0]
+        effmaps = [((0, d), np.random.RandomState(d).rand(*grid)) for d in range(scanner.nb_rings)]
+        for (_, d), effmap in effmaps:
+            np.save(self.path + f'effmap/effmap_0_{d}.npy', effmap)
+        merge_effmap_ring_difference(scanner, grid, center, size, 0.95, self.path)
+        expected = np.load(self.path + 'summap.npy')
+        merge_effmap_ring_difference(scanner, grid, center, size, 0.95, self.path, effmaps=effmaps)
+        self.assertFloatArrayEqual(expected, np.load(self.path + 'summap.npy'))
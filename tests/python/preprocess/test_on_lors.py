@@ -58,10 +58,6 @@ class TestToRLoRs(TestCase):
         ], dtype=np.float32)
         self.assertFloatArrayEqual(result, expected)
 
-    @pytest.mark.skip(reason='NIY')
-    def test_sigma2_factor(self):
-        pass
-
     def test_map_process(self):
         lors = self.get_dummy_lors()
         result = map_process(lors)
@@ -82,3 +78,44 @@ class TestToRLoRs(TestCase):
         self.assertFloatArrayEqual(result[Axis.x][:, 0:6], expected[Axis.x])
         self.assertFloatArrayEqual(result[Axis.y][:, 0:6], expected[Axis.y])
         self.assertFloatArrayEqual(result[Axis.z][:, 0:6], expected[Axis.z])
+
+    def get_random_lors(self, nb_columns):
+        lors = np.random.RandomState(0).randint(-3, 4, [200, nb_columns]).astype(np.float32)
+        lors[:, 6:] = np.random.RandomState(1).rand(200, nb_columns - 6)
+        valid = np.any(lors[:, 0:3] != lors[:, 3:6], 1) & np.any(lors[:, [0, 1, 3, 4]] != 0, 1)
+        return lors[valid]
+
+    def test_partition_by_axis(self):
+        for nb_columns in (7, 8):
+            lors = self.get_random_lors(nb_columns)
+            result = partition_by_axis(lors)
+            for a in Axis:
+                self.assertFloatArrayEqual(result[a], func_on(a)(lors))
+
+    def test_recon_process(self):
+        lors = self.get_random_lors(7)
+        lors[:, 0:6] *= 100.0
+        result = recon_process(lors, 1.0e4)
+        lors = compute_sigma2_factor_and_append(lors)
+        for a, columns in [(Axis.x, [1, 2, 0, 4, 5, 3, 7, 8, 6]),
+                           (Axis.y, [0, 2, 1, 3, 5, 4, 6, 8, 7]),
+                           (Axis.z, list(range(9)))]:
+            expected = CutLoRs(1.0e4)(func_on(a)(lors))
+            expected[:, 0:9] = expected[:, columns]
+            self.assertEqual(result[a].dtype, np.float32)
+            np.testing.assert_allclose(result[a], expected, rtol=1e-5, atol=1e-4)
+
+    def test_cut_lors(self):
+        lors = np.array([[-10.0, 0.0, 0.0, 10.0, 0.0, 0.0, 2.0, 0.0, 0.0, 0.5]], dtype=np.float32)
+        tof_res = 3.0 * 2.35482005 / 0.45
+        result = cut_lors(lors, tof_res)
+        expected = [[-5.0, 0.0, 0.0, 1.0, 0.0, 0.0, -2.0, 0.0, 0.0, 0.5]]
+        self.assertFloatArrayEqual(result, expected)
+
+    def test_sigma2_factor(self):
+        lors = self.get_random_lors(7).astype(np.float64)
+        p_diff = lors[:, 3:6] - lors[:, 0:3]
+        dsq = p_diff[:, 0] ** 2 + p_diff[:, 1] ** 2
+        rsq = lors[:, 0] ** 2 + lors[:, 3] ** 2 + lors[:, 1] ** 2 + lors[:, 4] ** 2
+        expected = dsq ** 2 / rsq / np.sum(p_diff ** 2, 1) / 2
+        self.assertFloatArrayEqual(sigma2_factor(lors), expected)
@@ -0,0 +1,38 @@
+import numpy as np
+from srf.test import TestCase
+from srf.preprocess.preprocess_sino import (preprocess_sino, preprocess_X, posprocess_X,
+                                            image_to_vector, vector_to_image)
+
+
+class TestPreprocessSino(TestCase):
+    def test_preprocess_sino(self):
+        sino = np.random.rand(3, 4, 5).astype(np.float32)
+        expected = np.zeros([sino.size, 1], dtype=np.float32)
+        a = 0
+        for i in range(3):
+            for j in range(4):
+                for k in range(5):
+                    expected[a] = sino[i, j, k]
+                    a += 1
+        result = preprocess_sino(sino)
+        self.assertEqual(result.shape, (60, 1))
+        self.assertFloatArrayEqual(expected, result)
+        self.assertTrue(np.shares_memory(result, sino))
+
+    def test_preprocess_X(self):
+        image = np.random.rand(3, 4, 5)
+        expected = np.zeros([image.size])
+        for i in range(3):
+            for j in range(4):
+                for k in range(5):
+                    expected[k * 12 + j * 3 + i] = image[i, j, k]
+        self.assertFloatArrayEqual(expected, preprocess_X(image))
+
+    def test_round_trip(self):
+        image = np.random.rand(3, 4, 5)
+        self.assertFloatArrayEqual(image, posprocess_X(preprocess_X(image), [[3, 4, 5]]))
+        self.assertFloatArrayEqual(image, vector_to_image(image_to_vector(image), [3, 4, 5]))
+
+    def test_bad_shape(self):
+        with self.assertRaises(ValueError):
+            vector_to_image(np.zeros([10]), [3, 4, 5])
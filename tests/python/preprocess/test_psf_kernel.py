@@ -0,0 +1,69 @@
+import numpy as np
+from scipy import sparse
+from srf.test import TestCase
+from srf.preprocess.function.generate_psf_kernel import PSFMaker
+
+
+class TestMakeXYKernel(TestCase):
+    def get_samples(self, n, uy):
+        xmesh, ymesh = PSFMaker.make_meshgrid([n, n], [1.0, 1.0])
+        samples = np.stack([np.exp(-(xmesh - 0.9 * k) ** 2 / (2 * 1.1 ** 2) - (ymesh - uy) ** 2 / (2 * 0.8 ** 2))
+                            for k in range(8)], axis=2)
+        return xmesh, ymesh, 0.9 * 7, samples
+
+    def make_xy_kernel_by_pixel(self, xmesh, ymesh, n, x_range, samples, epsilon=1e-4):
+        rmesh, pmesh = PSFMaker.make_polargrid(xmesh, ymesh)
+        kernel_max = PSFMaker.find_xy_kernel_max_sum(samples)
+        result = np.zeros([n * n, n * n])
+        for i in range(n):
+            for j in range(n):
+                kernel = PSFMaker.locate_kernel(samples, x_range, rmesh[i, j])
+                kernel = PSFMaker.rotate_kernel(kernel, pmesh[i, j]) / kernel_max
+                kernel[kernel < epsilon] = 0.0
+                result[j + i * n] = kernel.ravel()
+        return result
+
+    def to_dense(self, kernel, n):
+        return sparse.coo_matrix((kernel[2], (kernel[0].astype(int), kernel[1].astype(int))),
+                                 shape=(n * n, n * n)).toarray()
+
+    def test_make_xy_kernel(self):
+        for n, uy in [(12, 0.0), (12, 0.7), (11, 0.0)]:
+            xmesh, ymesh, x_range, samples = self.get_samples(n, uy)
+            expected = self.make_xy_kernel_by_pixel(xmesh, ymesh, n, x_range, samples)
+            result = PSFMaker.make_xy_kernel(xmesh, ymesh, [n, n], x_range, samples)
+            self.assertFloatArrayEqual(expected, self.to_dense(result, n))
+
+    def test_make_xy_kernel_pool(self):
+        xmesh, ymesh, x_range, samples = self.get_samples(12, 0.0)
+        expected = PSFMaker.make_xy_kernel(xmesh, ymesh, [12, 12], x_range, samples, angle_step=2.0)
+        result = PSFMaker.make_xy_kernel(xmesh, ymesh, [12, 12], x_range, samples, angle_step=2.0,
+                                         nb_workers=2)
+        self.assertFloatArrayEqual(expected, result)
+
+    def test_make_xy_kernel_out_of_domain(self):
+        xmesh, ymesh, _, samples = self.get_samples(12, 0.0)
+        result = PSFMaker.make_xy_kernel(xmesh, ymesh, [12, 12], 1e-3, samples)
+        self.assertEqual(result.shape, (3, 0))
+
+
+class TestComputeSampleKernels(TestCase):
+    def test_compute_sample_kernels(self):
+        xmesh, ymesh = PSFMaker.make_meshgrid([6, 5], [1.0, 1.5])
+        kernel_array = np.random.rand(7, 5) + 0.5
+        expected = np.zeros([6, 5, 7])
+        for k, (a, ux, sigx, uy, sigy) in enumerate(kernel_array):
+            expected[:, :, k] = a * np.exp(-(xmesh - ux) ** 2 / (2 * sigx ** 2) - (ymesh - uy) ** 2 / (2 * sigy ** 2))
+        for chunk_size in [None, 3]:
+            result = PSFMaker.compute_sample_kernels(kernel_array, xmesh, ymesh, chunk_size)
+            self.assertEqual(result.dtype, np.float32)
+            self.assertFloatArrayEqual(expected, result)
+
+    def test_compute_z_sample_kernels(self):
+        zmesh = np.linspace(-5.0, 5.0, 11)
+        kernel_samples = np.random.rand(11, 3) + 0.5
+        expected = np.zeros([11, 11])
+        for k, (az, uz, sigz) in enumerate(kernel_samples):
+            expected[:, k] = az * np.exp(-(zmesh - uz) ** 2 / (2 * sigz ** 2))
+        expected /= np.max(np.sum(expected, axis=0))
+        self.assertFloatArrayEqual(expected, PSFMaker.compute_z_sample_kernels(kernel_samples, 11, zmesh))
@@ -0,0 +1,45 @@
+import numpy as np
+from srf.test import TestCase
+
+from srf.data.sinogram_binning import nb_crystals, crystal_index, listmode_to_sinogram
+from srf.scanner.pet import Block, CylindricalPET, RingGeometry
+
+
+class TestSinogramBinning(TestCase):
+    def get_scanner(self):
+        ring = RingGeometry({"inner_radius": 99.0, "outer_radius": 119.0, "axial_length": 68.8,
+                             "nb_rings": 2, "nb_blocks_per_ring": 16, "gap": 2.0})
+        return CylindricalPET('sino', ring, Block([20.0, 33.4, 33.4], [1, 10, 10]), None)
+
+    def get_crystals(self, scanner):
+        """ crystal centers in the order of the siddon_sino op. """
+        grid, size = scanner.block_proto.grid, scanner.block_proto.block_size
+        ir, ib, igz, igy = np.meshgrid(*[np.arange(n) for n in (scanner.nb_rings, scanner.nb_blocks_per_ring,
+                                                               grid[2], grid[1])], indexing='ij')
+        x = (scanner.inner_radius + scanner.outer_radius) / 2
+        y = (igy + 0.5) * size[1] / grid[1] - size[1] / 2
+        z = ((igz + 0.5) * size[2] / grid[2] - size[2] / 2
+             + (ir - (scanner.nb_rings - 1) / 2) * (size[2] + scanner.gap))
+        theta = ib * 2 * np.pi / scanner.nb_blocks_per_ring
+        return np.stack([x * np.cos(theta) - y * np.sin(theta),
+                         x * np.sin(theta) + y * np.cos(theta), z], -1).reshape(-1, 3)
+
+    def test_crystal_index(self):
+        scanner = self.get_scanner()
+        crystals = self.get_crystals(scanner)
+        self.assertEqual(nb_crystals(scanner), crystals.shape[0])
+        self.assertFloatArrayEqual(crystal_index(scanner, crystals), np.arange(crystals.shape[0]))
+
+    def test_listmode_to_sinogram(self):
+        scanner = self.get_scanner()
+        crystals = self.get_crystals(scanner)
+        rng = np.random.RandomState(0)
+        i, j = rng.randint(0, crystals.shape[0], [2, 1000])
+        lors = np.hstack([crystals[i], crystals[j]])
+        expected = np.zeros([crystals.shape[0]] * 2, dtype=np.int64)
+        np.add.at(expected, (i, j), 1)
+        np.add.at(expected, (j, i), 1)
+        self.assertFloatArrayEqual(listmode_to_sinogram(scanner, lors), expected)
+        self.assertFloatArrayEqual(listmode_to_sinogram(scanner, lors, sparse=True).toarray(), expected)
+        weights = rng.rand(1000)
+        self.assertFloatArrayEqual(listmode_to_sinogram(scanner, lors, weights).sum(), 2 * weights.sum())
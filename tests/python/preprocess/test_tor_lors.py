@@ -0,0 +1,85 @@
+import os
+import tempfile
+
+import h5py
+import numpy as np
+from srf.test import TestCase
+
+from srf.preprocess.function.on_tor_lors import Axis, recon_process
+from srf.preprocess.tor_lors import preprocess_tor_h5, load_tor_h5, is_tor_h5, ToRLoRsCache
+
+
+class TestPreprocessToRH5(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.RandomState(0)
+        angle = rng.rand(2, 100) * 2 * np.pi
+        z = rng.rand(2, 100) * 20.0 - 10.0
+        self.events = {'fst': np.stack([100 * np.cos(angle[0]), 100 * np.sin(angle[0]), z[0]], 1),
+                       'snd': np.stack([100 * np.cos(angle[1]), 100 * np.sin(angle[1]), z[1]], 1),
+                       'tof': rng.rand(100) * 10.0 - 5.0}
+        self.source = os.path.join(self.tmp_dir.name, 'listmode.h5')
+        with h5py.File(self.source, 'w') as fout:
+            group = fout.create_group('listmode_data')
+            for k, v in self.events.items():
+                group.create_dataset(k, data=v)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def sort_rows(self, lors):
+        return lors[np.lexsort(lors.T[::-1])]
+
+    def test_preprocess_tor_h5(self):
+        target = os.path.join(self.tmp_dir.name, 'tor.h5')
+        counts = preprocess_tor_h5(self.source, target, 300.0, chunk_size=17)
+        lors = np.hstack([self.events['fst'], self.events['snd'], self.events['tof'][:, None]])
+        expected = recon_process(lors, 300.0)
+        self.assertTrue(is_tor_h5(target))
+        self.assertFalse(is_tor_h5(self.source))
+        result = load_tor_h5(target, 300.0)
+        for a in Axis:
+            self.assertEqual(counts[a.name], expected[a].shape[0])
+            self.assertFloatArrayEqual(self.sort_rows(result[a.name]),
+                                       self.sort_rows(expected[a].astype(np.float32)))
+
+    def test_tof_res_mismatch(self):
+        target = os.path.join(self.tmp_dir.name, 'tor.h5')
+        preprocess_tor_h5(self.source, target, 300.0)
+        with self.assertRaises(ValueError):
+            load_tor_h5(target, 500.0)
+
+
+class TestToRLoRsCache(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp_dir.name, 'lors.npy')
+        np.save(self.source, np.zeros([3, 7]))
+        self.nb_calls = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make(self):
+        self.nb_calls += 1
+        return {a.name: np.full([a.value + 1, 10], a.value) for a in Axis}
+
+    def test_get(self):
+        cache = ToRLoRsCache(os.path.join(self.tmp_dir.name, 'cache'))
+        cache.get(self.source, 300.0, ['npy'], self.make)
+        result = cache.get(self.source, 300.0, ['npy'], self.make)
+        self.assertEqual(self.nb_calls, 1)
+        self.assertIsInstance(result['x'], np.memmap)
+        for a in Axis:
+            self.assertFloatArrayEqual(result[a.name], np.full([a.value + 1, 10], a.value))
+
+    def test_key(self):
+        cache = ToRLoRsCache(self.tmp_dir.name)
+        key = cache.key(self.source, 300.0, ['npy'])
+        self.assertEqual(key, cache.key(self.source, 300.0, ['npy']))
+        self.assertNotEqual(key, cache.key(self.source, 500.0, ['npy']))
+        self.assertNotEqual(key, cache.key(self.source, 300.0, ['fst', 'snd', 'tof']))
+        np.save(self.source, np.zeros([4, 7]))
+        self.assertNotEqual(key, cache.key(self.source, 300.0, ['npy']))
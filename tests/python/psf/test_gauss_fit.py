@@ -0,0 +1,73 @@
+import numpy as np
+from srf.test import TestCase
+from srf.psf.gaussFunction import (gaussian1d, gaussFit1d_solver, gaussFit2d_solver,
+                                   gaussFit_batch, fit_xy_kernels, fit_z_kernels)
+
+
+def make_images(a, ux, uy, sx, sy, grid):
+    x, y = np.meshgrid(np.arange(grid[0]), np.arange(grid[1]), indexing='ij')
+    return np.stack([a[i] * np.exp(-(x - ux[i]) ** 2 / (2 * sx[i] ** 2) - (y - uy[i]) ** 2 / (2 * sy[i] ** 2))
+                     for i in range(len(a))])
+
+
+class TestGaussFitSolver(TestCase):
+    def test_1d(self):
+        x = 0.01 * (np.arange(201) - 101)
+        a, sigma = gaussFit1d_solver(x, gaussian1d(x, 1.0, 1.0))
+        self.assertAlmostEqual(a, 1.0, places=4)
+        self.assertAlmostEqual(sigma, 1.0, places=4)
+
+    def test_2d(self):
+        x, y = np.meshgrid(0.05 * (np.arange(41) - 20), 0.05 * (np.arange(41) - 20))
+        a, sigma = gaussFit2d_solver((x.ravel(), y.ravel()), 2.0 * np.exp(-(x ** 2 + y ** 2).ravel() / 2))
+        self.assertAlmostEqual(a, 2.0, places=4)
+        self.assertAlmostEqual(sigma, 1.0, places=4)
+
+
+class TestGaussFitBatch(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.nb_sources = 20
+        self.a = rng.uniform(0.5, 2.0, self.nb_sources)
+        self.ux = rng.uniform(10.0, 20.0, self.nb_sources)
+        self.uy = rng.uniform(12.0, 18.0, self.nb_sources)
+        self.sx = rng.uniform(1.0, 3.0, self.nb_sources)
+        self.sy = rng.uniform(1.0, 3.0, self.nb_sources)
+        self.images = make_images(self.a, self.ux, self.uy, self.sx, self.sy, [31, 29])
+
+    def test_closed_form(self):
+        a, u, sigma = gaussFit_batch(self.images)
+        self.assertFloatArrayEqual(self.a, a)
+        self.assertFloatArrayEqual(np.stack([self.ux, self.uy], axis=1), u)
+        self.assertFloatArrayEqual(np.stack([self.sx, self.sy], axis=1), sigma)
+
+    def test_xy_table(self):
+        table = fit_xy_kernels(self.images)
+        self.assertEqual(sorted(table), ['axy', 'sigmax', 'sigmay', 'ux', 'uy'])
+        self.assertFloatArrayEqual(self.ux, table['ux'])
+        self.assertFloatArrayEqual(self.sy, table['sigmay'])
+
+    def test_z_table(self):
+        z = np.arange(40)
+        profiles = self.a[:, None] * np.exp(-(z - 2 * self.ux[:, None]) ** 2 / (2 * self.sx[:, None] ** 2))
+        table = fit_z_kernels(profiles)
+        self.assertFloatArrayEqual(self.a, table['az'])
+        self.assertFloatArrayEqual(2 * self.ux, table['uz'])
+        self.assertFloatArrayEqual(self.sx, table['sigmaz'])
+
+    def test_refine(self):
+        rng = np.random.RandomState(1)
+        images = self.images + rng.normal(0.0, 1e-3, self.images.shape)
+        a0, u0, sigma0 = gaussFit_batch(images, weighted=False)
+        a, u, sigma = gaussFit_batch(images, weighted=False, refine=True, nb_workers=2)
+        sigma_true = np.stack([self.sx, self.sy], axis=1)
+        self.assertLess(np.max(np.abs(sigma - sigma_true)), np.max(np.abs(sigma0 - sigma_true)))
+        np.testing.assert_allclose(sigma, sigma_true, rtol=1e-2)
+
+    def test_not_gaussian(self):
+        a, u, sigma = gaussFit_batch(np.ones([1, 10]))
+        self.assertTrue(np.all(np.isnan(sigma)))
+
+    def test_invalid_shape(self):
+        with self.assertRaises(ValueError):
+            gaussFit_batch(np.ones([2, 3, 3, 3]))
@@ -0,0 +1,60 @@
+import os
+import tempfile
+
+import numpy as np
+from scipy import sparse
+from srf.test import TestCase
+from srf.io.psf import save_psf_xy, load_psf_xy, load_psf_header, load_psf
+
+
+class TestPSFArtifact(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'psf_xy.npz')
+        self.matrix = sparse.random(20, 20, density=0.2, format='coo', dtype=np.float32,
+                                    random_state=np.random.RandomState(0))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        save_psf_xy(self.path, self.matrix, [5, 4, 3], [1.0, 2.0, 3.0])
+        result = load_psf_xy(self.path)
+        self.assertTrue(sparse.isspmatrix_csr(result))
+        self.assertFloatArrayEqual(self.matrix.toarray(), result.toarray())
+        # scipy keeps a view of the memory-mapped member
+        self.assertFalse(result.data.flags.owndata)
+
+    def test_header(self):
+        save_psf_xy(self.path, self.matrix, [5, 4, 3], [1.0, 2.0, 3.0], format='csc')
+        header = load_psf_header(self.path)
+        self.assertEqual(header['format'], 'csc')
+        self.assertEqual(header['shape'], (20, 20))
+        self.assertEqual(header['grid'], [5, 4])
+        self.assertEqual(header['voxel_size'], [1.0, 2.0])
+
+    def test_transpose_is_view(self):
+        save_psf_xy(self.path, self.matrix, [5, 4], [1.0, 1.0])
+        result = load_psf_xy(self.path)
+        transposed = result.T
+        self.assertTrue(sparse.isspmatrix_csc(transposed))
+        self.assertTrue(np.shares_memory(transposed.data, result.data))
+        self.assertFloatArrayEqual(self.matrix.toarray().T, transposed.toarray())
+
+    def test_suffix_kept(self):
+        path = os.path.join(self.tmp.name, 'psf_xy.bin')
+        save_psf_xy(path, self.matrix, [5, 4], [1.0, 1.0])
+        self.assertTrue(os.path.exists(path))
+        self.assertFloatArrayEqual(self.matrix.toarray(), load_psf_xy(path, mmap_mode=None).toarray())
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            save_psf_xy(self.path, self.matrix, [5, 4], [1.0, 1.0], format='coo')
+
+    def test_load_psf(self):
+        z_path = os.path.join(self.tmp.name, 'psf_z.npy')
+        np.save(z_path, np.eye(3))
+        save_psf_xy(self.path, self.matrix, [5, 4], [1.0, 1.0])
+        psf_xy, psf_z = load_psf(self.path, z_path)
+        self.assertFloatArrayEqual(self.matrix.toarray(), psf_xy.toarray())
+        self.assertEqual(psf_z.dtype, np.float32)
@@ -1,3 +1,5 @@
+import itertools
+
 import pytest
 import numpy as np
 from srf.test import TestCase
@@ -102,5 +104,45 @@ class TestCylindricalPET(ScannerTestBase):
     @pytest.mark.skip(reason= "NIY")
     def test_make_ring_pet_lors(self):
         pass
+
+    def get_small_scanner(self):
+        ring = RingGeometry({"inner_radius": 20.0, "outer_radius": 24.0, "axial_length": 12.0,
+                             "nb_rings": 3, "nb_blocks_per_ring": 6, "gap": 0.0})
+        block = Block(block_size=[4.0, 4.0, 4.0], grid=[1, 2, 2])
+        return CylindricalPET('small', ring, block, TOF(res=530, bin=40))
+
+    def test_crystal_table(self):
+        scanner = self.get_small_scanner()
+        table = scanner.crystal_table
+        self.assertEqual(table.shape, (3, 6, 4, 3))
+        for ir, ring in enumerate(scanner.rings):
+            for ib, block in enumerate(ring):
+                self.assertFloatArrayEqual(block.get_meshes(), table[ir, ib])
+
+    def test_make_lors(self):
+        scanner = self.get_small_scanner()
+        for ir1, ir2 in [(0, 0), (0, 2), (2, 1)]:
+            ring1, ring2 = scanner.rings[ir1], scanner.rings[ir2]
+            expect_lors = np.array([list(itertools.product(bp.block1.get_meshes(), bp.block2.get_meshes()))
+                                    for bp in scanner.make_block_pairs(ring1, ring2)]).reshape(-1, 6)
+            self.assertFloatArrayEqual(scanner.make_lors(ir1, ir2), expect_lors)
+            self.assertFloatArrayEqual(scanner.make_ring_pairs_lors(ring1, ring2), expect_lors)
+
+    def test_lor_chunks(self):
+        scanner = self.get_small_scanner()
+        ring_pairs = [(0, 0), (1, 2)]
+        chunks = scanner.lor_chunks(ring_pairs, chunk_size=100)
+        expect_lors = np.vstack([scanner.make_lors(ir1, ir2) for ir1, ir2 in ring_pairs])
+        self.assertEqual(chunks.nb_lors, expect_lors.shape[0])
+        self.assertEqual(len(chunks), -(-expect_lors.shape[0] // 100))
+        result = list(chunks)
+        self.assertTrue(all(c.shape[0] == 100 for c in result[:-1]))
+        self.assertFloatArrayEqual(np.vstack(result), expect_lors)
+
+    def test_lor_chunks_of_block_pairs(self):
+        scanner = self.get_small_scanner()
+        block_pairs = [[0, 3], [2, 5]]
+        chunks = scanner.lor_chunks([(0, 1)], block_pairs, chunk_size=7)
+        self.assertFloatArrayEqual(np.vstack(list(chunks)), scanner.make_lors(0, 1, block_pairs))
 class TestMultiPatchPET(ScannerTestBase):
     pass